@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+# 
+# Loifrançaise – Bibliothèque de manipulation de la loi française
+# – ce module analyse les fichiers XML des textes d’une base (version, struct
+#   et section_ta), avec lxml s’il est installé, sinon avec BeautifulSoup
+# 
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# the LICENSE file for more details.
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from bs4 import BeautifulSoup
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+from loifrancaise.utilitaires import normalise_date
+
+
+# Lien d’une structure (LIEN_SECTION_TA, LIEN_ART, VERSION, LIEN_TXT) : ses
+# attributs XML, lus comme un dictionnaire, et son texte dans .text
+class Lien(dict):
+    
+    def __init__(self, attributs=(), text=''):
+        dict.__init__(self, attributs)
+        self.text = text
+
+
+# Analyser le contenu d’un fichier texte/version/[cid].xml
+# (avec lxml s’il est installé, sinon avec BeautifulSoup)
+def analyser_version(contenu):
+    
+    if etree is None:
+        return analyser_version_bs4(contenu)
+    
+    # Initialiser le dictionnaire résultat
+    version = dict()
+    
+    # Analyser le XML
+    racine = etree.fromstring(contenu)
+    
+    # Lecture des éléments englobants
+    META = trouver(racine, 'META')
+    META_COMMUN = trouver(META, 'META_COMMUN')
+    META_SPEC = trouver(META, 'META_SPEC')
+    META_TEXTE_CHRONICLE = trouver(META_SPEC, 'META_TEXTE_CHRONICLE')
+    META_TEXTE_VERSION = trouver(META_SPEC, 'META_TEXTE_VERSION')
+    
+    # Lecture des éléments feuille
+    version['NATURE'] = texte(trouver(META_COMMUN, 'NATURE'))
+    version['CID'] = texte(trouver(META_TEXTE_CHRONICLE, 'CID'))
+    version['NOR'] = texte(trouver(META_TEXTE_CHRONICLE, 'NOR'))
+    version['DATE_TEXTE'] = texte(trouver(META_TEXTE_CHRONICLE, 'DATE_TEXTE'))
+    version['DATE_PUBLI'] = texte(trouver(META_TEXTE_CHRONICLE, 'DATE_PUBLI'))
+    version['DERNIERE_MODIFICATION'] = \
+        texte(trouver(META_TEXTE_CHRONICLE, 'DERNIERE_MODIFICATION'))
+    version['TITRE'] = texte(trouver(META_TEXTE_VERSION, 'TITRE'))
+    version['TITREFULL'] = texte(trouver(META_TEXTE_VERSION, 'TITREFULL'))
+    version['DATE_DEBUT'] = texte(trouver(META_TEXTE_VERSION, 'DATE_DEBUT'))
+    version['DATE_FIN'] = texte(trouver(META_TEXTE_VERSION, 'DATE_FIN'))
+    version['ETAT'] = texte(trouver(META_TEXTE_VERSION, 'ETAT'))
+    
+    # Normalisations
+    version['DATE_TEXTE'] = normalise_date(version['DATE_TEXTE'])
+    version['DATE_PUBLI'] = normalise_date(version['DATE_PUBLI'])
+    version['DATE_DEBUT'] = normalise_date(version['DATE_DEBUT'])
+    version['DATE_FIN'] = normalise_date(version['DATE_FIN'])
+    
+    return version
+
+
+# Analyser le contenu d’un fichier texte/version/[cid].xml avec BeautifulSoup
+def analyser_version_bs4(contenu):
+    
+    # Initialiser le dictionnaire résultat
+    version = dict()
+    
+    # Analyser le XML
+    soup = BeautifulSoup(contenu, 'xml')
+    
+    # Lecture des éléments englobants
+    META = soup.find('META')
+    META_COMMUN = META.find('META_COMMUN')
+    META_SPEC = META.find('META_SPEC')
+    META_TEXTE_CHRONICLE = META_SPEC.find('META_TEXTE_CHRONICLE')
+    META_TEXTE_VERSION = META_SPEC.find('META_TEXTE_VERSION')
+    
+    # Lecture des éléments feuille
+    version['NATURE'] = META_COMMUN.find('NATURE').text
+    version['CID'] = META_TEXTE_CHRONICLE.find('CID').text
+    version['NOR'] = META_TEXTE_CHRONICLE.find('NOR').text
+    version['DATE_TEXTE'] = META_TEXTE_CHRONICLE.find('DATE_TEXTE').text
+    version['DATE_PUBLI'] = META_TEXTE_CHRONICLE.find('DATE_PUBLI').text
+    version['DERNIERE_MODIFICATION'] = \
+        META_TEXTE_CHRONICLE.find('DERNIERE_MODIFICATION').text
+    version['TITRE'] = META_TEXTE_VERSION.find('TITRE').text
+    version['TITREFULL'] = META_TEXTE_VERSION.find('TITREFULL').text
+    version['DATE_DEBUT'] = META_TEXTE_VERSION.find('DATE_DEBUT').text
+    version['DATE_FIN'] = META_TEXTE_VERSION.find('DATE_FIN').text
+    version['ETAT'] = META_TEXTE_VERSION.find('ETAT').text
+    
+    # Normalisations
+    version['DATE_TEXTE'] = normalise_date(version['DATE_TEXTE'])
+    version['DATE_PUBLI'] = normalise_date(version['DATE_PUBLI'])
+    version['DATE_DEBUT'] = normalise_date(version['DATE_DEBUT'])
+    version['DATE_FIN'] = normalise_date(version['DATE_FIN'])
+    
+    return version
+
+
+# Analyser le contenu d’un fichier texte/struct/[cid].xml
+# (avec lxml s’il est installé, sinon avec BeautifulSoup)
+def analyser_struct(contenu):
+    
+    if etree is None:
+        return analyser_struct_bs4(contenu)
+    
+    # Initialiser le dictionnaire résultat
+    struct = dict()
+    
+    # Analyser le XML
+    racine = etree.fromstring(contenu)
+    
+    # Lecture des éléments englobants
+    META = trouver(racine, 'META')
+    META_COMMUN = trouver(META, 'META_COMMUN')
+    META_SPEC = trouver(META, 'META_SPEC')
+    META_TEXTE_CHRONICLE = trouver(META_SPEC, 'META_TEXTE_CHRONICLE')
+    VERSIONS = trouver(racine, 'VERSIONS')
+    STRUCT = trouver(racine, 'STRUCT')
+    
+    # Lecture des éléments feuille
+    struct['NATURE'] = texte(trouver(META_COMMUN, 'NATURE'))
+    struct['CID'] = texte(trouver(META_TEXTE_CHRONICLE, 'CID'))
+    struct['NOR'] = texte(trouver(META_TEXTE_CHRONICLE, 'NOR'))
+    struct['DATE_TEXTE'] = texte(trouver(META_TEXTE_CHRONICLE, 'DATE_TEXTE'))
+    struct['DATE_PUBLI'] = texte(trouver(META_TEXTE_CHRONICLE, 'DATE_PUBLI'))
+    struct['VERSION'] = liens(VERSIONS, 'VERSION')
+    struct['VERSION_etat'] = struct['VERSION'][0]['etat']
+    struct['LIEN_TXT'] = lien(trouver(trouver(VERSIONS, 'VERSION'), 'LIEN_TXT'))
+    struct['LIEN_TXT_id'] = struct['LIEN_TXT']['id']
+    struct['LIEN_TXT_debut'] = struct['LIEN_TXT']['debut']
+    struct['LIEN_TXT_fin'] = struct['LIEN_TXT']['fin']
+    struct['LIEN_ART'] = liens(STRUCT, 'LIEN_ART')
+    struct['LIEN_SECTION_TA'] = liens(STRUCT, 'LIEN_SECTION_TA')
+    
+    # Normalisations
+    struct['DATE_TEXTE'] = normalise_date(struct['DATE_TEXTE'])
+    struct['DATE_PUBLI'] = normalise_date(struct['DATE_PUBLI'])
+    
+    return struct
+
+
+# Analyser le contenu d’un fichier texte/struct/[cid].xml avec BeautifulSoup
+def analyser_struct_bs4(contenu):
+    
+    # Initialiser le dictionnaire résultat
+    struct = dict()
+    
+    # Analyser le XML
+    soup = BeautifulSoup(contenu, 'xml')
+    
+    # Lecture des éléments englobants
+    META = soup.find('META')
+    META_COMMUN = META.find('META_COMMUN')
+    META_SPEC = META.find('META_SPEC')
+    META_TEXTE_CHRONICLE = META_SPEC.find('META_TEXTE_CHRONICLE')
+    META_TEXTE_VERSION = META_SPEC.find('META_TEXTE_VERSION')
+    VERSIONS = soup.find('VERSIONS')
+    STRUCT = soup.find('STRUCT')
+
+    # Lecture des éléments feuille
+    struct['NATURE'] = META_COMMUN.find('NATURE').text
+    struct['CID'] = META_TEXTE_CHRONICLE.find('CID').text
+    struct['NOR'] = META_TEXTE_CHRONICLE.find('NOR').text
+    struct['DATE_TEXTE'] = META_TEXTE_CHRONICLE.find('DATE_TEXTE').text
+    struct['DATE_PUBLI'] = META_TEXTE_CHRONICLE.find('DATE_PUBLI').text
+    struct['VERSION'] = [lien_bs4(version) \
+                         for version in VERSIONS.find_all('VERSION')]
+    struct['VERSION_etat'] = struct['VERSION'][0]['etat']
+    struct['LIEN_TXT'] = lien_bs4(VERSIONS.find('VERSION').find('LIEN_TXT'))
+    struct['LIEN_TXT_id'] = struct['LIEN_TXT']['id']
+    struct['LIEN_TXT_debut'] = struct['LIEN_TXT']['debut']
+    struct['LIEN_TXT_fin'] = struct['LIEN_TXT']['fin']
+    struct['LIEN_ART'] = [lien_bs4(lien) for lien in STRUCT.find_all('LIEN_ART')]
+    struct['LIEN_SECTION_TA'] = [lien_bs4(lien) \
+                                 for lien in STRUCT.find_all('LIEN_SECTION_TA')]
+    
+    # Normalisations
+    struct['DATE_TEXTE'] = normalise_date(struct['DATE_TEXTE'])
+    struct['DATE_PUBLI'] = normalise_date(struct['DATE_PUBLI'])
+    
+    return struct
+
+
+# Analyser le contenu d’un fichier section_ta/[chemin_id]
+# (avec lxml s’il est installé, sinon avec BeautifulSoup)
+def analyser_section_ta(contenu):
+    
+    if etree is None:
+        return analyser_section_ta_bs4(contenu)
+    
+    # Initialiser le dictionnaire résultat
+    section_ta = dict()
+    
+    # Analyser le XML
+    racine = etree.fromstring(contenu)
+    
+    # Lecture des éléments englobants
+    STRUCTURE_TA = trouver(racine, 'STRUCTURE_TA')
+    
+    # Lecture des éléments feuille
+    section_ta['LIEN_SECTION_TA'] = liens(STRUCTURE_TA, 'LIEN_SECTION_TA')
+    section_ta['LIEN_ART'] = liens(STRUCTURE_TA, 'LIEN_ART')
+    
+    return section_ta
+
+
+# Analyser le contenu d’un fichier section_ta/[chemin_id] avec BeautifulSoup
+def analyser_section_ta_bs4(contenu):
+    
+    # Initialiser le dictionnaire résultat
+    section_ta = dict()
+    
+    # Analyser le XML
+    soup = BeautifulSoup(contenu, 'xml')
+    
+    # Lecture des éléments englobants
+    STRUCTURE_TA = soup.find('STRUCTURE_TA')
+    
+    # Lecture des éléments feuille
+    section_ta['LIEN_SECTION_TA'] = [lien_bs4(lien) for lien \
+                                     in STRUCTURE_TA.find_all('LIEN_SECTION_TA')]
+    section_ta['LIEN_ART'] = [lien_bs4(lien) \
+                              for lien in STRUCTURE_TA.find_all('LIEN_ART')]
+    
+    return section_ta
+
+
+# Premier élément descendant d’un nom donné, dans l’ordre du document (comme
+# BeautifulSoup.find), ou None
+def trouver(element, nom):
+    
+    return element.find('.//' + nom)
+
+
+# Texte d’un élément, descendants compris (comme BeautifulSoup .text)
+def texte(element):
+    
+    if len(element) == 0:
+        return element.text or ''
+    
+    return ''.join(element.itertext())
+
+
+# Lien créé depuis un élément lxml
+def lien(element):
+    
+    return Lien(element.attrib, texte(element))
+
+
+# Liens descendants d’un nom donné, dans l’ordre du document (comme
+# BeautifulSoup.find_all)
+def liens(element, nom):
+    
+    return [lien(descendant) for descendant in element.iter(nom) \
+            if descendant is not element]
+
+
+# Lien créé depuis un élément BeautifulSoup
+def lien_bs4(element):
+    
+    return Lien(element.attrs, element.text)
@@ -0,0 +1,685 @@
+# -*- coding: utf-8 -*-
+# 
+# Loifrançaise – Bibliothèque de manipulation de la loi française
+# – ce module lit les archives TAR gzippées des livraisons
+# 
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# the LICENSE file for more details.
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import re
+import gzip
+import json
+import sqlite3
+import hashlib
+import tarfile
+import threading
+import contextlib
+import multiprocessing
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from loifrancaise import logger
+from loifrancaise import FichierNonExistantException
+
+
+
+#
+# Constantes
+#
+
+# Dans les dumps incrémentaux, les fichiers sont rangés dans un répertoire
+# nommé de la date de la livraison
+prefixe_majo = re.compile(r'^\d{8}-\d{6}(/|$)')
+
+# Nom des listes de suppression, une fois retiré le répertoire de date
+motif_liste_suppression = re.compile(r'^liste_suppression_[a-z]+\.dat$')
+
+# Identifiant d’un texte (cidTexte), seul ou comme répertoire dans un chemin
+motif_cid = re.compile(r'^[A-Z]{4}TEXT\d{12}$')
+motif_cid_chemin = re.compile(r'/([A-Z]{4}TEXT\d{12})(?=/|$)')
+
+# Index d’accès direct enregistrés à côté de chaque archive : table des
+# membres (position et taille dans le TAR décompressé, chemins supprimés)
+# et, si le module indexed_gzip est disponible, points de reprise de la
+# décompression gzip
+suffixe_index = '.index.sqlite'
+suffixe_points_reprise = '.zran'
+
+# Écart en octets décompressés entre deux points de reprise ; chaque point
+# garde une fenêtre de 32 Kio
+espacement_points_reprise = 4 * 1024 * 1024
+
+# Copies transcodées des archives (module zstandard) : trames zstd
+# indépendantes, décodables en parallèle, de taille_trame octets décompressés
+# chacune ; leurs positions sont données par une table enregistrée à côté
+suffixe_table_trames = '.trames.json'
+taille_trame = 8 * 1024 * 1024
+niveau_zstd = 3
+
+# Archives lues sans accès direct (ni copie transcodée, ni points de reprise),
+# signalées une seule fois chacune
+archives_sans_acces_direct = set()
+
+
+
+#
+# Fonctions
+#
+
+# Nom d’un membre d’archive relatif au dossier d’installation de la base
+# 
+# @param str nom nom du membre dans l’archive
+# @return str nom sans l’éventuel répertoire de date des dumps incrémentaux
+def nom_membre(nom):
+    
+    return prefixe_majo.sub('', nom, 1)
+
+
+# Itérer sur les membres d’une archive en les renommant relativement au
+# dossier d’installation de la base
+# 
+# @param tarfile.TarFile tar archive ouverte
+# @return generator[tarfile.TarInfo] membres renommés
+def membres_archive(tar):
+    
+    for membre in tar:
+        membre.name = nom_membre(membre.name)
+        if membre.islnk():
+            membre.linkname = nom_membre(membre.linkname)
+        if membre.name:
+            yield membre
+
+
+# Ouvrir une archive pour la lire séquentiellement
+# 
+# La copie transcodée est préférée si elle existe et que le module zstandard
+# est disponible : ses trames sont décodées en parallèle (voir LecteurTrames).
+# 
+# @param str chemin_archive archive TAR gzippée
+# @param int|None fils nombre de fils d’exécution décodant les trames
+#                      (None : nombre de processeurs)
+# @return contextmanager[tarfile.TarFile] archive ouverte en mode flux, fermée
+#                                         à la sortie du bloc with
+# @raise IOError, tarfile.TarError
+@contextlib.contextmanager
+def ouvrir_archive(chemin_archive, fils=None):
+    
+    lecteur = None
+    transcodee = copie_transcodee(chemin_archive)
+    if transcodee:
+        lecteur = LecteurTrames(transcodee, fils)
+        tar = tarfile.open(fileobj=lecteur, mode='r|')
+    else:
+        tar = tarfile.open(chemin_archive, 'r|*')
+    try:
+        yield tar
+    finally:
+        tar.close()
+        if lecteur:
+            lecteur.close()
+
+
+# Nom de la copie transcodée d’une archive
+# 
+# @param str nom chemin de l’archive ou format de nom (cf nom_base, nom_majo)
+# @return str nom avec l’extension .zst au lieu de .gz
+def nom_transcode(nom):
+    
+    return re.sub(r'\.gz$', '', nom) + '.zst'
+
+
+# Chemin de la copie transcodée d’une archive, si elle est complète et
+# lisible (module zstandard disponible)
+# 
+# @param str chemin_archive archive TAR gzippée
+# @return str|None
+def copie_transcodee(chemin_archive):
+    
+    transcodee = nom_transcode(chemin_archive)
+    if zstandard and os.path.exists(transcodee) \
+     and os.path.exists(transcodee + suffixe_table_trames):
+        return transcodee
+    return None
+
+
+# Transcoder une archive TAR gzippée en trames zstd indépendantes
+# 
+# L’archive n’est décompressée qu’une fois ; la copie est écrite à côté, avec
+# la table de ses trames, et l’archive d’origine est conservée.
+# 
+# @param str chemin_archive archive TAR gzippée
+# @param int niveau niveau de compression zstd
+# @return str chemin de la copie transcodée
+# @raise ImportError si le module zstandard n’est pas disponible
+# @raise IOError
+def transcoder_archive(chemin_archive, niveau=niveau_zstd):
+    
+    if not zstandard:
+        raise ImportError('zstandard')
+    
+    transcodee = nom_transcode(chemin_archive)
+    compresseur = zstandard.ZstdCompressor(level=niveau)
+    trames = []
+    position = 0
+    with gzip.GzipFile(chemin_archive, 'rb') as source:
+        with open(transcodee + '.part', 'wb') as destination:
+            for bloc in iter(lambda: source.read(taille_trame), b''):
+                trame = compresseur.compress(bloc)
+                destination.write(trame)
+                trames.append([position, len(trame), len(bloc)])
+                position += len(trame)
+    
+    # La table est écrite en premier : la copie n’est utilisée qu’une fois
+    # renommée
+    with open(transcodee + suffixe_table_trames + '.part', 'w') as fd:
+        json.dump({'trames': trames}, fd)
+    os.rename(transcodee + suffixe_table_trames + '.part', \
+              transcodee + suffixe_table_trames)
+    os.rename(transcodee + '.part', transcodee)
+    
+    return transcodee
+
+
+# Lire les trames d’une copie transcodée
+# 
+# @param str transcodee chemin de la copie transcodée
+# @return list[[int, int, int]] position et taille de chaque trame, puis sa
+#                              taille décompressée
+def lire_table_trames(transcodee):
+    
+    with open(transcodee + suffixe_table_trames, 'r') as fd:
+        return json.load(fd)['trames']
+
+
+# Lire une plage d’octets du TAR décompressé d’une copie transcodée, en ne
+# décodant que les trames concernées
+# 
+# @param str transcodee chemin de la copie transcodée
+# @param int position position dans le TAR décompressé
+# @param int taille nombre d’octets à lire
+# @return bytes
+def lire_plage_transcodee(transcodee, position, taille):
+    
+    decompresseur = zstandard.ZstdDecompressor()
+    morceaux = []
+    debut = 0
+    with open(transcodee, 'rb') as fd:
+        for position_trame, taille_trame, taille_decompressee \
+         in lire_table_trames(transcodee):
+            fin = debut + taille_decompressee
+            if fin > position and debut < position + taille:
+                fd.seek(position_trame)
+                donnees = decompresseur.decompress(fd.read(taille_trame), \
+                                      max_output_size=taille_decompressee)
+                morceaux.append(donnees[max(position - debut, 0): \
+                                        position + taille - debut])
+            if fin >= position + taille:
+                break
+            debut = fin
+    
+    return b''.join(morceaux)
+
+
+# Parcourir les fichiers d’une archive en une seule lecture séquentielle
+# 
+# Rien n’est écrit sur le disque : chaque fichier retenu est lu en mémoire et
+# donné avec son nom relatif au dossier d’installation de la base ; les
+# fichiers écartés par le filtre ne sont pas lus.
+# 
+# @param str chemin_archive
+# @param callable|None filtre fonction recevant le nom d’un fichier et
+#                             indiquant s’il faut le lire
+# @return generator[(str, bytes)] noms et contenus des fichiers
+# @raise IOError, tarfile.TarError
+def parcourir_archive(chemin_archive, filtre=None):
+    
+    with ouvrir_archive(chemin_archive) as tar:
+        for membre in membres_archive(tar):
+            if not membre.isfile():
+                continue
+            if filtre and not filtre(membre.name):
+                continue
+            yield membre.name, tar.extractfile(membre).read()
+
+
+# Inventorier une archive : fichiers écrits et liste de suppression
+# 
+# L’archive est lue séquentiellement sans rien extraire ; seule la liste de
+# suppression est lue en mémoire. La fonction est au niveau du module pour
+# pouvoir être appelée depuis un multiprocessing.Pool.
+# 
+# @param str chemin_archive
+# @return (list[str], bytes|None) noms des membres autres que des répertoires
+#                                 et contenu brut de la liste de suppression
+# @raise IOError, tarfile.TarError
+def inventorier_archive(chemin_archive):
+    
+    membres = []
+    suppressions = None
+    with ouvrir_archive(chemin_archive) as tar:
+        for membre in membres_archive(tar):
+            if membre.isdir():
+                continue
+            if membre.isfile() and est_liste_suppression(membre.name):
+                suppressions = tar.extractfile(membre).read()
+                continue
+            membres.append(membre.name)
+    
+    return membres, suppressions
+
+
+# Compacter une chaîne d’archives en une seule archive équivalente
+# 
+# Les archives (dump complet ou archive déjà compactée, puis dumps
+# incrémentaux dans l’ordre) sont d’abord inventoriées en parallèle ; chaque
+# fichier encore présent après la dernière livraison est ensuite copié une
+# seule fois, depuis l’archive qui l’écrit en dernier, sans rien extraire sur
+# le disque. L’archive produite a la forme d’un dump complet ; elle est écrite
+# à côté puis renommée une fois sur le disque.
+# 
+# @param list[str] archives chemins des archives, en ordre de livraison
+# @param str destination chemin de l’archive TAR gzippée à écrire
+# @param int|None processus nombre de processus inventoriant les archives
+#                           (None : nombre de processeurs ; 1 : aucun
+#                           processus supplémentaire)
+# @return int nombre de fichiers de l’archive produite
+# @raise IOError, tarfile.TarError
+def compacter_archives(archives, destination, processus=None):
+    
+    # Inventorier les archives
+    if processus == 1:
+        inventaires = [inventorier_archive(archive) for archive in archives]
+    else:
+        pool = multiprocessing.Pool(processus)
+        try:
+            inventaires = pool.map(inventorier_archive, archives)
+        finally:
+            pool.close()
+            pool.join()
+    
+    # Indice de l’archive écrivant chaque chemin en dernier, ou None s’il est
+    # finalement supprimé
+    etat = {}
+    for i, (membres, suppressions) in enumerate(inventaires):
+        for membre in membres:
+            etat[membre] = i
+        if suppressions:
+            for chemin in lire_liste_suppression(suppressions):
+                etat[chemin] = None
+    
+    # Recopier les membres retenus
+    repertoires = set()
+    partiel = destination + '.part'
+    with open(partiel, 'wb') as fd:
+        with tarfile.open(fileobj=fd, mode='w:gz', compresslevel=6) as sortie:
+            for i, archive in enumerate(archives):
+                with ouvrir_archive(archive) as tar:
+                    for membre in membres_archive(tar):
+                        if membre.isdir():
+                            if membre.name not in repertoires:
+                                repertoires.add(membre.name)
+                                sortie.addfile(membre)
+                        elif etat.get(membre.name, None) == i:
+                            sortie.addfile(membre, tar.extractfile(membre) \
+                                                   if membre.isfile() else None)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.rename(partiel, destination)
+    
+    return len([i for i in etat.values() if i is not None])
+
+
+# Calculer les condensats des fichiers d’une archive
+# 
+# L’archive est lue séquentiellement, chaque fichier par blocs, sans rien
+# extraire ; seule la liste de suppression est lue en mémoire. La fonction est
+# au niveau du module pour pouvoir être appelée depuis un multiprocessing.Pool.
+# 
+# @param str chemin_archive
+# @return (dict, bytes|None) condensat SHA-1 (hexadécimal) de chaque fichier,
+#                            par nom relatif au dossier d’installation de la
+#                            base, et contenu brut de la liste de suppression
+# @raise IOError, tarfile.TarError
+def condenser_archive(chemin_archive):
+    
+    condensats = {}
+    suppressions = None
+    with ouvrir_archive(chemin_archive) as tar:
+        for membre in membres_archive(tar):
+            if membre.islnk() and membre.linkname in condensats:
+                condensats[membre.name] = condensats[membre.linkname]
+            if not membre.isfile():
+                continue
+            fd = tar.extractfile(membre)
+            if est_liste_suppression(membre.name):
+                suppressions = fd.read()
+                continue
+            condensat = hashlib.sha1()
+            for bloc in iter(lambda: fd.read(1024 * 1024), b''):
+                condensat.update(bloc)
+            condensats[membre.name] = condensat.hexdigest()
+    
+    return condensats, suppressions
+
+
+# Construire le prédicat de sélection des membres d’une archive
+# 
+# Le filtre peut être un préfixe de chemin ou un identifiant de texte
+# (cidTexte, qui retient tout le répertoire du texte quel que soit son état
+# de vigueur), une liste de ceux-ci, ou une fonction recevant le nom du membre.
+# Les listes de suppression sont toujours retenues.
+# 
+# @param None|str|list[str]|callable filtre chemins relatifs au dossier
+#                                           d’installation de la base
+# @return callable|None fonction recevant le nom d’un membre et indiquant
+#                       s’il est retenu, None pour tout retenir
+def filtre_membres(filtre):
+    
+    if filtre is None:
+        return None
+    
+    if callable(filtre):
+        predicat = filtre
+    else:
+        if not isinstance(filtre, (list, tuple, set, frozenset)):
+            filtre = [filtre]
+        prefixes = tuple([element for element in filtre \
+                          if not motif_cid.match(element)])
+        cids = set([element for element in filtre if motif_cid.match(element)])
+        
+        def predicat(nom):
+            if prefixes and nom.startswith(prefixes):
+                return True
+            for cid in motif_cid_chemin.findall('/' + nom):
+                if cid in cids:
+                    return True
+            return False
+    
+    return lambda nom: est_liste_suppression(nom) or predicat(nom)
+
+
+# Indiquer si un membre d’archive est une liste de suppression
+# 
+# @param str nom nom relatif au dossier d’installation de la base
+# @return bool
+def est_liste_suppression(nom):
+    
+    return bool(motif_liste_suppression.match(nom))
+
+
+# Lire le contenu d’une liste de suppression (liste_suppression_BASE.dat)
+# 
+# Les chemins y sont donnés sans l’extension « .xml », qui est rajoutée.
+# 
+# @param bytes contenu contenu brut du fichier
+# @return list[str] chemins des fichiers supprimés, relatifs au dossier
+#                   d’installation de la base
+def lire_liste_suppression(contenu):
+    
+    chemins = []
+    for ligne in contenu.decode('utf-8').splitlines():
+        chemin = ligne.strip()
+        if not chemin:
+            continue
+        if not os.path.splitext(chemin)[1]:
+            chemin += '.xml'
+        chemins.append(chemin)
+    
+    return chemins
+
+
+# Ouvrir l’index d’accès direct d’une archive, en le construisant s’il
+# n’existe pas ou ne correspond plus à l’archive (taille ou date changées)
+# 
+# L’archive est lue une fois en entier pour construire l’index ; avec
+# indexed_gzip, les points de reprise sont relevés lors de la même lecture.
+# Ils sont inutiles si l’archive a une copie transcodée, dont la table des
+# trames permet déjà l’accès direct.
+# 
+# @param str chemin_archive archive TAR gzippée
+# @return sqlite3.Connection index ouvert
+# @raise IOError, tarfile.TarError
+def ouvrir_index_archive(chemin_archive):
+    
+    transcodee = copie_transcodee(chemin_archive)
+    points = indexed_gzip and not transcodee
+    if os.path.exists(chemin_archive) or not transcodee:
+        etat = os.stat(chemin_archive)
+    else:
+        etat = os.stat(transcodee)
+    chemin_index = chemin_archive + suffixe_index
+    chemin_points = chemin_archive + suffixe_points_reprise
+    
+    # Réutiliser l’index existant s’il est à jour
+    if os.path.exists(chemin_index):
+        index = sqlite3.connect(chemin_index)
+        archive = index.execute('SELECT taille, date FROM archive').fetchone()
+        if archive == (etat.st_size, int(etat.st_mtime)) \
+         and (not points or os.path.exists(chemin_points)):
+            return index
+        index.close()
+    
+    def lire_membres(tar):
+        for membre in membres_archive(tar):
+            if not membre.isfile():
+                continue
+            if est_liste_suppression(membre.name):
+                suppressions.extend(lire_liste_suppression( \
+                                        tar.extractfile(membre).read()))
+            membres.append((membre.name, membre.offset_data, membre.size))
+    
+    # Lire l’archive
+    membres = []
+    suppressions = []
+    if points:
+        fichier = indexed_gzip.IndexedGzipFile(chemin_archive, \
+                                       spacing=espacement_points_reprise)
+        try:
+            tar = tarfile.open(fileobj=fichier, mode='r|')
+            lire_membres(tar)
+            tar.close()
+            fichier.export_index(chemin_points + '.part')
+            os.rename(chemin_points + '.part', chemin_points)
+        finally:
+            fichier.close()
+    else:
+        with ouvrir_archive(chemin_archive) as tar:
+            lire_membres(tar)
+    
+    # Écrire l’index
+    if os.path.exists(chemin_index + '.part'):
+        os.remove(chemin_index + '.part')
+    index = sqlite3.connect(chemin_index + '.part')
+    index.execute('CREATE TABLE archive (taille INTEGER, date INTEGER)')
+    index.execute('CREATE TABLE membres (nom TEXT PRIMARY KEY, ' \
+                  'position INTEGER, taille INTEGER)')
+    index.execute('CREATE TABLE suppressions (nom TEXT PRIMARY KEY)')
+    index.execute('INSERT INTO archive VALUES (?, ?)', \
+                  (etat.st_size, int(etat.st_mtime)))
+    index.executemany('INSERT OR REPLACE INTO membres VALUES (?, ?, ?)', \
+                      membres)
+    index.executemany('INSERT OR IGNORE INTO suppressions VALUES (?)', \
+                      [(nom,) for nom in suppressions])
+    index.commit()
+    index.close()
+    os.rename(chemin_index + '.part', chemin_index)
+    
+    return sqlite3.connect(chemin_index)
+
+
+# Lire un seul membre d’une archive, sans la décompresser en entier
+# 
+# La position du membre est donnée par l’index d’accès direct ; avec une
+# copie transcodée ou les points de reprise d’indexed_gzip, seuls quelques Mio
+# sont décompressés. Sans l’un ni l’autre (modules zstandard et indexed_gzip
+# absents, ou archive pas encore transcodée), l’archive est décompressée
+# depuis le début jusqu’au membre à chaque lecture, sans rien écrire : cette
+# lecture lente est signalée par un avertissement, une fois par archive.
+# 
+# @param str chemin_archive archive TAR gzippée
+# @param str nom nom du membre relatif au dossier d’installation de la base
+# @return bytes contenu du membre
+# @raise FichierNonExistantException si le membre n’est pas dans l’archive
+# @raise IOError, tarfile.TarError
+def lire_membre_archive(chemin_archive, nom):
+    
+    index = ouvrir_index_archive(chemin_archive)
+    try:
+        membre = index.execute('SELECT position, taille FROM membres ' \
+                               'WHERE nom = ?', (nom,)).fetchone()
+    finally:
+        index.close()
+    if membre is None:
+        raise FichierNonExistantException()
+    
+    transcodee = copie_transcodee(chemin_archive)
+    if transcodee:
+        return lire_plage_transcodee(transcodee, membre[0], membre[1])
+    
+    chemin_points = chemin_archive + suffixe_points_reprise
+    if indexed_gzip and os.path.exists(chemin_points):
+        fichier = indexed_gzip.IndexedGzipFile(chemin_archive, \
+                                               index_file=chemin_points)
+    else:
+        if chemin_archive not in archives_sans_acces_direct:
+            archives_sans_acces_direct.add(chemin_archive)
+            logger.warning('Lecture lente de %s : ni copie transcodée ' \
+                           '(module zstandard), ni points de reprise ' \
+                           '(module indexed_gzip)', chemin_archive)
+        fichier = gzip.GzipFile(chemin_archive, 'rb')
+    try:
+        fichier.seek(membre[0])
+        return fichier.read(membre[1])
+    finally:
+        fichier.close()
+
+
+# Indiquer si la liste de suppression d’une archive contient un chemin
+# 
+# @param str chemin_archive archive TAR gzippée
+# @param str nom chemin relatif au dossier d’installation de la base
+# @return bool
+# @raise IOError, tarfile.TarError
+def membre_supprime(chemin_archive, nom):
+    
+    index = ouvrir_index_archive(chemin_archive)
+    try:
+        return index.execute('SELECT 1 FROM suppressions WHERE nom = ?', \
+                             (nom,)).fetchone() is not None
+    finally:
+        index.close()
+
+
+
+
+#
+# Lecture des copies transcodées
+#
+
+# Flux des octets décompressés d’une copie transcodée
+# 
+# Des fils d’exécution décodent les trames en avance, dans la limite de deux
+# trames par fil (zstandard libère le GIL pendant le décodage) ; read() les
+# rend dans l’ordre. Il faut appeler close() pour arrêter les fils.
+class LecteurTrames(object):
+    
+    def __init__(self, transcodee, fils=None):
+        self.transcodee = transcodee
+        self.trames = lire_table_trames(transcodee)
+        fils = fils or multiprocessing.cpu_count()
+        self.avance = 2 * fils
+        self.condition = threading.Condition()
+        self.prochaine = 0   # prochaine trame à décoder
+        self.courante = 0    # prochaine trame à rendre
+        self.decodees = {}
+        self.erreur = None
+        self.ferme = False
+        self.tampon = b''
+        self.position = 0
+        self.fils = [threading.Thread(target=self.decoder) \
+                     for i in range(min(fils, len(self.trames)))]
+        for fil in self.fils:
+            fil.daemon = True
+            fil.start()
+    
+    def decoder(self):
+        decompresseur = zstandard.ZstdDecompressor()
+        with open(self.transcodee, 'rb') as fd:
+            while True:
+                with self.condition:
+                    while not self.ferme \
+                     and self.prochaine < len(self.trames) \
+                     and self.prochaine >= self.courante + self.avance:
+                        self.condition.wait()
+                    if self.ferme or self.prochaine >= len(self.trames):
+                        return
+                    i = self.prochaine
+                    self.prochaine += 1
+                position, taille, taille_decompressee = self.trames[i]
+                try:
+                    fd.seek(position)
+                    donnees = decompresseur.decompress(fd.read(taille), \
+                                          max_output_size=taille_decompressee)
+                except Exception as e:
+                    with self.condition:
+                        self.erreur = e
+                        self.condition.notify_all()
+                    return
+                with self.condition:
+                    self.decodees[i] = donnees
+                    self.condition.notify_all()
+    
+    def trame_suivante(self):
+        with self.condition:
+            if self.courante >= len(self.trames):
+                return b''
+            while self.courante not in self.decodees and self.erreur is None:
+                self.condition.wait()
+            if self.courante not in self.decodees:
+                raise self.erreur
+            donnees = self.decodees.pop(self.courante)
+            self.courante += 1
+            self.condition.notify_all()
+        return donnees
+    
+    def read(self, taille=-1):
+        morceaux = []
+        while taille != 0:
+            if self.position >= len(self.tampon):
+                self.tampon = self.trame_suivante()
+                self.position = 0
+                if not self.tampon:
+                    break
+            if taille < 0:
+                fin = len(self.tampon)
+            else:
+                fin = min(self.position + taille, len(self.tampon))
+                taille -= fin - self.position
+            morceaux.append(self.tampon[self.position:fin])
+            self.position = fin
+        return b''.join(morceaux)
+    
+    def close(self):
+        with self.condition:
+            self.ferme = True
+            self.condition.notify_all()
+        for fil in self.fils:
+            fil.join()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# 
+# Loifrançaise – Bibliothèque de manipulation de la loi française
+# – ce module définit les tables d’appartenance par intervalles des sections
+#   et articles aux versions de textes, et le chargement massif de lignes
+# 
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# the LICENSE file for more details.
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import sys
+import sqlite3
+import contextlib
+
+from peewee import Model
+from peewee import SqliteDatabase
+from peewee import PostgresqlDatabase
+from peewee import MySQLDatabase
+from peewee import CharField
+from peewee import DateField
+from peewee import ForeignKeyField
+
+from marcheolex.basededonnees import Livraison
+from marcheolex.basededonnees import Texte
+from marcheolex.basededonnees import Livraison_texte
+
+
+#
+# Tables
+# 
+# Au lieu d’une ligne Liste_sections ou Liste_articles par version de texte
+# et par section ou article en vigueur, une seule ligne par livraison du texte
+# et par section ou article, avec sa section parente et son intervalle de
+# vigueur. Une section ou un article appartient à une version du texte de la
+# même livraison si sa vigueur commence au plus tard au début de la version et
+# finit au plus tôt à sa fin (None : début ou fin infini).
+#
+
+class Intervalle_section(Model):
+    
+    version_section = CharField()
+    texte = ForeignKeyField(Texte)
+    livraison = ForeignKeyField(Livraison)
+    id_parent = CharField(null=True)
+    vigueur_debut = DateField(null=True)
+    vigueur_fin = DateField(null=True)
+    
+    class Meta:
+        database = Texte._meta.database
+        indexes = ((('texte', 'livraison', 'vigueur_debut'), False),)
+
+
+class Intervalle_article(Model):
+    
+    version_article = CharField()
+    texte = ForeignKeyField(Texte)
+    livraison = ForeignKeyField(Livraison)
+    id_parent = CharField(null=True)
+    vigueur_debut = DateField(null=True)
+    vigueur_fin = DateField(null=True)
+    
+    class Meta:
+        database = Texte._meta.database
+        indexes = ((('texte', 'livraison', 'vigueur_debut'), False),)
+
+
+tables_intervalles = [Intervalle_section, Intervalle_article]
+
+
+#
+# Constantes
+#
+
+# Nombre maximal de paramètres d’une requête, par moteur de base de données
+# (SQLite : SQLITE_MAX_VARIABLE_NUMBER par défaut, 999 avant la version 3.32)
+parametres_max = {
+    'sqlite': 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999,
+    'postgresql': 32767,
+    'mysql': 65535,
+}
+
+# Nombre maximal de lignes d’un INSERT avec SQLite avant la version 3.8.8
+# (SQLITE_MAX_COMPOUND_SELECT)
+lignes_max_sqlite = 500
+
+
+#
+# Fonctions
+#
+
+# Créer les tables d’appartenance par intervalles si elles n’existent pas
+def creer_tables_intervalles():
+    
+    for table in tables_intervalles:
+        if not table.table_exists():
+            table.create_table()
+
+
+# Sections et articles d’une version de texte, enregistrés par intervalles
+# 
+# La livraison de la version est celle de son Livraison_texte ; les sections
+# et articles sont trouvés par une recherche d’intervalle sur l’index (texte,
+# livraison, vigueur_debut).
+# 
+# @param Version_texte entree_version_texte
+# @return dict 'sections' : list[(str, str|None)] sections de la version et
+#              leurs sections parentes, 'articles' : idem pour les articles
+def membres_version_texte(entree_version_texte):
+    
+    livraison_texte = Livraison_texte.get(
+        Livraison_texte.version_texte == entree_version_texte)
+    debut = entree_version_texte.vigueur_debut
+    fin = entree_version_texte.vigueur_fin
+    
+    membres = {}
+    for cle, table, champ in [('sections', Intervalle_section, \
+                               Intervalle_section.version_section), \
+                              ('articles', Intervalle_article, \
+                               Intervalle_article.version_article)]:
+        
+        condition = (table.texte == livraison_texte.texte) & \
+                    (table.livraison == livraison_texte.livraison)
+        if debut is not None:
+            condition &= (table.vigueur_debut == None) | \
+                         (table.vigueur_debut <= debut)
+        if fin is None:
+            condition &= (table.vigueur_fin == None)
+        else:
+            condition &= (table.vigueur_fin == None) | \
+                         (table.vigueur_fin >= fin)
+        
+        membres[cle] = list(table.select(champ, table.id_parent). \
+                                  where(condition).tuples())
+    
+    return membres
+
+
+# Moteur d’une base de données Peewee
+# 
+# @param Database bdd
+# @return str|None dans ('sqlite', 'postgresql', 'mysql'), None si inconnu
+def moteur(bdd):
+    
+    if isinstance(bdd, SqliteDatabase):
+        return 'sqlite'
+    if isinstance(bdd, PostgresqlDatabase):
+        return 'postgresql'
+    if isinstance(bdd, MySQLDatabase):
+        return 'mysql'
+    return None
+
+
+# Nombre de lignes d’un lot inséré en une requête, d’après le nombre maximal
+# de paramètres d’une requête du moteur
+# 
+# @param Model modele
+# @param int colonnes nombre de colonnes de chaque ligne
+# @return int
+def taille_lot(modele, colonnes):
+    
+    nom_moteur = moteur(modele._meta.database)
+    taille = max(1, parametres_max.get(nom_moteur, 999) // max(1, colonnes))
+    if nom_moteur == 'sqlite' and sqlite3.sqlite_version_info < (3, 8, 8):
+        taille = min(taille, lignes_max_sqlite)
+    
+    return taille
+
+
+# Insérer des lignes dans une table
+# 
+# Avec PostgreSQL, les lignes sont copiées (COPY) ; sinon elles sont insérées
+# par insert_many, en lots aussi grands que le permet le moteur (cf
+# taille_lot).
+# 
+# @param Model modele
+# @param list[dict] lignes valeurs par nom de champ, mêmes champs pour toutes
+# @return None
+def inserer_lignes(modele, lignes):
+    
+    if not lignes:
+        return
+    
+    if moteur(modele._meta.database) == 'postgresql':
+        copier_lignes(modele, lignes)
+        return
+    
+    lot = taille_lot(modele, len(lignes[0]))
+    for i in range(0, len(lignes), lot):
+        modele.insert_many(lignes[i:i+lot]).execute()
+
+
+# Copier des lignes dans une table PostgreSQL (COPY … FROM STDIN)
+# 
+# @param Model modele
+# @param list[dict] lignes valeurs par nom de champ, mêmes champs pour toutes
+# @return None
+def copier_lignes(modele, lignes):
+    
+    bdd = modele._meta.database
+    noms = list(lignes[0])
+    champs = [modele._meta.fields[nom] for nom in noms]
+    
+    # Lignes au format texte de COPY
+    contenu = []
+    for ligne in lignes:
+        valeurs = []
+        for nom, champ in zip(noms, champs):
+            valeur = champ.db_value(ligne[nom])
+            if valeur is None:
+                valeurs.append('\\N')
+            else:
+                valeurs.append(('%s' % (valeur,)).replace('\\', '\\\\'). \
+                               replace('\t', '\\t').replace('\n', '\\n'). \
+                               replace('\r', '\\r'))
+        contenu.append('\t'.join(valeurs) + '\n')
+    contenu = ''.join(contenu)
+    if sys.version_info < (3,):
+        tampon = io.BytesIO(contenu.encode('utf-8'))
+    else:
+        tampon = io.StringIO(contenu)
+    
+    table = getattr(modele._meta, 'table_name', None) or modele._meta.db_table
+    colonnes = [getattr(champ, 'column_name', None) or champ.db_column \
+                for champ in champs]
+    requete = 'COPY "%s" (%s) FROM STDIN' % \
+              (table, ', '.join(['"%s"' % colonne for colonne in colonnes]))
+    
+    curseur = bdd.cursor() if hasattr(bdd, 'cursor') else bdd.get_cursor()
+    curseur.copy_expert(requete, tampon)
+
+
+# Préparer la base de données à un chargement massif
+# 
+# Pendant le bloc with, l’écriture sur le disque n’est plus attendue à chaque
+# transaction (SQLite : synchronous=OFF ; PostgreSQL : synchronous_commit=off)
+# et les index secondaires des tables données encore vides (chargement
+# initial) sont supprimés ; ils sont recréés et les réglages rétablis à la
+# sortie, même après une erreur. À n’utiliser que pour des tables
+# seulement écrites pendant le chargement.
+# 
+# @param list[Model] tables
+# @return contextmanager[None]
+@contextlib.contextmanager
+def chargement_massif(tables=()):
+    
+    bdd = Texte._meta.database
+    nom_moteur = moteur(bdd)
+    
+    # Relâcher la synchronisation
+    synchronous = None
+    if nom_moteur == 'sqlite':
+        synchronous = bdd.execute_sql('PRAGMA synchronous').fetchone()[0]
+        bdd.execute_sql('PRAGMA synchronous = OFF')
+    elif nom_moteur == 'postgresql':
+        bdd.execute_sql('SET synchronous_commit TO off')
+    
+    # Supprimer les index secondaires des tables vides
+    index = []
+    try:
+        for table in tables:
+            nom_table = getattr(table._meta, 'table_name', None) or \
+                        table._meta.db_table
+            if not table.table_exists() or table.select().exists():
+                continue
+            for entree in bdd.get_indexes(nom_table):
+                if entree.unique or not entree.sql:
+                    continue
+                if nom_moteur == 'mysql':
+                    bdd.execute_sql('DROP INDEX `%s` ON `%s`' % \
+                                    (entree.name, nom_table))
+                else:
+                    bdd.execute_sql('DROP INDEX "%s"' % entree.name)
+                index.append(entree.sql)
+        
+        yield
+    
+    finally:
+        
+        # Recréer les index et rétablir la synchronisation
+        for sql in index:
+            bdd.execute_sql(sql)
+        if nom_moteur == 'sqlite':
+            bdd.execute_sql('PRAGMA synchronous = %d' % synchronous)
+        elif nom_moteur == 'postgresql':
+            bdd.execute_sql('RESET synchronous_commit')
@@ -17,13 +17,13 @@ from __future__ import division
 from __future__ import print_function
 import os
 import sys
-import math
+import bisect
+import collections
+import multiprocessing
 
-from bs4 import BeautifulSoup
 from datetime import datetime, date
 
 from marcheolex import FichierNonExistantException
-from marcheolex import tranches_bdd
 from marcheolex.basededonnees import Livraison
 from marcheolex.basededonnees import Texte
 from marcheolex.basededonnees import Version_texte
@@ -39,21 +39,148 @@ from marcheolex.utilitaires import normalise_date
 from marcheolex.utilitaires import comp_infini
 from marcheolex.utilitaires import comp_infini_strict
 from marcheolex.utilitaires import comp_infini_large
+from loifrancaise.archives import parcourir_archive
+from loifrancaise.archives import est_liste_suppression
+from loifrancaise.archives import lire_liste_suppression
+from loifrancaise.analyses import analyser_version
+from loifrancaise.analyses import analyser_struct
+from loifrancaise.analyses import analyser_section_ta
+from loifrancaise.stockage import Memoire
+from loifrancaise.stockage import Repertoire
+from loifrancaise.stockage import CacheAnalyses
+from loifrancaise.stockage import ouvrir_source
+from loifrancaise.basededonnees import Intervalle_section
+from loifrancaise.basededonnees import Intervalle_article
+from loifrancaise.basededonnees import creer_tables_intervalles
+from loifrancaise.basededonnees import inserer_lignes
+from loifrancaise.basededonnees import chargement_massif
+
+# Cache des analyses de fichiers XML, None pour analyser chaque fois (voir
+# utiliser_cache_analyses)
+cache_analyses = None
+
+# Nombre d’analyses de textes soumises d’avance à chaque processus d’analyse
+# (cf ranger) : les résultats attendant d’être enregistrés restent en mémoire
+analyses_par_processus = 2
 
 
 # Ranger un ensemble de textes d’une base XML
-def ranger(base, textes, livraison, cache):
+# 
+# Avec plusieurs processus, les fichiers XML des textes sont lus, analysés et
+# parcourus par un multiprocessing.Pool (cf analyser_texte_xml) ; le processus
+# principal reçoit les résultats dans l’ordre, au fur et à mesure, et est le
+# seul à écrire dans la base de données, par transactions de plusieurs textes.
+# Les analyses sont soumises au fur et à mesure des enregistrements, au plus
+# analyses_par_processus par processus d’avance, pour que les résultats en
+# attente ne s’accumulent pas en mémoire si l’écriture est plus lente.
+# Le cache des analyses n’est pas utilisé par les processus d’analyse.
+# 
+# @param str base
+# @param list textes clés des textes (cf lire_code_xml)
+# @param datetime|str livraison 'fondation', 'tout' ou date de la livraison
+# @param str cache
+# @param int|None processus nombre de processus d’analyse (1 : par défaut,
+#                           textes rangés un par un, sans processus
+#                           supplémentaire ; None : nombre de processeurs)
+# @param int textes_transaction nombre de textes enregistrés par transaction,
+#                               chacun avec toutes ses livraisons
+# @param str appartenance enregistrement des sections et articles de chaque
+#                         version de texte, dans ('listes', 'intervalles')
+#                         (cf enregistrer_versions_texte)
+def ranger(base, textes, livraison, cache, processus=1, \
+           textes_transaction=50, appartenance='listes'):
     
-    for texte in textes:
-        
-        lire_code_xml(base, texte, livraison, cache)
+    if appartenance == 'intervalles':
+        creer_tables_intervalles()
+    
+    index = IndexLivraisons()
+    
+    if processus == 1:
+        with chargement_massif(tables_appartenance(appartenance)):
+            for texte in textes:
+                lire_code_xml(base, texte, livraison, cache, None, \
+                              appartenance, index)
+        return
+    
+    # Livraisons à ranger pour chaque texte, dans l’ordre, par lots de
+    # textes_transaction textes
+    lots = []
+    for i, texte in enumerate(textes):
+        if i % textes_transaction == 0:
+            lots.append([])
+        for entree_livraison, chemin in livraisons_code_xml(texte, livraison, \
+                                                            cache, index):
+            lots[-1].append((entree_livraison, chemin, texte[1]))
+    taches = iter([tache for lot in lots for tache in lot])
+    
+    # Analyser en parallèle et enregistrer dans ce processus
+    bdd = Texte._meta.database
+    fenetre = analyses_par_processus * \
+              (processus or multiprocessing.cpu_count())
+    en_cours = collections.deque()
+    pool = multiprocessing.Pool(processus, initialiser_processus_analyse)
+    try:
+        with chargement_massif(tables_appartenance(appartenance)):
+            for lot in lots:
+                with bdd.atomic():
+                    for entree_livraison, chemin, cidTexte in lot:
+                        
+                        # Soumettre les analyses suivantes
+                        while len(en_cours) < fenetre:
+                            tache = next(taches, None)
+                            if tache is None:
+                                break
+                            en_cours.append(pool.apply_async( \
+                                analyser_tache_texte, \
+                                ((tache[1], tache[2], 'code'),)))
+                        
+                        ranger_texte_xml(entree_livraison, base, chemin, \
+                                         cidTexte, 'code', \
+                                         analyse=en_cours.popleft().get(), \
+                                         appartenance=appartenance)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# Tables des sections et articles des versions de textes, seulement écrites
+# pendant le rangement (cf basededonnees.chargement_massif)
+def tables_appartenance(appartenance):
+    
+    if appartenance == 'intervalles':
+        return [Intervalle_section, Intervalle_article]
+    
+    return [Liste_sections, Liste_articles]
 
 
 # Lire un texte dans une base XML
-def lire_code_xml(base, cle, livraison, cache):
+# 
+# @param multiprocessing.Pool|None pool analysant les fichiers section_ta (cf
+#                                       lire_sections_ta)
+def lire_code_xml(base, cle, livraison, cache, pool=None, \
+                  appartenance='listes', index=None):
+    
+    if appartenance == 'intervalles':
+        creer_tables_intervalles()
+    
+    for entree_livraison, chemin in livraisons_code_xml(cle, livraison, cache, \
+                                                        index):
+        
+        # Lire les informations sur le texte
+        ranger_texte_xml(entree_livraison, base, chemin, cle[1], 'code', \
+                         pool, appartenance=appartenance)
+
+
+# Livraisons d’un texte dans une base XML, en sens croissant
+# 
+# @param IndexLivraisons|None index livraisons déjà chargées, None pour les
+#                                   charger ici
+# @return list[(Livraison, str)] livraisons et chemins du texte
+# @raise Exception si le texte manque dans une livraison
+def livraisons_code_xml(cle, livraison, cache, index=None):
     
     if not cle[2]:
-        return
+        return []
     if livraison not in ['fondation','tout'] and \
        not isinstance(livraison, datetime):
         livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
@@ -84,7 +211,8 @@ def lire_code_xml(base, cle, livraison, cache):
         entree_livraison = Livraison.select(). \
             order_by(Livraison.date.desc()).limit(1)
     else:
-        entree_livraison = Livraison.get(Livraison.date == livraison)
+        index = index or IndexLivraisons()
+        entree_livraison = index.get(livraison)
     
     # Construire le chemin de base
     if entree_livraison.type == 'fondation':
@@ -95,6 +223,7 @@ def lire_code_xml(base, cle, livraison, cache):
     chemin_fond = os.path.join(chemin_base, date_fond)
     
     # Parcourir les livraisons en sens croissant
+    livraisons = []
     while entree_livraison:
         
         # Chemin de la livraison
@@ -109,36 +238,127 @@ def lire_code_xml(base, cle, livraison, cache):
         if not os.path.exists(chemin):
             raise Exception()
         
-        # Lire les informations sur le texte
-        ranger_texte_xml(entree_livraison, base, chemin, cidTexte, 'code')
+        livraisons.append((entree_livraison, chemin))
         
         # Ouvrir la livraison suivante
-        try:
-            entree_livraison = Livraison.get(Livraison.suivante == entree_livraison)
-        except Livraison.DoesNotExist:
-            entree_livraison = None
+        index = index or IndexLivraisons()
+        entree_livraison = index.suivante(entree_livraison)
+    
+    return livraisons
+
+
+# Ranger un ensemble de textes directement depuis l’archive d’une livraison
+# 
+# L’archive est lue une seule fois sans rien écrire sur le disque : seuls les
+# fichiers des textes demandés sont gardés en mémoire et donnés à
+# ranger_texte_xml. Pour un dump incrémental, les fichiers absents de
+# l’archive sont lus dans la source précédente de chaque texte (celle
+# renvoyée pour la livraison précédente, ou un répertoire déjà installé).
+# 
+# @param str base
+# @param list textes clés des textes (cf lire_code_xml)
+# @param datetime|str livraison date de la livraison ('AAAAMMJJ-HHMMSS')
+# @param str chemin_archive archive TAR gzippée de la livraison
+# @param dict|None precedentes sources précédentes, par cidTexte
+# @param str appartenance dans ('listes', 'intervalles') (cf ranger)
+# @param int|None processus nombre de processus analysant les fichiers
+#                           section_ta, un seul pool servant à tous les textes
+#                           (1 : par défaut, aucun processus supplémentaire ;
+#                           None : nombre de processeurs)
+# @return dict sources de cette livraison, par cidTexte
+def ranger_archive(base, textes, livraison, chemin_archive, precedentes=None, \
+                   appartenance='listes', processus=1):
+    
+    if appartenance == 'intervalles':
+        creer_tables_intervalles()
+    
+    if not isinstance(livraison, datetime):
+        livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
+    entree_livraison = Livraison.get(Livraison.date == livraison)
+    precedentes = precedentes or {}
+    
+    # Répertoire de chaque texte dans l’archive
+    repertoires = {}
+    for cle in textes:
+        if cle[2]:
+            repertoires[chemin_texte(cle[1])] = cle[1]
+    profondeurs = set([len(repertoire.split('/')) \
+                       for repertoire in repertoires])
+    
+    def repertoire_texte(nom):
+        parties = nom.split('/')
+        for profondeur in profondeurs:
+            repertoire = '/'.join(parties[:profondeur])
+            if len(parties) > profondeur and repertoire in repertoires:
+                return repertoire
+        return None
+    
+    def retenir(nom):
+        return est_liste_suppression(nom) or repertoire_texte(nom) is not None
+    
+    # Lire l’archive en une passe
+    contenus = dict([(cid, {}) for cid in repertoires.values()])
+    suppressions = []
+    for nom, contenu in parcourir_archive(chemin_archive, retenir):
+        if est_liste_suppression(nom):
+            suppressions = lire_liste_suppression(contenu)
+            continue
+        repertoire = repertoire_texte(nom)
+        contenus[repertoires[repertoire]][nom[len(repertoire)+1:]] = contenu
+    
+    # Ranger chaque texte
+    sources = {}
+    pool = None
+    if processus != 1:
+        pool = multiprocessing.Pool(processus, initialiser_processus_analyse)
+    try:
+        with chargement_massif(tables_appartenance(appartenance)):
+            for repertoire, cidTexte in repertoires.items():
+                
+                supprimes = [chemin[len(repertoire)+1:] \
+                             for chemin in suppressions \
+                             if chemin.startswith(repertoire + '/')]
+                sources[cidTexte] = Memoire(contenus[cidTexte], \
+                                            precedentes.get(cidTexte), \
+                                            supprimes)
+                
+                ranger_texte_xml(entree_livraison, base, sources[cidTexte], \
+                                 cidTexte, 'code', pool, \
+                                 appartenance=appartenance)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    
+    return sources
 
 
 # Vérifier si le texte existe, et en fonction de cela ajouter ou mettre à jour
-def ranger_texte_xml(livraison, base, chemin_base, cidTexte, nature_attendue=None):
+# 
+# @param multiprocessing.Pool|None pool analysant les fichiers section_ta (cf
+#                                       lire_sections_ta)
+# @param dict|None analyse texte déjà analysé (cf analyser_texte_xml), None
+#                          pour l’analyser ici
+# @param str appartenance dans ('listes', 'intervalles') (cf
+#                         enregistrer_versions_texte)
+def ranger_texte_xml(livraison, base, chemin_base, cidTexte, nature_attendue=None, pool=None, analyse=None, appartenance='listes'):
     
-    # Lecture du fichier XML texte/version/[cid].xml
-    version = lire_base_version(chemin_base, cidTexte)
+    # Lecture et parcours des fichiers XML du texte
+    if analyse is None:
+        analyse = analyser_texte_xml(chemin_base, cidTexte, nature_attendue, \
+                                     pool)
     
-    # Lecture brute du fichier XML texte/struct
-    struct = lire_base_struct(chemin_base, cidTexte)
+    # Enregistrer le texte en une seule transaction
+    with Texte._meta.database.atomic():
+        enregistrer_texte_xml(livraison, base, chemin_base, analyse, \
+                              appartenance)
+
+
+# Enregistrer un texte analysé (cf analyser_texte_xml) dans la base de données
+def enregistrer_texte_xml(livraison, base, chemin_base, analyse, appartenance='listes'):
     
-    # Vérifications
-    if not cidTexte == version['CID']:
-        raise Exception()
-    if nature_attendue and not version['NATURE'] == nature_attendue.upper() or not struct['NATURE'] == nature_attendue.upper():
-        raise Exception()
-    if not version['DATE_TEXTE'] == struct['DATE_TEXTE']:
-        raise Exception()
-    if not version['DATE_PUBLI'] == struct['DATE_PUBLI']:
-        raise Exception()
-    if not len(struct['VERSION']) == 1:  # texte/version ne peut avoir qu’une seule version, donc texte/struct également et elles doivent correspondre
-        raise Exception()
+    version = analyse['version']
+    arbre = analyse['arbre']
     
     # Inscription du texte
     try:
@@ -153,17 +373,52 @@ def ranger_texte_xml(livraison, base, chemin_base, cidTexte, nature_attendue=Non
     
     # Initialisation du suivi des dates de changement
     dates = set([version['DATE_DEBUT'], version['DATE_FIN']])
-    arbre = dict()
     autres_sections = set()
     autres_articles = set()
     nouvelles_sections = set()
     nouveaux_articles = set()
-    date_codification = None
-    if struct['NATURE'] == 'CODE':
-        date_codification = version['DATE_DEBUT']
     
-    # Ajouter récursivement les sections et articles
-    dates, autres_sections, autres_articles, nouvelles_sections, nouveaux_articles, arbre = ranger_sections_xml(chemin_base, struct['LIEN_SECTION_TA'], struct['LIEN_ART'], entree_texte, None, dates, autres_sections, autres_articles, 1, nouvelles_sections, nouveaux_articles, date_codification, arbre)
+    # Versions de sections et d’articles déjà enregistrées pour ce texte
+    champs_sections = [Version_section.id, Version_section.nom,
+                       Version_section.etat_juridique, Version_section.niveau,
+                       Version_section.numero, Version_section.vigueur_debut,
+                       Version_section.vigueur_fin]
+    champs_articles = [Version_article.id, Version_article.nom,
+                       Version_article.etat_juridique, Version_article.numero,
+                       Version_article.vigueur_debut,
+                       Version_article.vigueur_fin]
+    sections_existantes = index_versions(Version_section, champs_sections, \
+                                         entree_texte)
+    articles_existants = index_versions(Version_article, champs_articles, \
+                                        entree_texte, \
+                                        Version_article.condensat == None)
+    
+    # Prise en compte des versions de sections
+    for section in analyse['sections']:
+        id, nom, etat_juridique, niveau, numero, vigueur_debut, vigueur_fin \
+            = section
+        if cle_version(champs_sections, section) in sections_existantes:
+            autres_sections |= {(id, nom, etat_juridique, niveau, numero, \
+                                 vigueur_debut, vigueur_fin, entree_texte.cid)}
+        else:
+            nouvelles_sections |= {(id, nom, etat_juridique, niveau, \
+                                    numero, vigueur_debut, vigueur_fin, \
+                                    entree_texte.cid)}
+            dates |= {vigueur_debut, vigueur_fin}
+    
+    # Prise en compte des versions d’articles
+    for article in analyse['articles']:
+        id, nom, etat_juridique, numero, vigueur_debut, vigueur_fin = article
+        if cle_version(champs_articles, article) in articles_existants:
+            autres_articles |= {(id,  nom, etat_juridique, numero, \
+                                 vigueur_debut, vigueur_fin, None, \
+                                 entree_texte.cid)}
+        else:
+            nouveaux_articles |= {(id,  nom, etat_juridique, numero, \
+                                   vigueur_debut, vigueur_fin, None, \
+                                   entree_texte.cid)}
+            dates |= {vigueur_debut, vigueur_fin}
+    
     print('')
     print(len(dates))
     print(len(arbre))
@@ -173,31 +428,149 @@ def ranger_texte_xml(livraison, base, chemin_base, cidTexte, nature_attendue=Non
     print(len(nouveaux_articles))
     
     # Enregistrer les versions de texte
-    enregistrer_versions_texte(version, livraison, dates, autres_sections, autres_articles, entree_texte, nouvelles_sections, nouveaux_articles, chemin_base, arbre)
+    enregistrer_versions_texte(version, livraison, dates, autres_sections, autres_articles, entree_texte, nouvelles_sections, nouveaux_articles, chemin_base, arbre, appartenance)
+
+
+# Index des versions (Version_section ou Version_article) d’un texte déjà
+# enregistrées dans la base
+# 
+# Les versions sont lues en une seule requête et indexées par le tuple de leurs
+# valeurs pour les champs donnés, telles que relues depuis la base : une
+# version analysée y est présente si et seulement si une requête d’égalité sur
+# chacun de ces champs la trouverait (cf cle_version).
+# 
+# @param Model modele
+# @param list[Field] champs
+# @param Texte entree_texte
+# @param Expression|None condition condition supplémentaire sur les versions
+# @return set[tuple]
+def index_versions(modele, champs, entree_texte, condition=None):
+    
+    requete = modele.select(*champs).where(modele.texte == entree_texte)
+    if condition is not None:
+        requete = requete.where(condition)
+    
+    return set(requete.tuples())
+
+
+# Clé d’une version analysée dans un index de versions (cf index_versions) :
+# ses valeurs converties comme si elles étaient écrites puis relues
+def cle_version(champs, valeurs):
+    
+    return tuple(champ.python_value(champ.db_value(valeur)) \
+                 for champ, valeur in zip(champs, valeurs))
+
+
+# Lire, vérifier et parcourir les fichiers XML d’un texte
+# 
+# Rien n’est lu ni écrit dans la base de données : la fonction peut être
+# appelée depuis un processus d’analyse (cf ranger). Les fichiers section_ta
+# sont tous lus et analysés d’abord, en parallèle si un pool est donné (cf
+# lire_sections_ta), puis l’arborescence est parcourue en mémoire.
+# 
+# @param str|object chemin_base répertoire du texte ou source de fichiers
+# @param str cidTexte
+# @param str|None nature_attendue
+# @param multiprocessing.Pool|None pool analysant les fichiers section_ta (cf
+#                                       lire_sections_ta)
+# @param bool afficher afficher l’avancement du parcours
+# @return dict 'version' : propriétés du texte (cf lire_base_version),
+#              'sections' : versions de sections (id, nom, etat_juridique,
+#              niveau, numero, vigueur_debut, vigueur_fin) dans l’ordre du
+#              parcours, 'articles' : versions d’articles (id, nom,
+#              etat_juridique, numero, vigueur_debut, vigueur_fin) idem,
+#              'arbre' : section parente de chaque section et article
+# @raise Exception si le texte est incohérent
+def analyser_texte_xml(chemin_base, cidTexte, nature_attendue=None, \
+                       pool=None, afficher=True):
+    
+    # Lecture du fichier XML texte/version/[cid].xml
+    version = lire_base_version(chemin_base, cidTexte)
+    
+    # Lecture brute du fichier XML texte/struct
+    struct = lire_base_struct(chemin_base, cidTexte)
+    
+    # Vérifications
+    if not cidTexte == version['CID']:
+        raise Exception()
+    if nature_attendue and not version['NATURE'] == nature_attendue.upper() or not struct['NATURE'] == nature_attendue.upper():
+        raise Exception()
+    if not version['DATE_TEXTE'] == struct['DATE_TEXTE']:
+        raise Exception()
+    if not version['DATE_PUBLI'] == struct['DATE_PUBLI']:
+        raise Exception()
+    if not len(struct['VERSION']) == 1:  # texte/version ne peut avoir qu’une seule version, donc texte/struct également et elles doivent correspondre
+        raise Exception()
+    
+    date_codification = None
+    if struct['NATURE'] == 'CODE':
+        date_codification = version['DATE_DEBUT']
+    
+    # Analyser tous les fichiers section_ta du texte
+    sections_ta = lire_sections_ta(chemin_base, struct['LIEN_SECTION_TA'], \
+                                   pool)
+    
+    # Parcourir récursivement les sections et articles
+    sections = []
+    articles = []
+    arbre = dict()
+    parcourir_sections_xml(chemin_base, struct['LIEN_SECTION_TA'], \
+                           struct['LIEN_ART'], None, 1, date_codification, \
+                           sections, articles, arbre, sections_ta, afficher)
+    
+    return {'version': version, 'sections': sections, 'articles': articles,
+            'arbre': arbre}
+
+
+# Analyser un texte dans un processus d’analyse (cf ranger)
+# 
+# La fonction est au niveau du module pour pouvoir être appelée depuis un
+# multiprocessing.Pool.
+# 
+# @param (str, str, str|None) tache chemin du texte, cidTexte et nature
+#                                  attendue
+# @return dict texte analysé (cf analyser_texte_xml)
+def analyser_tache_texte(tache):
+    
+    chemin_base, cidTexte, nature_attendue = tache
+    
+    return analyser_texte_xml(chemin_base, cidTexte, nature_attendue, None, \
+                              False)
+
+
+# Préparer un processus d’analyse : la connexion au cache des analyses,
+# héritée du processus principal, ne doit pas y être utilisée
+def initialiser_processus_analyse():
+    
+    global cache_analyses
+    
+    cache_analyses = None
 
 
 # Parcourir récursivement les sections
-# - enregistrer celles du niveau N (N≥1)
+# - relever celles du niveau N (N≥1)
 # - ouvrir les fichiers correspondant à ces sections
-# - appeler ranger_sections_xml sur les nœuds de STRUCTURE_TA
-def ranger_sections_xml(chemin_base, coll_sections, coll_articles, \
-                        entree_texte, version_section_parente, dates, \
-                        autres_sections, autres_articles, niv, \
-                        nouvelles_sections, nouveaux_articles, date_codification, arbre):
+# - appeler parcourir_sections_xml sur les nœuds de STRUCTURE_TA
+# (sections_ta : fichiers section_ta déjà analysés, par chemin, cf
+# lire_sections_ta ; les autres sont lus au fur et à mesure)
+def parcourir_sections_xml(chemin_base, coll_sections, coll_articles, \
+                           version_section_parente, niv, date_codification, \
+                           sections, articles, arbre, sections_ta=None, \
+                           afficher=True):
     
     # Prévenir les récursions infinies - les specs indiquent un max de 10
     if niv == 11:
         raise Exception()
     
     # Traiter les articles à ce niveau
-    dates, autres_articles, nouveaux_articles, arbre = ranger_articles_xml( \
-        chemin_base, coll_articles, entree_texte, dates, autres_articles, \
-        nouveaux_articles, date_codification, version_section_parente, arbre)
+    parcourir_articles_xml(coll_articles, version_section_parente, \
+                           date_codification, articles, arbre, afficher)
     
     for i, section in enumerate(coll_sections):
         
         # Affichage de l’avancement
-        compteur_recursif(i+1, len(coll_sections), False)
+        if afficher:
+            compteur_recursif(i+1, len(coll_sections), False)
         
         cid = section['cid']
         id = section['id']
@@ -220,60 +593,40 @@ def ranger_sections_xml(chemin_base, coll_sections, coll_articles, \
             continue
         
         # Prise en compte de cette version de section
-        try:
-            entree_version_section = Version_section.select().where(
-                (Version_section.id == id) &
-                #(Version_section.id_parent == version_section_parente) &
-                (Version_section.nom == nom) &
-                (Version_section.etat_juridique == etat_juridique) &
-                (Version_section.niveau == niveau) &
-                (Version_section.numero == numero) &
-                (Version_section.vigueur_debut == vigueur_debut) &
-                (Version_section.vigueur_fin == vigueur_fin) &
-                (Version_section.texte == entree_texte)
-            ).get()
-            autres_sections |= {(id, nom, etat_juridique, niveau, numero, \
-                                 vigueur_debut, vigueur_fin, entree_texte.cid)}
-        except Version_section.DoesNotExist:
-            nouvelles_sections |= {(id, nom, etat_juridique, niveau, \
-                                    numero, vigueur_debut, vigueur_fin, \
-                                    entree_texte.cid)}
-            dates |= {vigueur_debut, vigueur_fin}
+        sections.append((id, nom, etat_juridique, niveau, numero, \
+                         vigueur_debut, vigueur_fin))
         
         arbre[id] = version_section_parente
         
-        # Prise en compte des dates de vigueur
-        #dates |= {vigueur_debut, vigueur_fin}
-        
         # Continuer récursivement
-        section_ta = lire_base_section_ta(chemin_base, url)
+        if sections_ta and url in sections_ta:
+            section_ta = sections_ta[url]
+        else:
+            section_ta = lire_base_section_ta(chemin_base, url)
         
-        dates, autres_sections, autres_articles, nouvelles_sections, \
-            nouveaux_articles, arbre = ranger_sections_xml(chemin_base, \
-            section_ta['LIEN_SECTION_TA'], section_ta['LIEN_ART'], \
-            entree_texte, id, dates, autres_sections, autres_articles, \
-            niv+1, nouvelles_sections, nouveaux_articles, date_codification, arbre)
+        parcourir_sections_xml(chemin_base, section_ta['LIEN_SECTION_TA'], \
+                               section_ta['LIEN_ART'], id, niv+1, \
+                               date_codification, sections, articles, arbre, \
+                               sections_ta, afficher)
         
         # Affichage de l’avancement
-        compteur_recursif()
-    
-    return dates, autres_sections, autres_articles, nouvelles_sections, \
-           nouveaux_articles, arbre
+        if afficher:
+            compteur_recursif()
 
 
-def ranger_articles_xml(chemin_base, coll_articles, entree_texte, dates, \
-                        autres_articles, nouveaux_articles, \
-                        date_codification, id_parent, arbre):
+def parcourir_articles_xml(coll_articles, id_parent, date_codification, \
+                           articles, arbre, afficher=True):
     
     # Si pas d’article dans cette section
     if coll_articles == None:
-        return dates, autres_articles, nouveaux_articles, arbre
+        return
     
     # Sinon itérer sur les articles
     for i, article in enumerate(coll_articles):
         
         # Affichage de l’avancement
-        compteur_recursif(i+1, len(coll_articles), True)
+        if afficher:
+            compteur_recursif(i+1, len(coll_articles), True)
         
         # Lecture brute des attributs XML
         id = article['id']
@@ -293,40 +646,25 @@ def ranger_articles_xml(chemin_base, coll_articles, entree_texte, dates, \
             compteur_recursif()
             continue
         
-        # Prise en compte de cette version d’article        
-        try:
-            entree_article = Version_article.select().where(
-                (Version_article.id == id) &
-                #(Version_article.version_section == entree_version_section) &
-                (Version_article.nom == nom) &
-                (Version_article.etat_juridique == etat_juridique) &
-                (Version_article.numero == numero) &
-                (Version_article.vigueur_debut == vigueur_debut) &
-                (Version_article.vigueur_fin == vigueur_fin) &
-                (Version_article.condensat == None) &
-                (Version_article.texte == entree_texte)
-            ).get()
-            autres_articles |= {(id,  nom, etat_juridique, numero, \
-                                 vigueur_debut, vigueur_fin, None, \
-                                 entree_texte.cid)}
-        except Version_article.DoesNotExist:
-            nouveaux_articles |= {(id,  nom, etat_juridique, numero, \
-                                   vigueur_debut, vigueur_fin, None, \
-                                   entree_texte.cid)}
-            dates |= {vigueur_debut, vigueur_fin}
+        # Prise en compte de cette version d’article
+        articles.append((id, nom, etat_juridique, numero, vigueur_debut, \
+                         vigueur_fin))
         
         arbre[id] = id_parent
         
-        # Prise en compte des dates de vigueur
-        #dates |= {vigueur_debut, vigueur_fin}
-        
         # Affichage de l’avancement
-        compteur_recursif()
-    
-    return dates, autres_articles, nouveaux_articles, arbre
+        if afficher:
+            compteur_recursif()
 
 
-def enregistrer_versions_texte(version, livraison, dates, autres_sections, autres_articles, entree_texte, nouvelles_sections, nouveaux_articles, chemin_base, arbre):
+# Enregistrer les versions d’un texte pour une livraison
+# 
+# Les sections et articles de chaque version sont enregistrés selon
+# appartenance : 'listes', une ligne Liste_sections ou Liste_articles par
+# version et par section ou article en vigueur ; 'intervalles', une seule
+# ligne Intervalle_section ou Intervalle_article par section ou article, avec
+# son intervalle de vigueur (cf basededonnees.membres_version_texte).
+def enregistrer_versions_texte(version, livraison, dates, autres_sections, autres_articles, entree_texte, nouvelles_sections, nouveaux_articles, chemin_base, arbre, appartenance='listes'):
     
     # Chercher les versions de textes de cette livraison
     dates = list(dates)
@@ -361,16 +699,10 @@ def enregistrer_versions_texte(version, livraison, dates, autres_sections, autre
                    'chemin': os.path.join(chemin_base, 'article', decompose_cid(article[0]+'.xml'))}
     
     # Import des enregistrements sections et articles
-    # Il ne semble pas possible d’ajouter plus de 500 enregistrements
-    #  par appel à insert_many, dont acte
-    nouvelles_sections = list(nouvelles_sections)
-    nouveaux_articles = list(nouveaux_articles)
-    for i in range(0,int(math.ceil(float(len(nouvelles_sections))/tranches_bdd))):
-        Version_section.insert_many(obtenir_sections(nouvelles_sections[i*tranches_bdd:(i+1)*tranches_bdd])).execute()
-    for i in range(0,int(math.ceil(float(len(nouveaux_articles))/tranches_bdd))):
-        Version_article.insert_many(obtenir_articles(nouveaux_articles[i*tranches_bdd:(i+1)*tranches_bdd])).execute()
-    #for i in range(0,int(math.ceil(float(len(nouveaux_articles))/tranches_bdd))):
-        #Travaux_articles.insert_many(obtenir_travaux_articles(nouveaux_articles[i*tranches_bdd:(i+1)*tranches_bdd], chemin_base)).execute()
+    # (lots dimensionnés d’après le moteur, cf basededonnees.inserer_lignes)
+    inserer_lignes(Version_section, list(obtenir_sections(nouvelles_sections)))
+    inserer_lignes(Version_article, list(obtenir_articles(nouveaux_articles)))
+    #inserer_lignes(Travaux_articles, list(obtenir_travaux_articles(nouveaux_articles, chemin_base)))
     #Version_section.insert_many(obtenir_sections(nouvelles_sections)).execute()
     #Version_article.insert_many(obtenir_articles(nouveaux_articles)).execute()
     #Travaux_articles.insert_many(obtenir_travaux_articles(nouveaux_articles, chemin_base)).execute()
@@ -391,22 +723,17 @@ def enregistrer_versions_texte(version, livraison, dates, autres_sections, autre
         # en faisant varier N1 (N=nouveau) entre avant V1 et V3
         #    V1---------V2-----------V3-------V4-------V5
         #           N1-----------N2                   
-        while not(entree_version_texte.vigueur_debut <= dates[0] and \
-              comp_infini_strict(dates[0], entree_version_texte.vigueur_fin)):
-            if entree_version_texte.version_prec == None:
-                entree_version_texte = None
-                break
-            
-            entree_version_texte = Version_texte.select().where(
-                Version_texte.id == entree_version_texte.version_prec
-            ).get()
+        chaine = ChaineVersions(entree_texte, entree_version_texte.id)
+        id_version = chaine.en_vigueur(dates[0])
         # TODO décider quoi faire si le titre ou une autre donnée
         #      mineure change -> nouvelle branche ? je dirais oui
         #      mais réfléchir finement, e.g. à etat_juridique
-        if entree_version_texte != None and entree_version_texte.version_prec != None:
-            entree_version_texte = Version_texte.select().where(
-                Version_texte.id == entree_version_texte.version_prec
-            ).get()
+        if id_version != None and chaine.precedente(id_version) != None:
+            id_version = chaine.precedente(id_version)
+        entree_version_texte = None
+        if id_version != None:
+            entree_version_texte = Version_texte.get(
+                Version_texte.id == id_version)
         
         # La première nouvelle version est à cheval entre deux
         # versions précédentes, il faut compléter l’intervalle VX-N1
@@ -438,8 +765,16 @@ def enregistrer_versions_texte(version, livraison, dates, autres_sections, autre
             # TODO recopier les sections et articles de VX
             raise NonImplementeException()
     
+    # Sections et articles en vigueur dans chaque version
+    if appartenance == 'listes':
+        sections_versions = balayer_versions(
+            list(set(nouvelles_sections) | autres_sections), dates, 5, 6)
+        articles_versions = balayer_versions(
+            list(set(nouveaux_articles) | autres_articles), dates, 4, 5)
+    
     compteur_recursif(0)
     
+    livraisons_texte = []
     for i in range(len(dates) - 1):
         
         compteur_recursif(i+1, len(dates)-1)
@@ -461,15 +796,19 @@ def enregistrer_versions_texte(version, livraison, dates, autres_sections, autre
         nouvelles_versions |= {entree_version_texte}
         
         # Inscription du lien entre texte, livraison et version de texte #OK
-        Livraison_texte.create(
-            livraison = livraison,
-            version_texte = entree_version_texte,
-            texte = entree_texte
-        )
+        livraisons_texte.append({
+            'livraison': livraison,
+            'version_texte': entree_version_texte,
+            'texte': entree_texte
+        })
+        
+        # Sections et articles enregistrés par intervalles après les versions
+        if appartenance == 'intervalles':
+            compteur_recursif()
+            continue
         
         # Inscription du lien entre livraison et sections
-        sections = list(set(nouvelles_sections) | autres_sections)
-        sections = [section for section in sections if (section[5] <= entree_version_texte.vigueur_debut) and comp_infini_large(entree_version_texte.vigueur_fin, section[6])]
+        sections = next(sections_versions)
         
         def liste_sections(sections, arbre, version_texte):
             for section in sections:
@@ -477,14 +816,10 @@ def enregistrer_versions_texte(version, livraison, dates, autres_sections, autre
                        'version_texte': version_texte,
                        'id_parent': arbre[section[0]]}
         
-        #print('tranches sections={} {} {} {}'.format(len(sections), float(len(sections))/tranches_bdd, math.ceil(float(len(sections))/tranches_bdd), int(math.ceil(float(len(sections))/tranches_bdd))))
-        for i in range(0,int(math.ceil(len(sections)/tranches_bdd))):
-            #print('{}'.format(len(sections[i*tranches_bdd:(i+1)*tranches_bdd])))
-            Liste_sections.insert_many(liste_sections(sections[i*tranches_bdd:(i+1)*tranches_bdd], arbre, entree_version_texte)).execute()
+        inserer_lignes(Liste_sections, list(liste_sections(sections, arbre, entree_version_texte)))
         
         # Inscription du lien entre livraison et articles
-        articles = list(set(nouveaux_articles) | autres_articles)
-        articles = [a for a in articles if (a[4] <= entree_version_texte.vigueur_debut) and comp_infini_large(entree_version_texte.vigueur_fin, a[5])]
+        articles = next(articles_versions)
         
         def liste_articles(articles, arbre, version_texte):
             for article in articles:
@@ -492,127 +827,299 @@ def enregistrer_versions_texte(version, livraison, dates, autres_sections, autre
                        'version_texte': version_texte,
                        'id_parent': arbre[article[0]]}
         
-        #print('tranches articles={} {} {} {}'.format(len(articles), float(len(articles))/tranches_bdd, math.ceil(float(len(articles))/tranches_bdd), int(math.ceil(float(len(articles))/tranches_bdd))))
-        for i in range(0,int(math.ceil(len(articles)/tranches_bdd))):
-            #print('{}'.format(len(articles[i*tranches_bdd:(i+1)*tranches_bdd])))
-            Liste_articles.insert_many(liste_articles(articles[i*tranches_bdd:(i+1)*tranches_bdd], arbre, entree_version_texte)).execute()
+        inserer_lignes(Liste_articles, list(liste_articles(articles, arbre, entree_version_texte)))
         
         compteur_recursif()
     
+    inserer_lignes(Livraison_texte, livraisons_texte)
+    
+    # Inscription des intervalles de vigueur des sections et articles
+    if appartenance == 'intervalles':
+        
+        def intervalles(elements, cle, debut, fin):
+            for element in elements:
+                yield {cle: element[0],
+                       'texte': entree_texte,
+                       'livraison': livraison,
+                       'id_parent': arbre[element[0]],
+                       'vigueur_debut': element[debut],
+                       'vigueur_fin': element[fin]}
+        
+        inserer_lignes(Intervalle_section, list(intervalles( \
+            set(nouvelles_sections) | autres_sections, 'version_section', \
+            5, 6)))
+        inserer_lignes(Intervalle_article, list(intervalles( \
+            set(nouveaux_articles) | autres_articles, 'version_article', \
+            4, 5)))
+    
     # Enregistrer cette livraison du texte comme étant calculée
     entree_texte.livraison = livraison
     entree_texte.save()
 
 
+# Livraisons d’une base, chargées en une fois
+# 
+# Les livraisons sont rangées par date pour les trouver par dichotomie ; la
+# livraison « suivante » d’une livraison (cf livraisons_code_xml) est lue dans
+# un dictionnaire. L’index est rechargé quand une date y manque, pour voir les
+# livraisons ajoutées depuis.
+class IndexLivraisons(object):
+    
+    def __init__(self):
+        self.charger()
+    
+    def charger(self):
+        self.entrees = list(Livraison.select(). \
+                            order_by(Livraison.date, Livraison.id))
+        self.dates = [entree.date for entree in self.entrees]
+        par_id = dict([(entree.id, entree) for entree in self.entrees])
+        self.suivantes = {}
+        for id, id_suivante in Livraison.select(Livraison.id, \
+                Livraison.suivante).order_by(Livraison.id).tuples():
+            if id_suivante is not None and id_suivante not in self.suivantes:
+                self.suivantes[id_suivante] = par_id[id]
+    
+    # Livraison d’une date (comme Livraison.get(Livraison.date == date))
+    def get(self, date, recharger=True):
+        i = bisect.bisect_left(self.dates, date)
+        if i < len(self.dates) and self.dates[i] == date:
+            return self.entrees[i]
+        if recharger:
+            self.charger()
+            return self.get(date, False)
+        raise Livraison.DoesNotExist()
+    
+    # Livraison dont la suivante est celle donnée, ou None (comme
+    # Livraison.get(Livraison.suivante == entree))
+    def suivante(self, entree):
+        return self.suivantes.get(entree.id)
+
+
+# Chaîne des versions d’un texte, chargée en une requête
+# 
+# La chaîne part de la version donnée et remonte les version_prec ; elle est
+# rangée de la plus ancienne à la plus récente, avec les débuts et fins de
+# vigueur dans des listes pour chercher une date par dichotomie.
+class ChaineVersions(object):
+    
+    def __init__(self, entree_texte, id_derniere):
+        
+        versions = {}
+        for id, id_prec, debut, fin in Version_texte.select( \
+                Version_texte.id, Version_texte.version_prec, \
+                Version_texte.vigueur_debut, Version_texte.vigueur_fin). \
+                where(Version_texte.texte == entree_texte).tuples():
+            versions[id] = (id_prec, debut, fin)
+        
+        self.precedentes = {}
+        self.ids = []
+        id = id_derniere
+        while id is not None and id not in self.precedentes:
+            self.precedentes[id] = versions[id][0]
+            self.ids.append(id)
+            id = versions[id][0]
+        self.ids.reverse()
+        self.debuts = [versions[id][1] for id in self.ids]
+        self.fins = [versions[id][2] for id in self.ids]
+        self.triee = None not in self.debuts and \
+                     all(self.debuts[i] <= self.debuts[i+1] \
+                         for i in range(len(self.debuts) - 1))
+    
+    # Version précédente d’une version de la chaîne, ou None
+    def precedente(self, id):
+        return self.precedentes[id]
+    
+    # Version la plus récente de la chaîne en vigueur à une date, ou None
+    def en_vigueur(self, date):
+        i = len(self.ids) - 1
+        if self.triee and date is not None:
+            i = bisect.bisect_right(self.debuts, date) - 1
+        while i >= 0:
+            if (self.debuts[i] is None or self.debuts[i] <= date) and \
+               comp_infini_strict(date, self.fins[i]):
+                return self.ids[i]
+            i -= 1
+        return None
+
+
+# Balayer les versions d’un texte pour y répartir des sections ou articles
+# 
+# La version i va de dates[i] à dates[i+1] ; un élément en fait partie si sa
+# vigueur commence au plus tard à dates[i] et finit au plus tôt à dates[i+1]
+# (None : début ou fin infini). Les versions d’entrée et de sortie de chaque
+# élément sont trouvées une fois par dichotomie, puis les versions sont
+# parcourues dans l’ordre en tenant à jour les éléments en vigueur.
+# 
+# @param list[tuple] elements
+# @param list dates dates des versions triées (cf comp_infini)
+# @param int debut position du début de vigueur dans les éléments
+# @param int fin position de la fin de vigueur dans les éléments
+# @return iterator[list[tuple]] éléments de chaque version, dans l’ordre
+def balayer_versions(elements, dates, debut, fin):
+    
+    finies = dates[:-1] if dates and dates[-1] is None else dates
+    
+    # Entrée : première version commençant après le début de vigueur ;
+    # sortie : première version commençant avec la fin de vigueur ou après
+    entrees = [[] for date in dates]
+    sorties = [[] for date in dates]
+    for element in elements:
+        entree = 0
+        if element[debut] is not None:
+            entree = bisect.bisect_left(finies, element[debut])
+        sortie = len(dates) - 1
+        if element[fin] is not None:
+            sortie = bisect.bisect_right(finies, element[fin]) - 1
+        if entree < sortie:
+            entrees[entree].append(element)
+            sorties[sortie].append(element)
+    
+    en_vigueur = set()
+    for i in range(len(dates) - 1):
+        en_vigueur.update(entrees[i])
+        en_vigueur.difference_update(sorties[i])
+        yield list(en_vigueur)
+
+
+# Utiliser un cache sur le disque des analyses de fichiers XML
+# 
+# Les fichiers inchangés depuis leur dernière analyse (même clé de la source,
+# cf stockage) ne sont alors ni lus ni analysés par les fonctions lire_base_*.
+# 
+# @param str|None chemin fichier SQLite du cache, None pour ne plus en utiliser
+# @param int taille_max taille maximale en octets des résultats enregistrés
+# @return None
+def utiliser_cache_analyses(chemin, taille_max=256 * 1024 * 1024):
+    
+    global cache_analyses
+    
+    if cache_analyses:
+        cache_analyses.close()
+    cache_analyses = CacheAnalyses(chemin, taille_max) if chemin else None
+
+
+# Lire un fichier d’une source et l’analyser, ou reprendre l’analyse du cache
+def lire_analyse(chemin_base, chemin, analyser):
+    
+    source = ouvrir_source(chemin_base)
+    if cache_analyses is None:
+        return analyser(source.lire(chemin))
+    
+    cle = analyser.__name__ + ':' + source.cle(chemin)
+    resultat = cache_analyses.lire(cle)
+    if resultat is None:
+        resultat = analyser(source.lire(chemin))
+        cache_analyses.ecrire(cle, resultat)
+    
+    return resultat
+
+
 # Lire les propriétés du fichier texte/version/[cid].xml
+# (chemin_base : répertoire du texte ou source de fichiers, cf stockage)
 def lire_base_version(chemin_base, cid):
     
-    # Initialiser le dictionnaire résultat
-    version = dict()
-    
-    # Ouvrir le fichier XML
-    chemin_xml = os.path.join(chemin_base, 'texte', 'version', cid + '.xml')
-    if not os.path.exists(chemin_xml):
-        raise FichierNonExistantException()
-    f_version = open(chemin_xml, 'r')
-    soup = BeautifulSoup(f_version.read(), 'xml')
-    f_version.close()
-    
-    # Lecture des éléments englobants
-    META = soup.find('META')
-    META_COMMUN = META.find('META_COMMUN')
-    META_SPEC = META.find('META_SPEC')
-    META_TEXTE_CHRONICLE = META_SPEC.find('META_TEXTE_CHRONICLE')
-    META_TEXTE_VERSION = META_SPEC.find('META_TEXTE_VERSION')
-    
-    # Lecture des éléments feuille
-    version['NATURE'] = META_COMMUN.find('NATURE').text
-    version['CID'] = META_TEXTE_CHRONICLE.find('CID').text
-    version['NOR'] = META_TEXTE_CHRONICLE.find('NOR').text
-    version['DATE_TEXTE'] = META_TEXTE_CHRONICLE.find('DATE_TEXTE').text
-    version['DATE_PUBLI'] = META_TEXTE_CHRONICLE.find('DATE_PUBLI').text
-    version['DERNIERE_MODIFICATION'] = \
-        META_TEXTE_CHRONICLE.find('DERNIERE_MODIFICATION').text
-    version['TITRE'] = META_TEXTE_VERSION.find('TITRE').text
-    version['TITREFULL'] = META_TEXTE_VERSION.find('TITREFULL').text
-    version['DATE_DEBUT'] = META_TEXTE_VERSION.find('DATE_DEBUT').text
-    version['DATE_FIN'] = META_TEXTE_VERSION.find('DATE_FIN').text
-    version['ETAT'] = META_TEXTE_VERSION.find('ETAT').text
-    
-    # Normalisations
-    version['DATE_TEXTE'] = normalise_date(version['DATE_TEXTE'])
-    version['DATE_PUBLI'] = normalise_date(version['DATE_PUBLI'])
-    version['DATE_DEBUT'] = normalise_date(version['DATE_DEBUT'])
-    version['DATE_FIN'] = normalise_date(version['DATE_FIN'])
-    
-    return version
+    return lire_analyse(chemin_base, \
+        os.path.join('texte', 'version', cid + '.xml'), analyser_version)
 
 
 # Lire les propriétés du fichier texte/struct/[cid].xml
 def lire_base_struct(chemin_base, cid):
     
-    # Initialiser le dictionnaire résultat
-    struct = dict()
-    
-    # Ouvrir le fichier XML
-    chemin_xml = os.path.join(chemin_base, 'texte', 'struct', cid + '.xml')
-    if not os.path.exists(chemin_xml):
-        raise Exception()
-    f_struct = open(chemin_xml, 'r')
-    soup = BeautifulSoup(f_struct.read(), 'xml')
-    f_struct.close()
-    
-    # Lecture des éléments englobants
-    META = soup.find('META')
-    META_COMMUN = META.find('META_COMMUN')
-    META_SPEC = META.find('META_SPEC')
-    META_TEXTE_CHRONICLE = META_SPEC.find('META_TEXTE_CHRONICLE')
-    META_TEXTE_VERSION = META_SPEC.find('META_TEXTE_VERSION')
-    VERSIONS = soup.find('VERSIONS')
-    STRUCT = soup.find('STRUCT')
-
-    # Lecture des éléments feuille
-    struct['NATURE'] = META_COMMUN.find('NATURE').text
-    struct['CID'] = META_TEXTE_CHRONICLE.find('CID').text
-    struct['NOR'] = META_TEXTE_CHRONICLE.find('NOR').text
-    struct['DATE_TEXTE'] = META_TEXTE_CHRONICLE.find('DATE_TEXTE').text
-    struct['DATE_PUBLI'] = META_TEXTE_CHRONICLE.find('DATE_PUBLI').text
-    struct['VERSION'] = VERSIONS.find_all('VERSION')
-    struct['VERSION_etat'] = struct['VERSION'][0]['etat']
-    struct['LIEN_TXT'] = struct['VERSION'][0].find('LIEN_TXT')
-    struct['LIEN_TXT_id'] = struct['LIEN_TXT']['id']
-    struct['LIEN_TXT_debut'] = struct['LIEN_TXT']['debut']
-    struct['LIEN_TXT_fin'] = struct['LIEN_TXT']['fin']
-    struct['LIEN_ART'] = STRUCT.find_all('LIEN_ART')
-    struct['LIEN_SECTION_TA'] = STRUCT.find_all('LIEN_SECTION_TA')
-    
-    # Normalisations
-    struct['DATE_TEXTE'] = normalise_date(struct['DATE_TEXTE'])
-    struct['DATE_PUBLI'] = normalise_date(struct['DATE_PUBLI'])
-    
-    return struct
+    return lire_analyse(chemin_base, \
+        os.path.join('texte', 'struct', cid + '.xml'), analyser_struct)
 
 
 # Lire les propriétés du fichier section_ta/[chemin_id]
 def lire_base_section_ta(chemin_base, chemin_id):
     
-    # Initialiser le dictionnaire résultat
-    section_ta = dict()
+    return lire_analyse(chemin_base, \
+        os.path.join('section_ta', chemin_id), analyser_section_ta)
+
+
+# Lire et analyser tous les fichiers section_ta atteignables depuis des liens
+# 
+# L’arborescence est parcourue en largeur : les fichiers d’un niveau sont
+# analysés ensemble, par le pool s’il est donné, puis leurs liens donnent le
+# niveau suivant (10 niveaux au plus, comme dans les specs). Seul le processus
+# principal consulte et remplit le cache des analyses. Les processus lisent
+# eux-mêmes les fichiers d’un répertoire ; ceux des autres sources sont lus
+# par le processus principal et seul leur contenu est transmis.
+# 
+# Le pool est créé par l’appelant pour tout un rangement (cf ranger_archive),
+# et non à chaque texte.
+# 
+# @param str|object chemin_base répertoire du texte ou source de fichiers
+# @param list[Lien] liens_sections liens LIEN_SECTION_TA du premier niveau
+# @param multiprocessing.Pool|None pool processus d’analyse, None pour tout
+#                                       analyser dans ce processus
+# @return dict section_ta analysés (cf lire_base_section_ta), par chemin
+#              ('url' du lien sans le premier caractère)
+def lire_sections_ta(chemin_base, liens_sections, pool=None):
+    
+    source = ouvrir_source(chemin_base)
+    sections_ta = {}
     
-    # Ouvrir le fichier XML
-    chemin_xml = os.path.join(chemin_base, 'section_ta', chemin_id)
-    f_section_ta = open(chemin_xml, 'r')
-    soup = BeautifulSoup(f_section_ta.read(), 'xml')
-    f_section_ta.close()
+    urls = [lien['url'][1:] for lien in liens_sections]
+    niv = 1
+    while urls and niv <= 10:
+        
+        # Fichiers de ce niveau pas encore analysés, chacun une fois
+        a_lire = []
+        for url in urls:
+            if url not in sections_ta:
+                sections_ta[url] = None
+                a_lire.append(url)
+        
+        # Reprendre les analyses du cache
+        cles = {}
+        a_analyser = []
+        for url in a_lire:
+            chemin = os.path.join('section_ta', url)
+            if cache_analyses is not None:
+                cles[url] = 'analyser_section_ta:' + source.cle(chemin)
+                sections_ta[url] = cache_analyses.lire(cles[url])
+            if sections_ta[url] is None:
+                if isinstance(source, Repertoire):
+                    a_analyser.append((source, chemin, None))
+                else:
+                    a_analyser.append((None, chemin, source.lire(chemin)))
+        
+        # Analyser les autres
+        if pool and len(a_analyser) > 1:
+            resultats = pool.map(analyser_fichier_section_ta, a_analyser)
+        else:
+            resultats = [analyser_fichier_section_ta(tache) \
+                         for tache in a_analyser]
+        for (source_tache, chemin, contenu), section_ta \
+                in zip(a_analyser, resultats):
+            url = chemin[len('section_ta')+1:]
+            sections_ta[url] = section_ta
+            if cache_analyses is not None:
+                cache_analyses.ecrire(cles[url], section_ta)
+        
+        # Niveau suivant
+        urls = [lien['url'][1:] for url in a_lire \
+                for lien in sections_ta[url]['LIEN_SECTION_TA']]
+        niv += 1
     
-    # Lecture des éléments englobants
-    STRUCTURE_TA = soup.find('STRUCTURE_TA')
+    return sections_ta
+
+
+# Analyser un fichier section_ta, à lire dans un répertoire ou déjà lu
+# 
+# La fonction est au niveau du module pour pouvoir être appelée depuis un
+# multiprocessing.Pool.
+# 
+# @param (Repertoire|None, str, bytes|None) tache source et chemin du fichier,
+#                                                 ou son contenu déjà lu
+# @return dict section_ta analysé (cf lire_base_section_ta)
+def analyser_fichier_section_ta(tache):
     
-    # Lecture des éléments feuille
-    section_ta['LIEN_SECTION_TA'] = STRUCTURE_TA.find_all('LIEN_SECTION_TA')
-    section_ta['LIEN_ART'] = STRUCTURE_TA.find_all('LIEN_ART')
+    source, chemin, contenu = tache
+    if contenu is None:
+        contenu = source.lire(chemin)
     
-    return section_ta
+    return analyser_section_ta(contenu)
 
 
 # Compteur récursif
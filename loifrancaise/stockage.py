@@ -0,0 +1,610 @@
+# -*- coding: utf-8 -*-
+# 
+# Loifrançaise – Bibliothèque de manipulation de la loi française
+# – ce module donne un accès uniforme aux fichiers XML d’une base, qu’ils
+#   soient dans un répertoire, en mémoire ou dans un paquet
+# 
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# the LICENSE file for more details.
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import zlib
+import errno
+import shutil
+import sqlite3
+import hashlib
+from datetime import datetime
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from loifrancaise import FichierNonExistantException
+from loifrancaise.archives import filtre_membres
+from loifrancaise.archives import parcourir_archive
+from loifrancaise.archives import est_liste_suppression
+from loifrancaise.archives import lire_liste_suppression
+
+
+
+#
+# Constantes
+#
+
+# Fichiers d’un paquet : contenus compressés mis bout à bout et index SQLite
+fichier_contenus_paquet = 'paquet.contenus'
+fichier_index_paquet = 'paquet.sqlite'
+
+# Schéma de l’index d’un paquet
+# - contenus : position et taille (compressée) de chaque contenu distinct,
+#   désigné par son condensat SHA-1
+# - livraisons : livraisons enregistrées, numérotées dans l’ordre des dates
+# - chemins : contenu de chaque chemin pendant un intervalle de livraisons
+#   [debut, fin[ (fin nulle tant que le chemin n’a pas changé)
+schema_paquet = '''
+CREATE TABLE IF NOT EXISTS contenus (
+    condensat TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    taille INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS livraisons (
+    id INTEGER PRIMARY KEY,
+    date TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chemins (
+    chemin TEXT NOT NULL,
+    debut INTEGER NOT NULL,
+    fin INTEGER,
+    condensat TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chemins_debut ON chemins (chemin, debut);
+CREATE INDEX IF NOT EXISTS chemins_ouverts ON chemins (fin, chemin);
+'''
+
+# Schéma d’un cache d’analyses : résultat sérialisé (pickle compressé) de
+# chaque clé, avec sa taille et son rang de dernier accès
+schema_cache_analyses = '''
+CREATE TABLE IF NOT EXISTS analyses (
+    cle TEXT PRIMARY KEY,
+    valeur BLOB NOT NULL,
+    taille INTEGER NOT NULL,
+    acces INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_acces ON analyses (acces);
+'''
+
+# Version du format des résultats enregistrés dans un cache d’analyses, à
+# incrémenter quand il change pour ignorer les anciens résultats
+version_cache_analyses = 1
+
+# Nombre d’opérations d’un cache d’analyses regroupées par transaction
+operations_cache_analyses = 100
+
+# Requête ioctl FICLONE de Linux : copie d’un fichier partageant ses blocs
+# avec l’original (reflink), sur les systèmes de fichiers qui le permettent
+FICLONE = 0x40049409
+
+# Erreurs signifiant que le reflink n’est pas possible sur ce système
+erreurs_reflink = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+                   errno.ENOSYS)
+
+
+
+#
+# Sources de fichiers
+# 
+# Une source donne accès à une arborescence de fichiers par des chemins
+# relatifs :
+# - lire(chemin) renvoie le contenu brut du fichier ou lève
+#   FichierNonExistantException,
+# - existe(chemin) indique si le fichier existe,
+# - cle(chemin) renvoie une clé qui change quand le contenu du fichier change
+#   (voir CacheAnalyses) ou lève FichierNonExistantException,
+# - sous_source(chemin) renvoie la source enracinée dans un sous-répertoire.
+#
+
+# Source de fichiers : un répertoire du système de fichiers
+class Repertoire(object):
+    
+    def __init__(self, racine):
+        self.racine = racine
+    
+    def lire(self, chemin):
+        chemin = os.path.join(self.racine, chemin)
+        if not os.path.isfile(chemin):
+            raise FichierNonExistantException()
+        with open(chemin, 'rb') as fd:
+            return fd.read()
+    
+    def existe(self, chemin):
+        return os.path.isfile(os.path.join(self.racine, chemin))
+    
+    # Clé : chemin absolu, taille et date de modification
+    def cle(self, chemin):
+        chemin = os.path.abspath(os.path.join(self.racine, chemin))
+        try:
+            etat = os.stat(chemin)
+        except OSError:
+            raise FichierNonExistantException()
+        return '%s:%d:%r' % (chemin, etat.st_size, etat.st_mtime)
+    
+    def sous_source(self, chemin):
+        return Repertoire(os.path.join(self.racine, chemin))
+
+
+# Source de fichiers : des contenus en mémoire, éventuellement superposés à
+# une source parente
+# 
+# Les chemins supprimés masquent ceux de la source parente et ceux des
+# contenus (comme dans un dump incrémental, où les suppressions sont
+# appliquées après l’extraction). Une source Memoire parente est fusionnée
+# dès la création, pour ne pas empiler les niveaux d’une livraison à l’autre :
+# ses suppressions ne sont gardées que pour les chemins que cette livraison
+# ne réécrit pas.
+class Memoire(object):
+    
+    def __init__(self, contenus=None, parent=None, supprimes=()):
+        
+        supprimes = set(supprimes)
+        contenus = dict([(chemin, contenu) \
+                         for chemin, contenu in (contenus or {}).items() \
+                         if chemin not in supprimes])
+        
+        if isinstance(parent, Memoire):
+            fusion = dict([(chemin, contenu) \
+                           for chemin, contenu in parent.contenus.items() \
+                           if chemin not in supprimes])
+            fusion.update(contenus)
+            supprimes |= parent.supprimes - set(contenus)
+            contenus = fusion
+            parent = parent.parent
+        
+        self.contenus = contenus
+        self.supprimes = supprimes
+        self.parent = parent
+    
+    def lire(self, chemin):
+        if chemin in self.contenus:
+            return self.contenus[chemin]
+        if chemin in self.supprimes or not self.parent:
+            raise FichierNonExistantException()
+        return self.parent.lire(chemin)
+    
+    def existe(self, chemin):
+        if chemin in self.contenus:
+            return True
+        if chemin in self.supprimes or not self.parent:
+            return False
+        return self.parent.existe(chemin)
+    
+    # Clé : condensat du contenu
+    def cle(self, chemin):
+        if chemin in self.contenus:
+            return hashlib.sha1(self.contenus[chemin]).hexdigest()
+        if chemin in self.supprimes or not self.parent:
+            raise FichierNonExistantException()
+        return self.parent.cle(chemin)
+    
+    def sous_source(self, chemin):
+        return SousSource(self, chemin)
+
+
+# Source de fichiers : une livraison enregistrée dans un paquet (voir Paquet)
+class VuePaquet(object):
+    
+    def __init__(self, paquet, livraison):
+        self.paquet = paquet
+        self.livraison = livraison
+    
+    def lire(self, chemin):
+        return self.paquet.lire(chemin, self.livraison)
+    
+    def existe(self, chemin):
+        return self.paquet.condensat(chemin, self.livraison) is not None
+    
+    # Clé : condensat du contenu, déjà dans l’index
+    def cle(self, chemin):
+        condensat = self.paquet.condensat(chemin, self.livraison)
+        if condensat is None:
+            raise FichierNonExistantException()
+        return condensat
+    
+    def sous_source(self, chemin):
+        return SousSource(self, chemin)
+
+
+# Source de fichiers : un sous-répertoire d’une autre source
+class SousSource(object):
+    
+    def __init__(self, source, prefixe):
+        self.source = source
+        self.prefixe = prefixe
+    
+    def lire(self, chemin):
+        return self.source.lire(os.path.join(self.prefixe, chemin))
+    
+    def existe(self, chemin):
+        return self.source.existe(os.path.join(self.prefixe, chemin))
+    
+    def cle(self, chemin):
+        return self.source.cle(os.path.join(self.prefixe, chemin))
+    
+    def sous_source(self, chemin):
+        return SousSource(self.source, os.path.join(self.prefixe, chemin))
+
+
+
+#
+# Paquet
+#
+
+# Paquet de fichiers adressés par leur contenu
+# 
+# Chaque contenu distinct n’est enregistré qu’une fois, compressé, quel que
+# soit le nombre de chemins et de livraisons où il apparaît ; l’index donne
+# pour chaque chemin les intervalles de livraisons où il a un même contenu.
+# Les livraisons sont ajoutées dans l’ordre chronologique, chacune dans une
+# transaction : une livraison interrompue n’est pas enregistrée.
+class Paquet(object):
+    
+    def __init__(self, dossier):
+        
+        if not os.path.exists(dossier):
+            os.makedirs(dossier)
+        self.dossier = dossier
+        self.index = sqlite3.connect(os.path.join(dossier, \
+                                                  fichier_index_paquet))
+        self.index.executescript(schema_paquet)
+        # Chemins vus dans un dump complet ; la table est créée ici car
+        # sqlite3 (Python 2) valide la transaction en cours avant un CREATE
+        self.index.execute('CREATE TEMP TABLE vus (chemin TEXT PRIMARY KEY)')
+        self.contenus = open(os.path.join(dossier, fichier_contenus_paquet), \
+                             'a+b')
+    
+    def close(self):
+        self.contenus.close()
+        self.index.close()
+    
+    # Dates des livraisons enregistrées
+    # 
+    # @return list[datetime]
+    def livraisons(self):
+        return [datetime.strptime(date, '%Y%m%d-%H%M%S') for (date,) in \
+                self.index.execute('SELECT date FROM livraisons ORDER BY id')]
+    
+    # Numéro de la livraison en vigueur à une date
+    # 
+    # @param datetime|None date None pour la dernière livraison
+    # @return int|None
+    def numero(self, date=None):
+        if date is None:
+            ligne = self.index.execute('SELECT MAX(id) FROM livraisons') \
+                              .fetchone()
+        else:
+            ligne = self.index.execute('SELECT MAX(id) FROM livraisons ' \
+                                       'WHERE date <= ?', \
+                                       (date.strftime('%Y%m%d-%H%M%S'),)) \
+                              .fetchone()
+        return ligne[0]
+    
+    # Source de fichiers d’une livraison
+    # 
+    # @param datetime|None date None pour la dernière livraison
+    # @return VuePaquet
+    # @raise FichierNonExistantException si aucune livraison n’est enregistrée
+    def vue(self, date=None):
+        numero = self.numero(date)
+        if numero is None:
+            raise FichierNonExistantException()
+        return VuePaquet(self, numero)
+    
+    def condensat(self, chemin, livraison):
+        ligne = self.index.execute('SELECT condensat FROM chemins ' \
+                                   'WHERE chemin = ? AND debut <= ? ' \
+                                   'AND (fin IS NULL OR fin > ?)', \
+                                   (chemin, livraison, livraison)).fetchone()
+        return ligne and ligne[0]
+    
+    def lire(self, chemin, livraison):
+        condensat = self.condensat(chemin, livraison)
+        if condensat is None:
+            raise FichierNonExistantException()
+        position, taille = self.index.execute('SELECT position, taille ' \
+                                              'FROM contenus WHERE ' \
+                                              'condensat = ?', \
+                                              (condensat,)).fetchone()
+        self.contenus.seek(position)
+        return zlib.decompress(self.contenus.read(taille))
+    
+    # Enregistrer une livraison depuis son archive
+    # 
+    # Les fichiers sont lus en flux, sans extraction ; la liste de suppression
+    # est appliquée après les fichiers de la livraison. Un dump complet
+    # remplace tout le contenu : les chemins qu’il ne contient pas sont
+    # fermés.
+    # 
+    # @param datetime date date de la livraison
+    # @param str chemin_archive archive TAR gzippée
+    # @param bool fondation True pour un dump complet
+    # @param None|str|list[str]|callable filtre ne garder que les fichiers
+    #                                           retenus (voir
+    #                                           archives.filtre_membres)
+    # @return bool False si la livraison était déjà enregistrée
+    # @raise ValueError si une livraison plus récente est déjà enregistrée
+    # @raise IOError, tarfile.TarError
+    def ajouter_archive(self, date, chemin_archive, fondation=False,
+                        filtre=None):
+        
+        cle = date.strftime('%Y%m%d-%H%M%S')
+        if self.index.execute('SELECT 1 FROM livraisons WHERE date = ?', \
+                              (cle,)).fetchone():
+            return False
+        if self.index.execute('SELECT 1 FROM livraisons WHERE date > ?', \
+                              (cle,)).fetchone():
+            raise ValueError()
+        
+        with self.index:
+            curseur = self.index.cursor()
+            curseur.execute('INSERT INTO livraisons (date) VALUES (?)', \
+                            (cle,))
+            numero = curseur.lastrowid
+            
+            suppressions = []
+            self.contenus.seek(0, os.SEEK_END)
+            position = self.contenus.tell()
+            retenir = filtre_membres(filtre)
+            for chemin, contenu in parcourir_archive(chemin_archive, retenir):
+                
+                if est_liste_suppression(chemin):
+                    suppressions = lire_liste_suppression(contenu)
+                    continue
+                if fondation:
+                    curseur.execute('INSERT OR IGNORE INTO vus VALUES (?)', \
+                                    (chemin,))
+                
+                # Enregistrer le contenu s’il est nouveau
+                condensat = hashlib.sha1(contenu).hexdigest()
+                if not curseur.execute('SELECT 1 FROM contenus WHERE ' \
+                                       'condensat = ?', (condensat,)) \
+                              .fetchone():
+                    compresse = zlib.compress(contenu)
+                    self.contenus.write(compresse)
+                    curseur.execute('INSERT INTO contenus VALUES (?, ?, ?)', \
+                                    (condensat, position, len(compresse)))
+                    position += len(compresse)
+                
+                # Ouvrir un nouvel intervalle si le contenu a changé
+                ouvert = curseur.execute('SELECT rowid, condensat ' \
+                                         'FROM chemins WHERE chemin = ? ' \
+                                         'AND fin IS NULL', (chemin,)) \
+                                .fetchone()
+                if ouvert and ouvert[1] == condensat:
+                    continue
+                if ouvert:
+                    curseur.execute('UPDATE chemins SET fin = ? ' \
+                                    'WHERE rowid = ?', (numero, ouvert[0]))
+                curseur.execute('INSERT INTO chemins VALUES (?, ?, NULL, ?)', \
+                                (chemin, numero, condensat))
+            
+            # Fermer les chemins supprimés, ou absents d’un dump complet
+            curseur.executemany('UPDATE chemins SET fin = ? ' \
+                                'WHERE chemin = ? AND fin IS NULL', \
+                                [(numero, chemin) for chemin in suppressions \
+                                 if not retenir or retenir(chemin)])
+            if fondation:
+                curseur.execute('UPDATE chemins SET fin = ? ' \
+                                'WHERE fin IS NULL AND debut < ? ' \
+                                'AND chemin NOT IN (SELECT chemin FROM vus)', \
+                                (numero, numero))
+                curseur.execute('DELETE FROM vus')
+            
+            # Les contenus doivent être sur le disque avant la validation
+            self.contenus.flush()
+            os.fsync(self.contenus.fileno())
+        
+        return True
+
+
+
+#
+# Cache d’analyses
+#
+
+# Cache sur le disque de résultats d’analyse de fichiers
+# 
+# Les résultats sont sérialisés (pickle, compressé) dans une base SQLite,
+# sous une clé qui change avec le contenu du fichier analysé (voir cle()
+# des sources). Au-delà de taille_max octets, les résultats les moins
+# récemment lus sont retirés. C’est un cache : la base n’est pas
+# synchronisée sur le disque, les opérations sont validées par groupes de
+# operations_cache_analyses (et à la fermeture), et un résultat illisible
+# est simplement recalculé.
+class CacheAnalyses(object):
+    
+    def __init__(self, chemin, taille_max=256 * 1024 * 1024):
+        
+        if os.path.dirname(chemin) and not os.path.exists( \
+                                               os.path.dirname(chemin)):
+            os.makedirs(os.path.dirname(chemin))
+        self.taille_max = taille_max
+        self.index = sqlite3.connect(chemin)
+        self.index.execute('PRAGMA synchronous = OFF')
+        self.index.executescript(schema_cache_analyses)
+        self.taille, self.acces = self.index.execute( \
+            'SELECT COALESCE(SUM(taille), 0), COALESCE(MAX(acces), 0) ' \
+            'FROM analyses').fetchone()
+        self.operations = 0
+    
+    def close(self):
+        self.index.commit()
+        self.index.close()
+    
+    # Valider les opérations en cours par groupes
+    def operation(self):
+        self.operations += 1
+        if self.operations >= operations_cache_analyses:
+            self.index.commit()
+            self.operations = 0
+    
+    # Lire un résultat
+    # 
+    # @param str cle
+    # @return objet enregistré, ou None s’il est absent
+    def lire(self, cle):
+        cle = '%d:%s' % (version_cache_analyses, cle)
+        ligne = self.index.execute('SELECT valeur FROM analyses ' \
+                                   'WHERE cle = ?', (cle,)).fetchone()
+        if ligne is None:
+            return None
+        try:
+            valeur = pickle.loads(zlib.decompress(bytes(ligne[0])))
+        except Exception:
+            return None
+        self.acces += 1
+        self.index.execute('UPDATE analyses SET acces = ? WHERE cle = ?', \
+                           (self.acces, cle))
+        self.operation()
+        return valeur
+    
+    # Enregistrer un résultat, en retirant au besoin les plus anciens
+    # 
+    # @param str cle
+    # @param objet valeur
+    # @return None
+    def ecrire(self, cle, valeur):
+        cle = '%d:%s' % (version_cache_analyses, cle)
+        contenu = zlib.compress(pickle.dumps(valeur, 2))
+        self.acces += 1
+        ancienne = self.index.execute('SELECT taille FROM analyses ' \
+                                      'WHERE cle = ?', (cle,)).fetchone()
+        self.index.execute('INSERT OR REPLACE INTO analyses ' \
+                           '(cle, valeur, taille, acces) VALUES (?, ?, ?, ?)', \
+                           (cle, sqlite3.Binary(contenu), len(contenu), \
+                            self.acces))
+        self.taille += len(contenu) - (ancienne[0] if ancienne else 0)
+        self.operation()
+        
+        # Retirer les moins récemment lus jusqu’à 90 % de la taille maximale
+        if self.taille <= self.taille_max:
+            return
+        while self.taille > self.taille_max * 9 // 10:
+            lignes = self.index.execute('SELECT cle, taille FROM analyses ' \
+                                        'ORDER BY acces LIMIT 100').fetchall()
+            if not lignes:
+                break
+            for cle, taille in lignes:
+                if self.taille <= self.taille_max * 9 // 10:
+                    break
+                self.index.execute('DELETE FROM analyses WHERE cle = ?', \
+                                   (cle,))
+                self.taille -= taille
+
+
+
+#
+# Fonctions
+#
+
+# Obtenir une source de fichiers
+# 
+# @param str|source chemin_base chemin d’un répertoire ou source déjà ouverte
+# @return source
+def ouvrir_source(chemin_base):
+    
+    if isinstance(chemin_base, (str, unicode)):
+        return Repertoire(chemin_base)
+    
+    return chemin_base
+
+
+# Lier un fichier à un nouveau chemin sans recopier son contenu
+# 
+# Une copie reflink (blocs partagés, fichier indépendant) est tentée d’abord ;
+# si le système de fichiers ne le permet pas, un lien physique est créé, et
+# une vraie copie seulement si le fichier a atteint le nombre maximal de liens.
+# Un lien physique partage le fichier : il ne doit plus être modifié sur
+# place, mais remplacé (écriture à côté puis renommage).
+# 
+# @param str source chemin du fichier existant
+# @param str destination nouveau chemin
+# @param list[bool] reflink [True] pour tenter le reflink ; mis à [False] au
+#                           premier échec, pour les appels suivants
+# @return None
+# @raise OSError, IOError
+def lier_fichier(source, destination, reflink):
+    
+    if reflink[0] and fcntl:
+        try:
+            with open(source, 'rb') as fs:
+                with open(destination, 'wb') as fd:
+                    fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            shutil.copystat(source, destination)
+            return
+        except (IOError, OSError) as e:
+            if os.path.exists(destination):
+                os.remove(destination)
+            if e.errno not in erreurs_reflink:
+                raise
+            reflink[0] = False
+    
+    try:
+        os.link(source, destination)
+    except OSError as e:
+        if e.errno != errno.EMLINK:
+            raise
+        shutil.copy2(source, destination)
+
+
+# Cloner une arborescence de fichiers sans recopier les contenus
+# 
+# Les répertoires sont recréés et chaque fichier est lié (voir lier_fichier).
+# 
+# @param str source répertoire existant
+# @param str destination répertoire à créer
+# @param bool reflink tenter des copies reflink plutôt que des liens physiques
+# @return None
+# @raise OSError, IOError
+def cloner_arbre(source, destination, reflink=True):
+    
+    reflink = [reflink]
+    for racine, dossiers, fichiers in os.walk(source):
+        cible = os.path.normpath(os.path.join(destination, \
+                                 os.path.relpath(racine, source)))
+        os.mkdir(cible)
+        shutil.copystat(racine, cible)
+        for fichier in fichiers:
+            lier_fichier(os.path.join(racine, fichier), \
+                         os.path.join(cible, fichier), reflink)
+
+
+# Calculer le condensat d’un fichier
+# 
+# Le fichier est lu par blocs. La fonction est au niveau du module pour
+# pouvoir être appelée depuis un multiprocessing.Pool.
+# 
+# @param str chemin
+# @return str condensat SHA-1 hexadécimal
+# @raise IOError
+def condenser_fichier(chemin):
+    
+    condensat = hashlib.sha1()
+    with open(chemin, 'rb') as fd:
+        for bloc in iter(lambda: fd.read(1024 * 1024), b''):
+            condensat.update(bloc)
+    
+    return condensat.hexdigest()
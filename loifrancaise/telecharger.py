@@ -17,13 +17,44 @@ from __future__ import print_function
 
 import os
 import re
+import json
 import string
+import hashlib
 import shutil
-import tarfile
 import ftplib
+import threading
 import subprocess
+import multiprocessing
+import time
+import calendar
+import _strptime  # datetime.strptime n’est pas sûr dans plusieurs fils
+                  # d’exécution sans cet import préalable
 from datetime import datetime, timedelta, tzinfo
 
+from loifrancaise import FichierNonExistantException
+from loifrancaise.utilitaires import telecharger
+from loifrancaise.utilitaires import telecharger_cache
+from loifrancaise.archives import zstandard
+from loifrancaise.archives import ouvrir_archive
+from loifrancaise.archives import membres_archive
+from loifrancaise.archives import filtre_membres
+from loifrancaise.archives import inventorier_archive
+from loifrancaise.archives import est_liste_suppression
+from loifrancaise.archives import lire_liste_suppression
+from loifrancaise.archives import lire_membre_archive
+from loifrancaise.archives import membre_supprime
+from loifrancaise.archives import nom_transcode
+from loifrancaise.archives import copie_transcodee
+from loifrancaise.archives import transcoder_archive
+from loifrancaise.archives import compacter_archives
+from loifrancaise.archives import condenser_archive
+from loifrancaise.archives import suffixe_index
+from loifrancaise.archives import suffixe_points_reprise
+from loifrancaise.archives import suffixe_table_trames
+from loifrancaise.stockage import Paquet
+from loifrancaise.stockage import cloner_arbre
+from loifrancaise.stockage import condenser_fichier
+
 
 
 #
@@ -91,12 +122,37 @@ class CEST(tzinfo):
         else:
             return "CEST"
 
-# Noms standards de fichiers pour enregistrer des métadonnées de dates
-# de mises à jour dans les bases juridiques XML
+# Journal d’installation, dans le dossier de chaque base juridique XML : une
+# ligne JSON par événement, écrite sur le disque avant de poursuivre (voir
+# lire_journal)
+# - {"debut": ['AAAAMMJJ-HHMMSS', …], "type": …} : début de l’installation de
+#    livraisons ('fond', 'majo', 'rattrapage', 'paquet', 'git', 'instantane',
+#    'migration')
+# - {"archive": i, "membres": n} : les n premiers membres de la i-ème archive
+#    de l’installation en cours sont extraits
+# - {"suppressions": true} : les suppressions de l’installation en cours sont
+#    appliquées
+# - {"fin": true} : l’installation en cours est terminée
+# - {"abandon": true} : l’installation en cours est abandonnée, ses livraisons
+#    ne sont pas installées
+# - {"effacement": true} : le dossier de la base va être vidé
+fichier_journal = 'journal-installation.txt'
+
+# Nombre de membres extraits entre deux points de reprise du journal
+intervalle_journal = 1000
+
+# Fichiers de métadonnées des anciennes versions, repris dans le journal à sa
+# première lecture
 fichier_drapeau = 'installation-en-cours.txt'
 fichier_livraison = 'livraison.txt'
 fichier_historique = 'historique.txt'
 
+# Nom du manifeste des livraisons, enregistré dans le dossier des fichiers
+# téléchargés : pour chaque livraison (clé 'AAAAMMJJ-HHMMSS'), son type
+# ('fond' ou 'majo'), son nom et sa taille sur le serveur, son nom et sa
+# taille en local et le condensat SHA-256 du fichier local
+fichier_manifeste = 'manifeste-BASE.json'
+
 
 
 #
@@ -118,6 +174,9 @@ class DossierIncoherentException(Exception):
 class LivraisonManquanteException(Exception):
     pass
 
+class SynchronisationException(Exception):
+    pass
+
 
 
 #
@@ -126,53 +185,44 @@ class LivraisonManquanteException(Exception):
 
 # Télécharger les dates des livraisons d’une base juridique
 # 
+# La liste des fichiers du serveur est obtenue en une seule commande (MLSD si
+# le serveur la connaît, NLST sinon) et reportée dans le manifeste des
+# livraisons si un dossier est donné.
+# 
 # @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
 #                       'CONSTIT', 'CIRCULAIRES')
+# @param str|None dossier dossier des fichiers téléchargés et du manifeste
+# @param ftplib.FTP|None connexion connexion à réutiliser (non fermée)
 # @return list[datetime] dates
 # @raise NomBaseError, ConnexionException, StructureRepertoireException
-def telecharger_dates_base(base):
+def telecharger_dates_base(base, dossier=None, connexion=None):
     
     # Vérification des paramètres
     if base not in bases:
         raise NomBaseError()
     
-    # Connexion FTP
-    try:
-        connexion = ftplib.FTP()
-        connexion.connect(serveurs[base][0], serveurs[base][1])
-        connexion.login(serveurs[base][2], serveurs[base][3])
-    except:
-        connexion.close()
-        raise ConnexionException()
-    
-    # Reconnaître les dates des fichiers
-    connexion.cwd(serveurs[base][4])
-    fichiers = connexion.nlst()
-    
-    # Clôturer la connexion
-    connexion.close()
+    # Lire le manifeste existant
+    manifeste = {}
+    if dossier:
+        manifeste = lire_manifeste(base, dossier)
     
-    # Ajouter le dump complet
-    dates = []
-    for fichier in fichiers:
+    # Connexion FTP
+    if connexion:
+        manifeste = rafraichir_manifeste(base, connexion, manifeste)
+    else:
+        connexion = connexion_ftp(base)
         try:
-            dates.append(datetime.strptime(fichier, fichiers_base[base]))
-        except ValueError:
-            pass
-    
-    # Vérifier l’intégrité du répertoire
-    if len(dates) != 1:
-        raise StructureRepertoireException()
+            manifeste = rafraichir_manifeste(base, connexion, manifeste)
+        finally:
+            connexion.close()
     
-    # Ajouter les dumps incrémentaux
-    for fichier in fichiers:
-        try:
-            dates.append(datetime.strptime(fichier, fichiers_majo[base]))
-        except ValueError:
-            pass
+    # Enregistrer le manifeste
+    if dossier:
+        ecrire_manifeste(base, dossier, manifeste)
     
     # Ranger les dates par ordre chronologique
-    dates = sorted(dates)
+    dates = sorted([datetime.strptime(cle, '%Y%m%d-%H%M%S') \
+                    for cle in manifeste if manifeste[cle]['distant']])
     
     return dates
 
@@ -192,11 +242,19 @@ def telecharger_dates_base(base):
 # @param str nom_majo format des noms de fichiers de mise à jour
 #                     (chaînes '%s' pour les variables de temps (cf datetime),
 #                     'BASE' pour le nom de la base XML)
+# @param int connexions nombre maximal de connexions FTP simultanées
+# @param threading.Semaphore|None limite jetons à prendre pour chaque
+#                                       connexion ouverte, partagés par
+#                                       toutes les bases d’un même serveur
+# @param bool transcodage recopier chaque archive en trames zstd (voir
+#                         archives.transcoder_archive), plus rapides à
+#                         décompresser lors des installations suivantes
 # @return list[datetime] dates livraisons téléchargées
-# @raise NomBaseError, ConnexionException, ValueError, IOError
+# @raise NomBaseError, ConnexionException, ValueError, IOError, ImportError
 def telecharger_base(base, dossier='.', livraison=-1,
                      nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
-                     nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+                     nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz',
+                     connexions=1, limite=None, transcodage=False):
     
     # Vérification des paramètres
     if base not in bases:
@@ -208,13 +266,20 @@ def telecharger_base(base, dossier='.', livraison=-1,
     if not isinstance(livraison, (datetime, int)): raise ValueError()
     if not isinstance(nom_base, (str, unicode)): raise ValueError()
     if not isinstance(nom_majo, (str, unicode)): raise ValueError()
+    if not isinstance(connexions, int) or connexions < 1: raise ValueError()
     
     # Créer le dossier des fichiers téléchargés
     if not os.path.exists(dossier):
         os.makedirs(dossier)
     
-    # Obtenir les dates des livraisons
-    dates = telecharger_dates_base(base)
+    # Obtenir les dates des livraisons et mettre à jour le manifeste
+    connexion = connexion_ftp(base, limite)
+    try:
+        dates = telecharger_dates_base(base, dossier, connexion)
+    except:
+        connexion.close()
+        raise
+    manifeste = lire_manifeste(base, dossier)
     
     # Filtrer les livraisons voulues
     if isinstance(livraison, datetime):
@@ -222,37 +287,89 @@ def telecharger_base(base, dossier='.', livraison=-1,
     else:
         dates = dates[0:1+livraison%len(dates)]
     
-    # Connexion FTP
-    try:
-        connexion = ftplib.FTP()
-        connexion.connect(serveurs[base][0], serveurs[base][1])
-        connexion.login(serveurs[base][2], serveurs[base][3])
-    except:
-        connexion.close()
-        raise ConnexionException()
+    # Lister les fichiers absents ou incomplets : le dump complet puis les
+    # dumps incrémentaux
+    fichiers = []
+    for date in dates:
+        cle = date.strftime('%Y%m%d-%H%M%S')
+        entree = manifeste[cle]
+        nom = nom_base if entree['type'] == 'fond' else nom_majo
+        entree['local'] = re.sub(r'BASE', base, date.strftime(nom))
+        chemin = os.path.join(dossier, entree['local'])
+        
+        if os.path.exists(chemin) and (entree['taille_distante'] is None \
+         or os.path.getsize(chemin) == entree['taille_distante']):
+            if entree['taille_locale'] != os.path.getsize(chemin):
+                entree['taille_locale'] = os.path.getsize(chemin)
+                entree['sha256'] = None
+            continue
+        
+        fichiers.append((cle, entree['distant'], chemin))
+    ecrire_manifeste(base, dossier, manifeste)
     
-    # Téléchargement du dump complet
-    nom_fichier = re.sub(r'BASE', base, dates[0].strftime(nom_base))
-    telecharger_ftp_cache(connexion, serveurs[base][4], \
-                          dates[0].strftime(fichiers_base[base]), \
-                          os.path.join(dossier, nom_fichier))
+    # Inscrire chaque fichier téléchargé dans le manifeste
+    verrou = threading.Lock()
+    def enregistrer(fichier, resultat):
+        with verrou:
+            manifeste[fichier[0]]['taille_locale'] = resultat[0]
+            manifeste[fichier[0]]['sha256'] = resultat[1]
+            ecrire_manifeste(base, dossier, manifeste)
     
-    # Téléchargement des dumps incrémentaux
-    for date in dates[1:]:
+    # Téléchargement sur une seule connexion
+    if connexions == 1:
         
-        nom_fichier = re.sub(r'BASE', base, date.strftime(nom_majo))
-        telecharger_ftp_cache(connexion, serveurs[base][4], \
-                              date.strftime(fichiers_majo[base]), \
-                              os.path.join(dossier, nom_fichier))
+        try:
+            for fichier in fichiers:
+                enregistrer(fichier, \
+                    telecharger_ftp_cache(connexion, serveurs[base][4], \
+                                          fichier[1], fichier[2], True, \
+                                          identifiants=serveurs[base][0:4]))
+        finally:
+            # Clôturer la connexion
+            connexion.close()
+    
+    # Téléchargement sur plusieurs connexions simultanées
+    else:
+        connexion.close()
+        telecharger_ftp_parallele(base, fichiers, connexions, enregistrer, \
+                                  limite)
     
-    # Clôturer la connexion
-    connexion.close()
+    # Vérifier que les fichiers téléchargés sont complets
+    if [date for date in livraisons_manquantes(base, dossier) \
+     if date in dates]:
+        raise IOError()
+    
+    # Transcoder les archives qui ne l’ont pas encore été, en parallèle
+    if transcodage:
+        if not zstandard:
+            raise ImportError('zstandard')
+        archives = [os.path.join(dossier, \
+                                 manifeste[date.strftime('%Y%m%d-%H%M%S')] \
+                                          ['local']) for date in dates]
+        archives = [archive for archive in archives \
+                    if not copie_transcodee(archive)]
+        if len(archives) > 1:
+            pool = multiprocessing.Pool()
+            try:
+                pool.map(transcoder_archive, archives)
+            finally:
+                pool.close()
+                pool.join()
+        elif archives:
+            transcoder_archive(archives[0])
     
     return dates
 
 
 # Décompresser les fichiers de la base juridique spécifiée
 # 
+# Chaque installation est notée dans le journal du dossier de la base (voir
+# lire_journal) ; une installation interrompue est d’abord reprise depuis son
+# dernier point de reprise, avant d’appliquer les livraisons suivantes. Une
+# base installée de zéro part de l’archive compactée la plus récente de la
+# chaîne de livraisons si le cache en a (voir creer_archives_compactees),
+# sinon du dump complet.
+# 
 # @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
 #                       'CONSTIT', 'CIRCULAIRES')
 # @param str|int|datetime livraison -1 pour décompresser jusqu’à la livraison
@@ -270,12 +387,31 @@ def telecharger_base(base, dossier='.', livraison=-1,
 # @param str nom_majo format des noms de fichiers de mise à jour
 #                     (chaînes '%s' pour les variables de temps (cf datetime),
 #                     'BASE' pour le nom de la base XML)
+# @param bool rattrapage appliquer d’un seul coup les dumps incrémentaux en
+#                        attente (voir rattraper_majos) plutôt qu’un par un
+# @param int|None processus nombre de processus inventoriant les archives en
+#                           mode rattrapage (None : nombre de processeurs)
+# @param str stockage dans ('repertoire', 'paquet') : fichiers extraits dans
+#                     le dossier de la base, ou enregistrés livraison par
+#                     livraison dans un paquet dédupliqué (voir
+#                     stockage.Paquet) dans ce même dossier
+# @param None|str|list[str]|callable filtre ne décompresser que les fichiers
+#                                           sous ces préfixes de chemins ou de
+#                                           ces textes (cidTexte), ou retenus
+#                                           par cette fonction (voir
+#                                           archives.filtre_membres)
+# @param str nom_compacte format des noms des archives compactées
+#                         (chaînes '%s' pour les variables de temps (cf
+#                         datetime), 'BASE' pour le nom de la base XML)
 # @return None
 # @raise NomBaseError, ValueError, LivraisonManquanteException,
 #        DossierIncoherentException, IOError
 def decompresser_base(base, livraison=-1, dossier='.', cache='.',
                       nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
-                      nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+                      nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz',
+                      rattrapage=False, processus=None, stockage='repertoire',
+                      filtre=None,
+                      nom_compacte='BASE-compacte-%Y%m%d-%H%M%S.tar.gz'):
     
     # Vérification des paramètres
     if base not in bases:
@@ -287,10 +423,12 @@ def decompresser_base(base, livraison=-1, dossier='.', cache='.',
     if not isinstance(cache, (str, unicode)): raise ValueError()
     if not isinstance(nom_base, (str, unicode)): raise ValueError()
     if not isinstance(nom_majo, (str, unicode)): raise ValueError()
+    if not stockage in ('repertoire', 'paquet'): raise ValueError()
+    if not isinstance(nom_compacte, (str, unicode)): raise ValueError()
     
     # Transformations de base
-    nom_base = re.sub(r'BASE', base, nom_base)
     dossier_base = os.path.join(dossier, base.lower())
+    nom_compacte = re.sub(r'BASE', base, nom_compacte)
     
     # Calculer la liste des dumps à appliquer
     dates, toutes_dates = cache_disponible(base, cache, livraison, \
@@ -300,33 +438,52 @@ def decompresser_base(base, livraison=-1, dossier='.', cache='.',
     if not os.path.exists(dossier):
         os.makedirs(dossier)
     
-    # Vérifier que la livraison n’est pas trop vieille et qu’un fichier indique
-    # la livraison installée, sinon supprimer et refaire au propre
+    # Terminer d’abord une installation interrompue, depuis son dernier point
+    # de reprise
+    en_cours = lire_journal(dossier_base)['en_cours']
+    if en_cours and en_cours['type'] == 'fond':
+        decompresser_fond(base, en_cours['livraisons'][0], dossier, cache, \
+                          en_cours.get('nom_archive', nom_base), filtre)
+    elif en_cours and en_cours['type'] == 'majo':
+        decompresser_majo(base, en_cours['livraisons'][0], dossier, cache, \
+                          nom_majo, filtre)
+    elif en_cours and en_cours['type'] == 'rattrapage':
+        rattraper_majos(base, en_cours['livraisons'], dossier, cache, \
+                        nom_majo, processus, filtre)
+    elif en_cours and en_cours['type'] == 'paquet':
+        enregistrer_paquet(base, en_cours['livraisons'], dossier, cache, \
+                           nom_base if en_cours.get('fondation') else nom_majo, \
+                           filtre, en_cours.get('fondation', False))
+    elif en_cours and en_cours['type'] == 'instantane':
+        terminer_instantane(dossier_base, en_cours['livraisons'][0])
+    elif en_cours:
+        raise DossierIncoherentException()
+    
+    # Vérifier que la livraison n’est pas trop vieille et que le journal
+    # indique la livraison installée, sinon supprimer et refaire au propre
     supprimer = False
     livraison_installee = None
     if os.path.exists(dossier_base):
-        if os.path.exists(os.path.join(dossier_base, fichier_livraison)):
-            with open(os.path.join(dossier_base,fichier_livraison), 'r') as fd:
-                livraison_installee = datetime.strptime(fd.read(), \
-                                                        '%Y%m%d-%H%M%S')
-            if livraison_installee < dates[0]:
+        historique = lire_journal(dossier_base)['historique']
+        if historique:
+            livraison_installee = historique[-1]
+            if dates and livraison_installee < dates[0]:
                 supprimer = True
                 livraison_installee = None
         else:
             supprimer = True
     
+    # Un paquet garde l’historique : le nouveau dump complet y sera ajouté
+    if stockage == 'paquet':
+        supprimer = False
+    
     # Le cas échéant, supprimer seulement les fichiers concernés (pour laisser
-    # par exemple des métadonnées gérées par d’autres fichiers)
+    # par exemple des métadonnées gérées par d’autres fichiers) ; l’effacement
+    # est journalisé avant, pour ne plus se fier à l’historique s’il est
+    # interrompu
     if supprimer:
-        with open(os.path.join(dossier_base, fichier_drapeau), 'w') as fd:
-            fd.write('Suppression en cours.\n')
-        if os.path.exists(dossier_base):
-            shutil.rmtree(dossier_base)
-        if os.path.exists(os.path.join(dossier_base, fichier_livraison)):
-            os.remove(os.path.join(dossier_base, fichier_livraison))
-        if os.path.exists(os.path.join(dossier_base, fichier_historique)):
-            os.remove(os.path.join(dossier_base, fichier_historique))
-        os.remove(os.path.join(dossier_base, fichier_drapeau))
+        ecrire_journal(dossier_base, {'effacement': True})
+        shutil.rmtree(dossier_base)
     
     # Vérifier qu’on peut mettre à jour le dossier
     # Cas possibles :
@@ -342,40 +499,95 @@ def decompresser_base(base, livraison=-1, dossier='.', cache='.',
      and not (livraison_installee and livraison_installee >= toutes_dates[0]):
         raise LivraisonManquanteException()
     
-    # Vérifier que le dossier est dans un état cohérent
-    if os.path.exists(os.path.join(dossier_base, fichier_drapeau)):
-        raise DossierIncoherentException()
-    
-    # Décompresser l’image de base si nécessaire
+    # Décompresser l’image de base si nécessaire, ou la plus récente archive
+    # compactée de la chaîne
     if not livraison_installee:
-        
-        # Pré-créer le dossier de base
-        if not os.path.exists(dossier_base):
-            os.makedirs(dossier_base)
-        
-        # Indiquer qu’un travail est en cours sur les fichiers
-        with open(os.path.join(dossier_base, fichier_drapeau), 'w') as fd:
-            fd.write(dates[0].strftime('Installation du dump complet ' \
-                                       + '%Y%m%d-%H%M%S.\n'))
-        
-        # Décompresser le dump complet
-        tar = tarfile.open(os.path.join(cache, dates[0].strftime(nom_base)))
-        tar.extractall(dossier)
-        
-        # Mettre à jour les métadonnées
-        with open(os.path.join(dossier_base, fichier_livraison), 'w') as fd:
-            fd.write(dates[0].strftime('%Y%m%d-%H%M%S'))
-        with open(os.path.join(dossier_base, fichier_historique), 'a') as fd:
-            fd.write(dates[0].strftime('%Y%m%d-%H%M%S\n'))
-        livraison_installee = dates[0]
-        
-        # Indiquer que la décompression s’est bien terminée
-        os.remove(os.path.join(dossier_base, fichier_drapeau))
+        compactees = [date for date in dates[1:] \
+                      if os.path.exists(os.path.join(cache, \
+                                        date.strftime(nom_compacte))) \
+                      or copie_transcodee(os.path.join(cache, \
+                                          date.strftime(nom_compacte)))]
+        if stockage == 'paquet':
+            enregistrer_paquet(base, [dates[0]], dossier, cache, nom_base, \
+                               filtre, True)
+            livraison_installee = dates[0]
+        elif compactees:
+            decompresser_fond(base, compactees[-1], dossier, cache, \
+                              nom_compacte, filtre)
+            livraison_installee = compactees[-1]
+        else:
+            decompresser_fond(base, dates[0], dossier, cache, nom_base, filtre)
+            livraison_installee = dates[0]
     
     # Décompresser les dumps incrémentaux
-    for date in dates[1:]:
-        if livraison_installee < date:
-            decompresser_majo(base, date, dossier, cache, nom_majo)
+    en_attente = [date for date in dates[1:] if livraison_installee < date]
+    if stockage == 'paquet':
+        enregistrer_paquet(base, en_attente, dossier, cache, nom_majo, filtre)
+        return
+    if rattrapage and len(en_attente) > 1:
+        rattraper_majos(base, en_attente, dossier, cache, nom_majo, processus,
+                        filtre)
+        return
+    for date in en_attente:
+        decompresser_majo(base, date, dossier, cache, nom_majo, filtre)
+
+
+# Décompresser le dump complet de la base juridique spécifiée
+# 
+# Le dossier de la base doit être vide, ou contenir l’extraction interrompue
+# de ce même dump : elle est alors reprise après le dernier point de reprise
+# du journal. Une archive compactée s’installe de la même façon.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str|datetime livraison date du dump complet
+#                               'AAAAMMJJ-HHMMSS' idem datetime
+# @param str dossier dossier où sera installé la base juridique décompressée
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param str nom_base format du nom de fichier de base (ou de l’archive
+#                     compactée)
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param None|str|list[str]|callable filtre voir decompresser_base
+# @return None
+# @raise NomBaseError, ValueError, DossierIncoherentException, IOError
+def decompresser_fond(base, livraison, dossier='.', cache='.',
+                      nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz', filtre=None):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if isinstance(livraison, (str, unicode)):
+        livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
+    if not isinstance(livraison, datetime): raise ValueError()
+    if not isinstance(dossier, (str, unicode)): raise ValueError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    if not isinstance(nom_base, (str, unicode)): raise ValueError()
+    
+    # Transformations de base
+    nom_base = re.sub(r'BASE', base, nom_base)
+    dossier_base = os.path.join(dossier, base.lower())
+    retenir = filtre_membres(filtre)
+    
+    # Pré-créer le dossier de base
+    if not os.path.exists(dossier_base):
+        os.makedirs(dossier_base)
+    
+    # Commencer ou reprendre l’installation
+    en_cours = commencer_journal(dossier_base, 'fond', [livraison], \
+                                 nom_archive=nom_base)
+    
+    # Décompresser le dump complet
+    with ouvrir_archive(os.path.join(cache, livraison.strftime(nom_base))) \
+      as tar:
+        tar.extractall(dossier, membres_journalises(tar, dossier, \
+                                  dossier_base, 0, en_cours['membres'], \
+                                  lambda membre: not retenir \
+                                                 or retenir(membre.name)))
+    
+    # Indiquer que la décompression s’est bien terminée
+    ecrire_journal(dossier_base, {'fin': True})
 
 
 # Décompresser une mise à jour de la base juridique spécifiée
@@ -391,10 +603,14 @@ def decompresser_base(base, livraison=-1, dossier='.', cache='.',
 # @param str nom_majo format des noms de fichiers de mise à jour
 #                     (chaînes '%s' pour les variables de temps (cf datetime),
 #                     'BASE' pour le nom de la base XML)
+# @param None|str|list[str]|callable filtre ne décompresser que les fichiers
+#                                           retenus (voir decompresser_base) ;
+#                                           les suppressions hors du filtre
+#                                           sont ignorées
 # @return None
-# @raise NomBaseError, ValueError, IOError
+# @raise NomBaseError, ValueError, DossierIncoherentException, IOError
 def decompresser_majo(base, livraison, dossier='.', cache='.',
-                      nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+                      nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz', filtre=None):
     
     # Vérification des paramètres
     if base not in bases:
@@ -409,200 +625,1463 @@ def decompresser_majo(base, livraison, dossier='.', cache='.',
     # Transformations de base
     nom_majo = re.sub(r'BASE', base, nom_majo)
     dossier_base = os.path.join(dossier, base.lower())
+    retenir = filtre_membres(filtre)
+    fichier_suppr_arti = re.sub(r'BASE', base.lower(), \
+                                          fichier_suppression_articles)
     
-    # Vérifier que le dossier est dans un état cohérent
-    if os.path.exists(os.path.join(dossier_base, fichier_drapeau)):
-        raise DossierIncoherentException()
+    # Commencer ou reprendre l’installation ; la liste de suppression de la
+    # livraison précédente n’est retirée qu’au premier essai, une reprise
+    # pouvant trouver celle de cette livraison déjà en place
+    en_cours = commencer_journal(dossier_base, 'majo', [livraison])
+    if not en_cours['reprise'] \
+      and os.path.exists(os.path.join(dossier_base, fichier_suppr_arti)):
+        os.remove(os.path.join(dossier_base, fichier_suppr_arti))
+    
+    if not en_cours['suppressions']:
+        
+        # Décompresser le dump incrémental
+        # Note : dans l’archive, la base est dans un répertoire nommé de la
+        #        date de mise à jour ; ce préfixe est retiré des noms des
+        #        membres pour que l’extraction écrase directement les fichiers
+        #        existants, sans répertoire intermédiaire commun à plusieurs
+        #        bases
+        with ouvrir_archive(os.path.join(cache, \
+                                         livraison.strftime(nom_majo))) as tar:
+            tar.extractall(dossier, membres_journalises(tar, dossier, \
+                                      dossier_base, 0, en_cours['membres'], \
+                                      lambda membre: not retenir \
+                                                     or retenir(membre.name)))
+        if os.path.exists(os.path.join(dossier, fichier_suppr_arti)):
+            os.rename(os.path.join(dossier, fichier_suppr_arti), \
+                      os.path.join(dossier_base, fichier_suppr_arti))
+        
+        # Lire la liste des fichiers à supprimer
+        if os.path.exists(os.path.join(dossier_base, fichier_suppr_arti)):
+            with open(os.path.join(dossier_base, fichier_suppr_arti), 'rb') \
+              as fd:
+                suppression_fichiers = lire_liste_suppression(fd.read())
+            for fichier in suppression_fichiers:
+                if retenir and not retenir(fichier):
+                    continue
+                if os.path.exists(os.path.join(dossier, fichier)):
+                    os.remove(os.path.join(dossier, fichier))
+        ecrire_journal(dossier_base, {'suppressions': True})
+    
+    # Indiquer que la décompression s’est bien terminée
+    ecrire_journal(dossier_base, {'fin': True})
+
+
+# Enregistrer des livraisons de la base juridique dans son paquet
+# 
+# Chaque livraison est ajoutée au paquet dans sa propre transaction (voir
+# stockage.Paquet.ajouter_archive), sans rien extraire, et notée dans le
+# journal ; une livraison interrompue est simplement ajoutée à nouveau.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param list[datetime] livraisons dates des livraisons, en ordre croissant
+# @param str dossier dossier où est installée la base juridique
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param str nom_majo format des noms de fichiers des livraisons
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param None|str|list[str]|callable filtre voir decompresser_base
+# @param bool fondation la première livraison est un dump complet
+# @return None
+# @raise NomBaseError, ValueError, DossierIncoherentException, IOError
+def enregistrer_paquet(base, livraisons, dossier='.', cache='.',
+                       nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz', filtre=None,
+                       fondation=False):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if not isinstance(dossier, (str, unicode)): raise ValueError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    if not isinstance(nom_majo, (str, unicode)): raise ValueError()
     
-    # Indiquer qu’un travail est en cours sur les fichiers
-    with open(os.path.join(dossier_base, fichier_drapeau), 'w') as fd:
-        fd.write('Installation du dump incrémental '.encode('utf-8') + \
-                 livraison.strftime('%Y%m%d-%H%M%S.\n').encode('utf-8'))
-    
-    # Décompresser le dump incrémental
-    # Note : lors de la décompression, la base est dans un répertoire nommé
-    #        de la date de mise à jour ; la section suivante commence par
-    #        recréer artificiellement ce répertoire pour que l’extraction
-    #        écrase correctement les fichiers existants, puis l’extraction a
-    #        lieu, puis ce répertoire est annihilé
+    # Transformations de base
+    nom_majo = re.sub(r'BASE', base, nom_majo)
+    dossier_base = os.path.join(dossier, base.lower())
+    
+    paquet = Paquet(dossier_base)
+    try:
+        for i, livraison in enumerate(sorted(livraisons)):
+            
+            commencer_journal(dossier_base, 'paquet', [livraison], \
+                              fondation=fondation and i == 0)
+            paquet.ajouter_archive(livraison, os.path.join(cache, \
+                                   livraison.strftime(nom_majo)), \
+                                   fondation and i == 0, filtre)
+            ecrire_journal(dossier_base, {'fin': True})
+    finally:
+        paquet.close()
+
+
+# Appliquer d’un seul coup plusieurs mises à jour de la base juridique
+# 
+# Les archives sont d’abord inventoriées (en parallèle) : pour chaque chemin,
+# seule la dernière écriture compte, et une suppression listée par une
+# livraison s’applique après l’extraction de cette même livraison. Chaque
+# fichier est ensuite écrit au plus une fois, depuis l’archive de la dernière
+# livraison qui le contient, et les fichiers finalement supprimés sont retirés.
+# Le résultat est le même qu’avec decompresser_majo appelé sur chaque date.
+# Après une interruption, l’inventaire est refait à l’identique et
+# l’extraction reprend à l’archive et au membre notés dans le journal.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param list[datetime] livraisons dates des mises à jour, en ordre croissant
+# @param str dossier dossier où sera installé la base juridique décompressée
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param str nom_majo format des noms de fichiers de mise à jour
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param int|None processus nombre de processus inventoriant les archives
+#                           (None : nombre de processeurs ; 1 : aucun
+#                           processus supplémentaire)
+# @param None|str|list[str]|callable filtre voir decompresser_base
+# @return None
+# @raise NomBaseError, ValueError, DossierIncoherentException, IOError
+def rattraper_majos(base, livraisons, dossier='.', cache='.',
+                    nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz', processus=None,
+                    filtre=None):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if not livraisons: raise ValueError()
+    if not all(isinstance(livraison, datetime) for livraison in livraisons):
+        raise ValueError()
+    if not isinstance(dossier, (str, unicode)): raise ValueError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    if not isinstance(nom_majo, (str, unicode)): raise ValueError()
+    
+    # Transformations de base
+    livraisons = sorted(livraisons)
+    nom_majo = re.sub(r'BASE', base, nom_majo)
+    dossier_base = os.path.join(dossier, base.lower())
+    archives = [os.path.join(cache, livraison.strftime(nom_majo)) \
+                for livraison in livraisons]
     fichier_suppr_arti = re.sub(r'BASE', base.lower(), \
                                           fichier_suppression_articles)
-    os.mkdir(os.path.join(dossier, livraison.strftime('%Y%m%d-%H%M%S')))
-    os.rename(dossier_base, \
-              os.path.join(dossier, livraison.strftime('%Y%m%d-%H%M%S'), \
-                           base.lower()))
-    tar = tarfile.open(name=os.path.join(cache, livraison.strftime(nom_majo)))
-    tar.extractall(dossier)
-    os.rename(os.path.join(dossier, livraison.strftime('%Y%m%d-%H%M%S'), \
-                           base.lower()), \
-              dossier_base)
-    if os.path.exists(os.path.join(dossier, \
-     livraison.strftime('%Y%m%d-%H%M%S'), fichier_suppr_arti)):
-        os.rename(os.path.join(dossier, livraison.strftime('%Y%m%d-%H%M%S'), \
-                               fichier_suppr_arti), \
-                  os.path.join(dossier_base, fichier_suppression_articles))
-    os.rmdir(os.path.join(dossier, livraison.strftime('%Y%m%d-%H%M%S')))
-    
-    # Lire la liste des fichiers à supprimer
-    if os.path.exists(os.path.join(dossier_base, fichier_suppr_arti)):
-        with open(os.path.join(dossier_base, fichier_suppr_arti), 'r') as fd:
-            suppression_fichiers = fd.readlines()
-        for fichier in suppression_fichiers:
-            os.remove(os.path.join(dossier, fichier.strip()))
     
-    # Mettre à jour les métadonnées
-    with open(os.path.join(dossier_base, fichier_livraison), 'w') as fd:
-        fd.write(livraison.strftime('%Y%m%d-%H%M%S'))
-    with open(os.path.join(dossier_base, fichier_historique), 'a') as fd:
-        fd.write(livraison.strftime('%Y%m%d-%H%M%S\n'))
+    # Commencer ou reprendre l’installation
+    en_cours = commencer_journal(dossier_base, 'rattrapage', livraisons)
+    
+    # Inventorier les archives
+    if processus == 1:
+        inventaires = [inventorier_archive(archive) for archive in archives]
+    else:
+        pool = multiprocessing.Pool(processus)
+        try:
+            inventaires = pool.map(inventorier_archive, archives)
+        finally:
+            pool.close()
+            pool.join()
+    
+    # Calculer l’état final de chaque chemin : indice de l’archive qui l’écrit
+    # en dernier, ou None s’il est finalement supprimé
+    etat = {}
+    for i, (membres, suppressions) in enumerate(inventaires):
+        for membre in membres:
+            etat[membre] = i
+        if suppressions:
+            for chemin in lire_liste_suppression(suppressions):
+                etat[chemin] = None
+    retenir = filtre_membres(filtre)
+    if retenir:
+        etat = dict([(chemin, i) for chemin, i in etat.items() \
+                     if retenir(chemin)])
+    retenus = [set() for archive in archives]
+    for chemin, i in etat.items():
+        if i is not None:
+            retenus[i].add(chemin)
+    
+    if not en_cours['suppressions']:
+        
+        # Extraire de chaque archive les seuls fichiers qui y sont écrits en
+        # dernier, à partir du dernier point de reprise
+        for i, (archive, chemins) in enumerate(zip(archives, retenus)):
+            if not chemins or i < en_cours['archive']:
+                continue
+            deja = en_cours['membres'] if i == en_cours['archive'] else 0
+            with ouvrir_archive(archive) as tar:
+                tar.extractall(dossier, membres_journalises(tar, dossier, \
+                  dossier_base, i, deja, \
+                  lambda membre: membre.name in chemins or membre.isdir() \
+                                 and (not retenir or retenir(membre.name))))
+            ecrire_journal(dossier_base, {'archive': i + 1, 'membres': 0})
+        
+        # Supprimer les fichiers finalement supprimés
+        for chemin, i in etat.items():
+            if i is None and os.path.exists(os.path.join(dossier, chemin)):
+                os.remove(os.path.join(dossier, chemin))
+        ecrire_journal(dossier_base, {'suppressions': True})
+    
+    # Garder la liste de suppression de la dernière livraison, comme après
+    # decompresser_majo
+    if os.path.exists(os.path.join(dossier_base, fichier_suppr_arti)):
+        os.remove(os.path.join(dossier_base, fichier_suppr_arti))
+    if inventaires[-1][1] is not None:
+        with open(os.path.join(dossier_base, fichier_suppr_arti), 'wb') as fd:
+            fd.write(inventaires[-1][1])
     
     # Indiquer que la décompression s’est bien terminée
-    os.remove(os.path.join(dossier_base, fichier_drapeau))
+    ecrire_journal(dossier_base, {'fin': True})
 
 
-# Télécharger les fichiers compressés d’une base juridique
+# Enregistrer les livraisons d’une base juridique dans un dépôt git
 # 
-# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL', 
+# Les commits sont écrits par « git fast-import » directement depuis les
+# archives : chaque membre devient un blob, chaque chemin de la liste de
+# suppression une suppression, et le dump complet remplace tout l’arbre. Le
+# dossier de travail n’est jamais parcouru ; il est ensuite mis à jour par
+# « git read-tree », qui n’écrit que les fichiers modifiés. Les livraisons
+# déjà enregistrées (d’après la date du dernier commit) sont ignorées.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
 #                       'CONSTIT', 'CIRCULAIRES')
-# @param str|int|datetime livraison -1 pour télécharger toute la base
-#                                   0 pour télécharger l’image de base
-#                                   objet datetime pour tout jusqu’à la date
-#                                   'AAAAMMJJ-HHMMSS' idem datetime
-# @param str dossier
-# @param str cache
-# @param str versionnement dans ('aucun', 'git')
+# @param list[datetime] dates dates des livraisons, en commençant par le dump
+#                             complet (voir cache_disponible)
+# @param str dossier dossier où sera installé la base juridique (le dépôt git
+#                    est le sous-dossier du nom de la base)
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param dict params_git auteur, courriel et modèle de message (voir
+#                        obtenir_base)
 # @param str nom_base format du nom de fichier de base
 #                     (chaînes '%s' pour les variables de temps (cf datetime),
 #                     'BASE' pour le nom de la base XML)
 # @param str nom_majo format des noms de fichiers de mise à jour
 #                     (chaînes '%s' pour les variables de temps (cf datetime),
 #                     'BASE' pour le nom de la base XML)
-# @return list[datetime] dates livraisons téléchargées
-# @raise NomBaseError, ConnexionException, ValueError, IOError
-def obtenir_base(base, livraison, dossier='.', cache='.',
-                 versionnement='aucun', telechargement='optionnel',
-                 params_git={'auteur': 'Législateur',
-                             'courriel': '',
-                             'message': 'Livraison de la base BASE du '+
-                                        '%Y-%m-%d %H:%M:%S'},
-                 nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
-                 nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+# @return list[datetime] dates des livraisons enregistrées
+# @raise NomBaseError, ValueError, IOError
+def versionner_git(base, dates, dossier='.', cache='.',
+                   params_git={'auteur': 'Législateur',
+                               'courriel': '',
+                               'message': 'Livraison de la base BASE du '+
+                                          '%Y-%m-%d %H:%M:%S'},
+                   nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                   nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
     
     # Vérification des paramètres
     if base not in bases:
         raise NomBaseError()
-    if isinstance(livraison, (str, unicode)):
-        livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
-    if not isinstance(livraison, (datetime, int)): raise ValueError()
+    if not dates: raise ValueError()
     if not isinstance(dossier, (str, unicode)): raise ValueError()
     if not isinstance(cache, (str, unicode)): raise ValueError()
-    if not versionnement in ('aucun', 'git'): raise ValueError()
-    if not telechargement in ('oui', 'non', 'optionnel'): raise ValueError()
     if not isinstance(nom_base, (str, unicode)): raise ValueError()
     if not isinstance(nom_majo, (str, unicode)): raise ValueError()
     
     # Transformations de base
+    nom_base = re.sub(r'BASE', base, nom_base)
+    nom_majo = re.sub(r'BASE', base, nom_majo)
     dossier_base = os.path.join(dossier, base.lower())
+    prefixe = base.lower() + '/'
     cest = CEST()
+    fichier_suppr_arti = re.sub(r'BASE', base.lower(), \
+                                          fichier_suppression_articles)
     
-    # Télécharger les fichiers
-    if telechargement != 'non':
-        if telechargement == 'oui':
-            telecharger_base(base, dossier, livraison, nom_base, nom_majo)
-        elif telechargement == 'optionnel':
-            try:
-                telecharger_base(base, dossier, livraison, nom_base, nom_majo)
-            except ConnexionException:
-                pass
+    def git(*arguments):
+        processus = subprocess.Popen(('git',) + arguments, cwd=dossier_base, \
+                                     stdout=subprocess.PIPE)
+        sortie = processus.communicate()[0]
+        return processus.returncode, sortie.decode('utf-8').strip()
     
-    # Vérifier les fichiers téléchargés
-    _, dates = cache_disponible(base, cache, livraison, nom_base, nom_majo)
-    if len(dates) == 0:
-        raise LivraisonManquanteException()
+    # Initialiser la première fois
+    if not os.path.exists(os.path.join(dossier_base, '.git')):
+        if not os.path.exists(dossier_base):
+            os.makedirs(dossier_base)
+        subprocess.call(['git', 'init', '-q'], cwd=dossier_base)
+        with open(os.path.join(dossier_base, '.git', 'info', \
+                  'exclude'), 'a') as fd:
+            fd.write(fichier_suppr_arti + '\n')
     
-    # Décompresser les fichiers, sans versionnement = écraser le contenu
-    # existant
-    if versionnement == 'aucun':
-        decompresser_base(base, livraison, dossier, cache, nom_base, nom_majo)
+    # Exclure le journal d’installation, y compris des dépôts créés par les
+    # anciennes versions, et y reprendre leurs métadonnées
+    with open(os.path.join(dossier_base, '.git', 'info', 'exclude'), 'r') \
+      as fd:
+        exclusions = fd.read().splitlines()
+    if fichier_journal not in exclusions:
+        with open(os.path.join(dossier_base, '.git', 'info', 'exclude'), \
+                  'a') as fd:
+            fd.write(fichier_journal + '\n')
+    lire_journal(dossier_base)
     
-    # Décompresser les fichiers, avec versionnement git = chaque nouvelle
-    # livraison (des fichiers XML) est enregistrée avec git
-    elif versionnement == 'git':
-        
-        for i, date in enumerate(dates):
-            
-            # Effectuer la décompression
-            decompresser_base(base, date, dossier, cache, nom_base, nom_majo)
-            
-            # Initialiser la première fois
-            if i == 0:
-                subprocess.call(['git', 'init', '-q'], cwd=dossier_base)
-                with open(os.path.join(dossier_base, '.git', 'info', \
-                          'exclude'), 'a') as fd:
-                    fd.write(fichier_historique + '\n')
-                    fd.write(fichier_livraison + '\n')
-            
-            # Inscrire les changements dans git
-            subprocess.call(['git', 'add', '--all', '.'], cwd=dossier_base)
+    # Retrouver la dernière livraison enregistrée
+    _, branche = git('symbolic-ref', '-q', 'HEAD')
+    code, ancien = git('rev-parse', '-q', '--verify', 'HEAD^{commit}')
+    dernier = None
+    if code == 0:
+        dernier = int(git('log', '-1', '--format=%ct', ancien)[1])
+    else:
+        ancien = None
+    depart = ancien
+    
+    def horodatage(date):
+        decalage = cest.utcoffset(date)
+        return calendar.timegm(date.timetuple()) \
+               - decalage.days * 86400 - decalage.seconds, \
+               '%+03d%02d' % (decalage.seconds // 3600, \
+                              decalage.seconds % 3600 // 60)
+    
+    nouvelles = [date for date in dates \
+                 if dernier is None or horodatage(date)[0] > dernier]
+    if not nouvelles:
+        return []
+    
+    # Écrire les commits
+    auteur = (params_git['auteur'] + ' <' + params_git['courriel'] + '>')
+    import_git = subprocess.Popen(['git', 'fast-import', '--quiet', '--done'], \
+                                  cwd=dossier_base, stdin=subprocess.PIPE)
+    flux = import_git.stdin
+    try:
+        for date in nouvelles:
             
-            # Enregistrer les changements dans git
-            date_git = date.replace(tzinfo=cest).isoformat()
-            auteur = params_git['auteur'].encode('utf-8')
-            courriel = params_git['courriel'].encode('utf-8')
-            auteur_complet = (params_git['auteur'] + ' <' + \
-                              params_git['courriel'] + '>').encode('utf-8')
-            message = params_git['message'].encode('utf-8')
+            fondation = date == dates[0]
+            secondes, fuseau = horodatage(date)
             message = re.sub(r'BASE', base, \
                        date.strftime(params_git['message'])).encode('utf-8')
+            signature = auteur + ' ' + str(secondes) + ' ' + fuseau + '\n'
             
-            subprocess.call(['git', 'commit', \
-                             ('--author="' + params_git['auteur'] + ' ' + \
-                               '<' + params_git['courriel'] + '>' \
-                               '"').encode('utf-8'), \
-                             '--date="' + date_git + '"', \
-                             '-m', message, \
-                             '-q', '--no-status'], \
-                             cwd=dossier_base, \
-                             env={ 'GIT_COMMITTER_NAME': auteur, \
-                                   'GIT_COMMITTER_EMAIL': courriel, \
-                                   'GIT_COMMITTER_DATE': date_git })
-
+            flux.write(('commit ' + branche + '\n').encode('utf-8'))
+            flux.write(('author ' + signature).encode('utf-8'))
+            flux.write(('committer ' + signature).encode('utf-8'))
+            flux.write(('data ' + str(len(message)) + '\n').encode('utf-8'))
+            flux.write(message + b'\n')
+            if ancien:
+                flux.write(('from ' + ancien + '\n').encode('utf-8'))
+                ancien = None
+            if fondation:
+                flux.write(b'deleteall\n')
+            
+            archive = os.path.join(cache, date.strftime(nom_base if fondation \
+                                                        else nom_majo))
+            suppressions = []
+            with ouvrir_archive(archive) as tar:
+                for membre in membres_archive(tar):
+                    if membre.isfile() and est_liste_suppression(membre.name):
+                        suppressions = lire_liste_suppression( \
+                                           tar.extractfile(membre).read())
+                        continue
+                    if not membre.name.startswith(prefixe):
+                        continue
+                    chemin = chemin_fast_import(membre.name[len(prefixe):])
+                    if membre.isfile():
+                        mode = '100755' if membre.mode & 0o111 else '100644'
+                        flux.write(('M ' + mode + ' inline ' + chemin + '\n' + \
+                                    'data ' + str(membre.size) + '\n') \
+                                   .encode('utf-8'))
+                        shutil.copyfileobj(tar.extractfile(membre), flux)
+                        flux.write(b'\n')
+                    elif membre.issym():
+                        cible = membre.linkname.encode('utf-8')
+                        flux.write(('M 120000 inline ' + chemin + '\n' + \
+                                    'data ' + str(len(cible)) + '\n') \
+                                   .encode('utf-8') + cible + b'\n')
+                    elif membre.islnk() and membre.linkname.startswith(prefixe):
+                        flux.write(('C ' + \
+                          chemin_fast_import(membre.linkname[len(prefixe):]) + \
+                          ' ' + chemin + '\n').encode('utf-8'))
+            
+            # Les suppressions s’appliquent après les fichiers de la livraison
+            for chemin in suppressions:
+                if chemin.startswith(prefixe):
+                    flux.write(('D ' + chemin_fast_import( \
+                                chemin[len(prefixe):]) + '\n').encode('utf-8'))
+            flux.write(b'\n')
+        
+        flux.write(b'done\n')
+    finally:
+        flux.close()
+        if import_git.wait() != 0:
+            raise IOError('git fast-import a échoué')
+    
+    # Mettre à jour l’index et le dossier de travail, en n’écrivant que les
+    # fichiers modifiés depuis le dernier commit déjà présent
+    if depart is None:
+        code, _ = git('read-tree', '--reset', '-u', 'HEAD')
+    else:
+        code, _ = git('read-tree', '-m', '-u', depart, 'HEAD')
+    if code != 0:
+        raise IOError('git read-tree a échoué')
+    
+    # Noter les livraisons enregistrées dans le journal ; un nouveau dump
+    # complet remplace l’historique
+    if nouvelles[0] == dates[0]:
+        ecrire_journal(dossier_base, {'effacement': True})
+    ecrire_journal(dossier_base, {'debut': [date.strftime('%Y%m%d-%H%M%S') \
+                                            for date in nouvelles], \
+                                  'type': 'git'})
+    ecrire_journal(dossier_base, {'fin': True})
+    
+    return nouvelles
 
-#
-# Fonctions annexes
-#
 
-def cache_disponible(base, cache='.', livraison=-1,
-                     nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
-                     nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+# Enregistrer les livraisons d’une base juridique en instantanés
+# 
+# Chaque livraison a son propre dossier 'AAAAMMJJ-HHMMSS' dans le dossier de
+# la base, qui peut être lu comme la base à cette date (voir
+# stockage.ouvrir_source). Un instantané est construit dans un dossier
+# '.part' : le dump complet y est extrait, ou bien l’instantané précédent y
+# est cloné sans recopier les contenus (voir stockage.cloner_arbre) puis
+# seuls les membres du dump incrémental y sont écrits, chacun dans un fichier
+# '.part' renommé ensuite pour ne jamais modifier un fichier partagé. Le
+# dossier est enfin renommé : un instantané présent est toujours complet, et
+# un instantané interrompu est reconstruit.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param list[datetime] dates dates des livraisons, en commençant par le dump
+#                             complet (voir cache_disponible)
+# @param str dossier dossier où seront enregistrés les instantanés (dans le
+#                    sous-dossier du nom de la base)
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param str nom_base format du nom de fichier de base
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_majo format des noms de fichiers de mise à jour
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param bool reflink cloner par copies reflink quand le système de fichiers
+#                     le permet, sinon par liens physiques
+# @return list[datetime] dates des livraisons enregistrées
+# @raise NomBaseError, ValueError, DossierIncoherentException, IOError
+def versionner_instantanes(base, dates, dossier='.', cache='.',
+                           nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                           nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz',
+                           reflink=True):
     
     # Vérification des paramètres
     if base not in bases:
         raise NomBaseError()
+    if not dates: raise ValueError()
+    if not isinstance(dossier, (str, unicode)): raise ValueError()
     if not isinstance(cache, (str, unicode)): raise ValueError()
-    if isinstance(livraison, (str, unicode)):
-        livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
-    if not isinstance(livraison, (datetime, int)): raise ValueError()
     if not isinstance(nom_base, (str, unicode)): raise ValueError()
     if not isinstance(nom_majo, (str, unicode)): raise ValueError()
     
     # Transformations de base
     nom_base = re.sub(r'BASE', base, nom_base)
     nom_majo = re.sub(r'BASE', base, nom_majo)
+    dossier_base = os.path.join(dossier, base.lower())
+    prefixe = base.lower() + '/'
     
-    # Obtenir la liste des fichiers en cache
-    dates = []
-    for fichier in os.listdir(cache):
+    nouvelles = []
+    for i, date in enumerate(dates):
+        
+        instantane = os.path.join(dossier_base, date.strftime('%Y%m%d-%H%M%S'))
+        if os.path.exists(instantane):
+            continue
+        
+        # Repartir de zéro si l’instantané a été interrompu
+        commencer_journal(dossier_base, 'instantane', [date])
+        partiel = instantane + '.part'
+        if os.path.exists(partiel):
+            shutil.rmtree(partiel)
+        
+        # Cloner l’instantané précédent
+        if i == 0:
+            os.makedirs(partiel)
+            archive = os.path.join(cache, date.strftime(nom_base))
+        else:
+            cloner_arbre(os.path.join(dossier_base, \
+                         dates[i-1].strftime('%Y%m%d-%H%M%S')), partiel, reflink)
+            archive = os.path.join(cache, date.strftime(nom_majo))
+        
+        # Écrire les membres de la livraison, puis appliquer les suppressions
+        suppressions = []
+        with ouvrir_archive(archive) as tar:
+            for membre in membres_archive(tar):
+                if membre.isfile() and est_liste_suppression(membre.name):
+                    suppressions = lire_liste_suppression( \
+                                       tar.extractfile(membre).read())
+                    continue
+                if not membre.name.startswith(prefixe) or \
+                   not membre.isfile():
+                    continue
+                chemin = os.path.join(partiel, membre.name[len(prefixe):])
+                if not os.path.exists(os.path.dirname(chemin)):
+                    os.makedirs(os.path.dirname(chemin))
+                with open(chemin + '.part', 'wb') as fd:
+                    shutil.copyfileobj(tar.extractfile(membre), fd)
+                os.chmod(chemin + '.part', membre.mode & 0o777)
+                os.utime(chemin + '.part', (membre.mtime, membre.mtime))
+                os.rename(chemin + '.part', chemin)
+        for chemin in suppressions:
+            if chemin.startswith(prefixe) and \
+               os.path.exists(os.path.join(partiel, chemin[len(prefixe):])):
+                os.remove(os.path.join(partiel, chemin[len(prefixe):]))
+        
+        # Publier l’instantané
+        os.rename(partiel, instantane)
+        ecrire_journal(dossier_base, {'fin': True})
+        nouvelles.append(date)
+    
+    return nouvelles
+
+
+# Terminer ou abandonner un instantané interrompu (voir versionner_instantanes)
+# 
+# S’il a été publié avant l’interruption, son installation est notée terminée
+# dans le journal ; sinon son dossier '.part' est supprimé et l’installation
+# abandonnée, l’instantané étant reconstruit au prochain versionnement.
+# 
+# @param str dossier_base dossier de la base juridique
+# @param datetime livraison date de l’instantané interrompu
+# @return bool True si l’instantané était publié, False s’il est abandonné
+def terminer_instantane(dossier_base, livraison):
+    
+    instantane = os.path.join(dossier_base, \
+                              livraison.strftime('%Y%m%d-%H%M%S'))
+    if os.path.exists(instantane):
+        ecrire_journal(dossier_base, {'fin': True})
+        return True
+    
+    if os.path.exists(instantane + '.part'):
+        shutil.rmtree(instantane + '.part')
+    ecrire_journal(dossier_base, {'abandon': True})
+    
+    return False
+
+
+# Créer dans le cache des archives compactées de la base juridique
+# 
+# Toutes les intervalle livraisons de la dernière chaîne (dump complet puis
+# dumps incrémentaux), l’état de la base est enregistré dans une archive compactée
+# (voir archives.compacter_archives), construite depuis l’archive compactée
+# précédente de la chaîne ou depuis le dump complet. Une base peut ensuite
+# être installée à n’importe quelle date en partant de l’archive compactée la
+# plus proche (voir decompresser_base) plutôt que de rejouer toute la chaîne.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param int intervalle nombre de livraisons entre deux archives compactées
+# @param int|None conservation nombre d’archives compactées à garder, les plus
+#                              récentes (None : toutes)
+# @param str nom_base format du nom de fichier de base
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_majo format des noms de fichiers de mise à jour
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_compacte format des noms des archives compactées
+#                         (chaînes '%s' pour les variables de temps (cf
+#                         datetime), 'BASE' pour le nom de la base XML)
+# @param int|None processus nombre de processus inventoriant les archives
+#                           (None : nombre de processeurs)
+# @return list[datetime] dates des archives compactées créées
+# @raise NomBaseError, ValueError, IOError
+def creer_archives_compactees(base, cache='.', intervalle=50,
+                              conservation=None,
+                              nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                              nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz',
+                              nom_compacte='BASE-compacte-%Y%m%d-%H%M%S.tar.gz',
+                              processus=None):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    if not isinstance(intervalle, int) or intervalle < 1: raise ValueError()
+    if conservation is not None \
+       and (not isinstance(conservation, int) or conservation < 0):
+        raise ValueError()
+    if not isinstance(nom_base, (str, unicode)): raise ValueError()
+    if not isinstance(nom_majo, (str, unicode)): raise ValueError()
+    if not isinstance(nom_compacte, (str, unicode)): raise ValueError()
+    
+    # Transformations de base
+    nom_base = re.sub(r'BASE', base, nom_base)
+    nom_majo = re.sub(r'BASE', base, nom_majo)
+    nom_compacte = re.sub(r'BASE', base, nom_compacte)
+    
+    def compactee(date):
+        chemin = os.path.join(cache, date.strftime(nom_compacte))
+        return os.path.exists(chemin) or copie_transcodee(chemin) is not None
+    
+    # Dernière chaîne de livraisons : toutes les intervalle livraisons après
+    # la plus récente archive compactée existante (les plus anciennes ont pu
+    # être supprimées, cf conservation), partir de l’archive compactée
+    # précédente, sinon du dump complet
+    dates, _ = cache_disponible(base, cache, -1, nom_base, nom_majo)
+    points = list(range(intervalle, len(dates), intervalle))
+    depart = 0
+    for i in reversed(points):
+        if compactee(dates[i]):
+            depart = i
+            break
+    creees = []
+    for i in points:
+        if i <= depart:
+            continue
+        archives = [os.path.join(cache, dates[depart].strftime( \
+                                 nom_compacte if depart else nom_base))] \
+                   + [os.path.join(cache, date.strftime(nom_majo)) \
+                      for date in dates[depart+1:i+1]]
+        compacter_archives(archives, os.path.join(cache, \
+                           dates[i].strftime(nom_compacte)), processus)
+        creees.append(dates[i])
+        depart = i
+    
+    # Ne garder que les plus récentes archives compactées, avec leurs copies
+    # transcodées et leurs index
+    if conservation is not None:
+        existantes = set()
+        for fichier in os.listdir(cache):
+            for format in (nom_compacte, nom_transcode(nom_compacte)):
+                try:
+                    existantes.add(datetime.strptime(fichier, format))
+                except ValueError:
+                    pass
+        for date in sorted(existantes)[:max(0, len(existantes) \
+                                                - conservation)]:
+            chemin = os.path.join(cache, date.strftime(nom_compacte))
+            transcodee = nom_transcode(chemin)
+            for fichier in (chemin, chemin + suffixe_index, \
+                            chemin + suffixe_points_reprise, transcodee, \
+                            transcodee + suffixe_table_trames):
+                if os.path.exists(fichier):
+                    os.remove(fichier)
+    
+    return creees
+
+
+# Lire un fichier d’une base juridique tel qu’il était à une livraison donnée
+# 
+# Rien n’est décompressé sur le disque : les archives de la chaîne de
+# livraisons sont consultées de la plus récente à la plus ancienne grâce à
+# leur index d’accès direct (construit au premier accès, voir
+# archives.ouvrir_index_archive), jusqu’à trouver le fichier ou sa
+# suppression.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str|datetime livraison date de la livraison
+#                               'AAAAMMJJ-HHMMSS' idem datetime
+# @param str chemin chemin du fichier relatif au dossier d’installation de la
+#                   base (p.ex. 'legi/global/…/texte/struct/LEGITEXT….xml')
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param str nom_base format du nom de fichier de base
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_majo format des noms de fichiers de mise à jour
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @return bytes contenu du fichier
+# @raise NomBaseError, ValueError, LivraisonManquanteException,
+#        FichierNonExistantException, IOError
+def lire_membre(base, livraison, chemin, cache='.',
+                nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if isinstance(livraison, (str, unicode)):
+        livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
+    if not isinstance(livraison, datetime): raise ValueError()
+    if not isinstance(chemin, (str, unicode)): raise ValueError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    
+    # Chaîne des livraisons jusqu’à celle demandée
+    dates, _ = cache_disponible(base, cache, livraison, nom_base, nom_majo)
+    if not dates or dates[-1] != livraison:
+        raise LivraisonManquanteException()
+    
+    # Remonter la chaîne ; dans une même livraison, la suppression s’applique
+    # après l’écriture
+    for i in range(len(dates) - 1, -1, -1):
+        nom = re.sub(r'BASE', base, nom_majo if i else nom_base)
+        archive = os.path.join(cache, dates[i].strftime(nom))
+        if membre_supprime(archive, chemin):
+            break
         try:
-            dates.append((datetime.strptime(fichier, nom_base), 0))
-        except ValueError:
+            return lire_membre_archive(archive, chemin)
+        except FichierNonExistantException:
             pass
+    
+    raise FichierNonExistantException()
+
+
+# Vérifier qu’une base juridique installée correspond à ses livraisons
+# 
+# L’état attendu (chemin et condensat de chaque fichier) est calculé depuis
+# les archives des livraisons installées d’après le journal, chacune lue par
+# un processus ; les fichiers présents dans le dossier sont ensuite condensés
+# en parallèle, par blocs. Seul le stockage en répertoire est vérifié (voir
+# decompresser_base).
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str dossier dossier où est installée la base juridique
+# @param str cache dossier où se trouvent les fichiers téléchargés TAR gzippés
+#                  des bases juridiques XML
+# @param str nom_base format du nom de fichier de base
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_majo format des noms de fichiers de mise à jour
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_compacte format des noms des archives compactées
+#                         (chaînes '%s' pour les variables de temps (cf
+#                         datetime), 'BASE' pour le nom de la base XML)
+# @param int|None processus nombre de processus de calcul des condensats
+#                           (None : nombre de processeurs ; 1 : aucun
+#                           processus supplémentaire)
+# @param None|str|list[str]|callable filtre filtre de l’installation (voir
+#                                           decompresser_base)
+# @return dict 'manquants', 'surnumeraires', 'corrompus' : list[str] chemins
+#              relatifs au dossier, triés
+# @raise NomBaseError, ValueError, DossierIncoherentException, IOError
+def verifier_base(base, dossier='.', cache='.',
+                  nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                  nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz',
+                  nom_compacte='BASE-compacte-%Y%m%d-%H%M%S.tar.gz',
+                  processus=None, filtre=None):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if not isinstance(dossier, (str, unicode)): raise ValueError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    if not isinstance(nom_base, (str, unicode)): raise ValueError()
+    if not isinstance(nom_majo, (str, unicode)): raise ValueError()
+    if not isinstance(nom_compacte, (str, unicode)): raise ValueError()
+    
+    # Transformations de base
+    nom_base = re.sub(r'BASE', base, nom_base)
+    nom_majo = re.sub(r'BASE', base, nom_majo)
+    nom_compacte = re.sub(r'BASE', base, nom_compacte)
+    dossier_base = os.path.join(dossier, base.lower())
+    fichier_suppr_arti = re.sub(r'BASE', base.lower(), \
+                                          fichier_suppression_articles)
+    
+    # Livraisons installées, depuis le dump complet ou l’archive compactée
+    etat = lire_journal(dossier_base)
+    if etat['en_cours'] or not etat['historique']:
+        raise DossierIncoherentException()
+    historique = etat['historique']
+    archives = [os.path.join(cache, historique[0].strftime(nom_base))]
+    if not os.path.exists(archives[0]) and not copie_transcodee(archives[0]):
+        archives = [os.path.join(cache, historique[0].strftime(nom_compacte))]
+    archives += [os.path.join(cache, date.strftime(nom_majo)) \
+                 for date in historique[1:]]
+    
+    pool = multiprocessing.Pool(processus) if processus != 1 else None
+    try:
+        
+        # État attendu : la dernière écriture compte, et une suppression
+        # s’applique après les fichiers de sa livraison
+        if pool:
+            condensats_archives = pool.map(condenser_archive, archives)
+        else:
+            condensats_archives = [condenser_archive(archive) \
+                                   for archive in archives]
+        attendus = {}
+        for condensats, suppressions in condensats_archives:
+            attendus.update(condensats)
+            if suppressions:
+                for chemin in lire_liste_suppression(suppressions):
+                    attendus.pop(chemin, None)
+        retenir = filtre_membres(filtre)
+        if retenir:
+            attendus = dict([(chemin, condensat) \
+                             for chemin, condensat in attendus.items() \
+                             if retenir(chemin)])
         
+        # Fichiers présents, hors métadonnées de l’installation
+        presents = set()
+        for racine, dossiers, fichiers in os.walk(dossier_base):
+            for fichier in fichiers:
+                presents.add(os.path.relpath(os.path.join(racine, fichier), \
+                                             dossier).replace(os.sep, '/'))
+        presents.discard(base.lower() + '/' + fichier_journal)
+        presents.discard(base.lower() + '/' + fichier_suppr_arti)
+        
+        # Condenser les fichiers attendus et présents
+        a_verifier = sorted(presents & set(attendus))
+        chemins = [os.path.join(dossier, chemin) for chemin in a_verifier]
+        if pool:
+            condensats = pool.imap(condenser_fichier, chemins, 64)
+        else:
+            condensats = (condenser_fichier(chemin) for chemin in chemins)
+        corrompus = [chemin for chemin, condensat \
+                     in zip(a_verifier, condensats) \
+                     if condensat != attendus[chemin]]
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    
+    return {'manquants': sorted(set(attendus) - presents),
+            'surnumeraires': sorted(presents - set(attendus)),
+            'corrompus': corrompus}
+
+
+# Télécharger les fichiers compressés d’une base juridique
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL', 
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str|int|datetime livraison -1 pour télécharger toute la base
+#                                   0 pour télécharger l’image de base
+#                                   objet datetime pour tout jusqu’à la date
+#                                   'AAAAMMJJ-HHMMSS' idem datetime
+# @param str dossier
+# @param str cache
+# @param str versionnement dans ('aucun', 'git', 'instantanes')
+# @param str nom_base format du nom de fichier de base
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_majo format des noms de fichiers de mise à jour
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param int connexions nombre maximal de connexions FTP simultanées
+# @param threading.Semaphore|None limite jetons de connexion au serveur
+#                                       (voir telecharger_base)
+# @param bool rattrapage sans versionnement, appliquer d’un seul coup les
+#                        dumps incrémentaux en attente (voir decompresser_base)
+# @param bool transcodage transcoder les archives téléchargées (voir
+#                         telecharger_base)
+# @param int|None compactage créer une archive compactée toutes les
+#                            compactage livraisons (voir
+#                            creer_archives_compactees), None pour aucune
+# @param int|None conservation nombre d’archives compactées à garder
+# @return list[datetime] dates livraisons téléchargées
+# @raise NomBaseError, ConnexionException, ValueError, IOError
+def obtenir_base(base, livraison, dossier='.', cache='.',
+                 versionnement='aucun', telechargement='optionnel',
+                 params_git={'auteur': 'Législateur',
+                             'courriel': '',
+                             'message': 'Livraison de la base BASE du '+
+                                        '%Y-%m-%d %H:%M:%S'},
+                 nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                 nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz',
+                 connexions=1, limite=None, rattrapage=False,
+                 transcodage=False, compactage=None, conservation=None):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if isinstance(livraison, (str, unicode)):
+        livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
+    if not isinstance(livraison, (datetime, int)): raise ValueError()
+    if not isinstance(dossier, (str, unicode)): raise ValueError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    if not versionnement in ('aucun', 'git', 'instantanes'): raise ValueError()
+    if not telechargement in ('oui', 'non', 'optionnel'): raise ValueError()
+    if not isinstance(nom_base, (str, unicode)): raise ValueError()
+    if not isinstance(nom_majo, (str, unicode)): raise ValueError()
+    
+    # Télécharger les fichiers
+    if telechargement != 'non':
+        if telechargement == 'oui':
+            telecharger_base(base, dossier, livraison, nom_base, nom_majo,
+                             connexions, limite, transcodage)
+        elif telechargement == 'optionnel':
+            try:
+                telecharger_base(base, dossier, livraison, nom_base, nom_majo,
+                             connexions, limite, transcodage)
+            except ConnexionException:
+                pass
+    
+    # Vérifier les fichiers téléchargés
+    _, dates = cache_disponible(base, cache, livraison, nom_base, nom_majo)
+    if len(dates) == 0:
+        raise LivraisonManquanteException()
+    
+    # Compacter les chaînes de livraisons
+    if compactage:
+        creer_archives_compactees(base, cache, compactage, conservation, \
+                                  nom_base, nom_majo)
+    
+    # Décompresser les fichiers, sans versionnement = écraser le contenu
+    # existant
+    if versionnement == 'aucun':
+        decompresser_base(base, livraison, dossier, cache, nom_base, nom_majo,
+                          rattrapage)
+    
+    # Décompresser les fichiers, avec versionnement git = chaque nouvelle
+    # livraison (des fichiers XML) est enregistrée avec git
+    elif versionnement == 'git':
+        versionner_git(base, dates, dossier, cache, params_git, \
+                       nom_base, nom_majo)
+    
+    # Décompresser les fichiers, avec versionnement en instantanés = chaque
+    # nouvelle livraison a son propre dossier, partageant les fichiers
+    # inchangés avec la précédente
+    elif versionnement == 'instantanes':
+        versionner_instantanes(base, dates, dossier, cache, nom_base, nom_majo)
+
+
+# Obtenir plusieurs bases juridiques simultanément
+# 
+# Chaque base est traitée par obtenir_base dans son propre fil d’exécution :
+# pendant qu’une base est téléchargée, une autre peut être décompressée. Le
+# nombre de connexions FTP ouvertes en même temps sur un même serveur est
+# limité à connexions_serveur, toutes bases confondues.
+# 
+# @param list[str] liste_bases bases dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI',
+#                                          'CNIL', 'CONSTIT', 'CIRCULAIRES')
+# @param int connexions_serveur nombre maximal de connexions simultanées
+#                               sur chaque serveur
+# (autres paramètres : voir obtenir_base)
+# @return None
+# @raise NomBaseError, ValueError, SynchronisationException (avec en argument
+#        le dictionnaire des exceptions levées pour chaque base en échec)
+def obtenir_bases(liste_bases, livraison=-1, dossier='.', cache='.',
+                  versionnement='aucun', telechargement='optionnel',
+                  params_git={'auteur': 'Législateur',
+                              'courriel': '',
+                              'message': 'Livraison de la base BASE du '+
+                                         '%Y-%m-%d %H:%M:%S'},
+                  nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                  nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz',
+                  connexions=1, connexions_serveur=4, rattrapage=False,
+                  transcodage=False, compactage=None, conservation=None):
+    
+    # Vérification des paramètres
+    for base in liste_bases:
+        if base not in bases:
+            raise NomBaseError()
+    if not isinstance(connexions_serveur, int) or connexions_serveur < 1:
+        raise ValueError()
+    if not isinstance(connexions, int) or connexions < 1: raise ValueError()
+    
+    # Un jeu de jetons de connexion par serveur
+    limites = {}
+    for base in liste_bases:
+        if serveurs[base][0] not in limites:
+            limites[serveurs[base][0]] = \
+                threading.BoundedSemaphore(connexions_serveur)
+    
+    erreurs = {}
+    def obtenir(base):
         try:
-            dates.append((datetime.strptime(fichier, nom_majo), 1))
+            obtenir_base(base, livraison, dossier, cache, versionnement, \
+                         telechargement, params_git, nom_base, nom_majo, \
+                         min(connexions, connexions_serveur), \
+                         limites[serveurs[base][0]], rattrapage, \
+                         transcodage, compactage, conservation)
+        except Exception as e:
+            erreurs[base] = e
+    
+    fils = [threading.Thread(target=obtenir, args=(base,)) \
+            for base in liste_bases]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    
+    if erreurs:
+        raise SynchronisationException(erreurs)
+
+
+#
+# Fonctions annexes
+#
+
+# Connexion FTP prenant un jeu de jetons à l’ouverture et le rendant à la
+# fermeture, pour limiter le nombre de connexions simultanées à un serveur
+class ConnexionFTP(ftplib.FTP):
+    
+    def __init__(self, limite=None):
+        ftplib.FTP.__init__(self)
+        self.limite = limite
+        self.jeton = False
+    
+    def connect(self, *args, **kwargs):
+        if self.limite and not self.jeton:
+            self.limite.acquire()
+            self.jeton = True
+        return ftplib.FTP.connect(self, *args, **kwargs)
+    
+    def close(self):
+        ftplib.FTP.close(self)
+        if self.jeton:
+            self.jeton = False
+            self.limite.release()
+
+
+# Ouvrir une connexion FTP sur le serveur d’une base juridique
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param threading.Semaphore|None limite jetons de connexion au serveur
+# @return ftplib.FTP connexion ouverte et authentifiée
+# @raise ConnexionException
+def connexion_ftp(base, limite=None):
+    
+    try:
+        connexion = ConnexionFTP(limite)
+        connexion.connect(serveurs[base][0], serveurs[base][1])
+        connexion.login(serveurs[base][2], serveurs[base][3])
+    except:
+        connexion.close()
+        raise ConnexionException()
+    
+    return connexion
+
+
+# Lister les fichiers d’un répertoire FTP avec leur taille
+# 
+# @param ftplib.FTP connexion objet FTP initialisé correctement
+# @param str repertoire répertoire sur le serveur
+# @return dict{str: int|None} taille de chaque fichier, None si le serveur ne
+#                             connaît pas MLSD
+# @raise ftplib.Error
+def lister_ftp(connexion, repertoire):
+    
+    connexion.cwd(repertoire)
+    
+    # Une seule commande MLSD donne les noms et les tailles
+    lignes = []
+    try:
+        connexion.retrlines('MLSD', lignes.append)
+    except ftplib.error_perm:
+        return dict([(fichier, None) for fichier in connexion.nlst()])
+    
+    fichiers = {}
+    for ligne in lignes:
+        faits, nom = ligne.split(' ', 1)
+        faits = dict([fait.split('=', 1) for fait in faits.split(';') \
+                      if '=' in fait])
+        if faits.get('type', 'file').lower() != 'file':
+            continue
+        fichiers[nom] = int(faits['size']) if 'size' in faits else None
+    
+    return fichiers
+
+
+# Mettre à jour le manifeste des livraisons d’après le serveur FTP
+# 
+# Les livraisons qui ne sont plus sur le serveur sont conservées, avec
+# 'distant' à None, puisqu’elles peuvent encore être en cache.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param ftplib.FTP connexion objet FTP initialisé correctement
+# @param dict manifeste manifeste à mettre à jour
+# @return dict manifeste mis à jour
+# @raise StructureRepertoireException, ftplib.Error
+def rafraichir_manifeste(base, connexion, manifeste):
+    
+    fichiers = lister_ftp(connexion, serveurs[base][4])
+    
+    # Reconnaître les dates des fichiers
+    distants = {}
+    for fichier in fichiers:
+        for nature, nom in (('fond', fichiers_base[base]), \
+                            ('majo', fichiers_majo[base])):
+            try:
+                date = datetime.strptime(fichier, nom)
+            except ValueError:
+                continue
+            distants[date.strftime('%Y%m%d-%H%M%S')] = (nature, fichier)
+    
+    # Vérifier l’intégrité du répertoire
+    if len([1 for cle in distants if distants[cle][0] == 'fond']) != 1:
+        raise StructureRepertoireException()
+    
+    # Reporter les fichiers dans le manifeste
+    for cle in manifeste:
+        manifeste[cle]['distant'] = None
+    for cle, (nature, fichier) in distants.items():
+        entree = manifeste.setdefault(cle, {'local': None,
+                                            'taille_locale': None,
+                                            'sha256': None})
+        entree['type'] = nature
+        entree['distant'] = fichier
+        entree['taille_distante'] = fichiers[fichier]
+    
+    return manifeste
+
+
+# Écrire un chemin dans un flux git fast-import
+# 
+# @param str chemin chemin relatif à la racine du dépôt
+# @return str chemin, entre guillemets s’il le faut
+def chemin_fast_import(chemin):
+    
+    if not chemin.startswith('"') and ' ' not in chemin \
+     and '\n' not in chemin:
+        return chemin
+    
+    return '"' + chemin.replace('\\', '\\\\').replace('"', '\\"') \
+                       .replace('\n', '\\n') + '"'
+
+
+# Lire le journal d’installation d’une base
+# 
+# Une dernière ligne tronquée par un arrêt brutal est ignorée et retirée du
+# fichier, pour que les événements suivants restent lisibles. À la première
+# lecture d’un dossier installé par une ancienne version, le journal est créé
+# depuis les fichiers livraison.txt et historique.txt, qui sont supprimés.
+# 
+# @param str dossier_base dossier de la base juridique
+# @return dict 'historique' : list[datetime] livraisons installées depuis le
+#                             dernier effacement, en ordre croissant
+#              'en_cours' : None, ou dict de l’installation commencée mais pas
+#                           terminée : 'type', 'livraisons' (list[datetime]),
+#                           'archive' et 'membres' (dernier point de reprise),
+#                           'suppressions' (bool), et les autres clés de
+#                           l’événement de début
+# @raise DossierIncoherentException si le drapeau d’une ancienne version est
+#                                   présent
+def lire_journal(dossier_base):
+    
+    etat = {'historique': [], 'en_cours': None}
+    chemin = os.path.join(dossier_base, fichier_journal)
+    
+    # Reprendre les métadonnées des anciennes versions
+    if os.path.exists(os.path.join(dossier_base, fichier_drapeau)):
+        raise DossierIncoherentException()
+    if not os.path.exists(chemin) \
+      and os.path.exists(os.path.join(dossier_base, fichier_livraison)):
+        with open(os.path.join(dossier_base, fichier_livraison), 'r') as fd:
+            livraison = fd.read().strip()
+        historique = []
+        if os.path.exists(os.path.join(dossier_base, fichier_historique)):
+            with open(os.path.join(dossier_base, fichier_historique), 'r') \
+              as fd:
+                historique = [ligne.strip() for ligne in fd if ligne.strip()]
+        if not historique or historique[-1] != livraison:
+            historique.append(livraison)
+        ecrire_journal(dossier_base, {'debut': historique, \
+                                      'type': 'migration'})
+        ecrire_journal(dossier_base, {'fin': True})
+        os.remove(os.path.join(dossier_base, fichier_livraison))
+        if os.path.exists(os.path.join(dossier_base, fichier_historique)):
+            os.remove(os.path.join(dossier_base, fichier_historique))
+    if not os.path.exists(chemin):
+        return etat
+    
+    with open(chemin, 'rb') as fd:
+        contenu = fd.read()
+    
+    position = 0
+    for ligne in contenu.splitlines(True):
+        try:
+            if not ligne.endswith(b'\n'):
+                raise ValueError()
+            evenement = json.loads(ligne.decode('utf-8'))
         except ValueError:
+            with open(chemin, 'r+b') as fd:
+                fd.truncate(position)
+            break
+        position += len(ligne)
+        
+        if 'effacement' in evenement:
+            etat = {'historique': [], 'en_cours': None}
+        elif 'debut' in evenement:
+            etat['en_cours'] = dict(evenement)
+            etat['en_cours'].update({
+                'livraisons': [datetime.strptime(date, '%Y%m%d-%H%M%S') \
+                               for date in evenement['debut']],
+                'archive': 0, 'membres': 0, 'suppressions': False})
+            del etat['en_cours']['debut']
+        elif etat['en_cours'] is None:
+            continue
+        elif 'archive' in evenement:
+            etat['en_cours']['archive'] = evenement['archive']
+            etat['en_cours']['membres'] = evenement['membres']
+        elif 'suppressions' in evenement:
+            etat['en_cours']['suppressions'] = True
+        elif 'fin' in evenement:
+            etat['historique'].extend(etat['en_cours']['livraisons'])
+            etat['en_cours'] = None
+        elif 'abandon' in evenement:
+            etat['en_cours'] = None
+    
+    return etat
+
+
+# Ajouter un événement au journal d’installation d’une base
+# 
+# L’événement est écrit sur le disque (fsync) avant le retour.
+# 
+# @param str dossier_base dossier de la base juridique
+# @param dict evenement (voir fichier_journal)
+# @return None
+def ecrire_journal(dossier_base, evenement):
+    
+    if not os.path.exists(dossier_base):
+        os.makedirs(dossier_base)
+    
+    with open(os.path.join(dossier_base, fichier_journal), 'ab') as fd:
+        fd.write((json.dumps(evenement, sort_keys=True) + '\n').encode('utf-8'))
+        fd.flush()
+        os.fsync(fd.fileno())
+
+
+# Commencer ou reprendre une installation dans le journal
+# 
+# @param str dossier_base dossier de la base juridique
+# @param str nature type d’installation (voir fichier_journal)
+# @param list[datetime] livraisons dates des livraisons installées
+# @param dict autres autres clés de l’événement de début
+# @return dict installation en cours (voir lire_journal), avec 'reprise' vrai
+#              si elle avait déjà été commencée
+# @raise DossierIncoherentException si une autre installation est en cours
+def commencer_journal(dossier_base, nature, livraisons, **autres):
+    
+    en_cours = lire_journal(dossier_base)['en_cours']
+    if en_cours:
+        if en_cours['type'] != nature or en_cours['livraisons'] != livraisons:
+            raise DossierIncoherentException()
+        en_cours['reprise'] = True
+        return en_cours
+    
+    evenement = dict(autres)
+    evenement.update({'debut': [date.strftime('%Y%m%d-%H%M%S') \
+                                for date in livraisons], 'type': nature})
+    ecrire_journal(dossier_base, evenement)
+    en_cours = dict(autres)
+    en_cours.update({'type': nature, 'livraisons': livraisons, 'archive': 0, \
+                     'membres': 0, 'suppressions': False, 'reprise': False})
+    return en_cours
+
+
+# Itérer sur les membres d’une archive à extraire en notant l’avancement dans
+# le journal d’installation
+# 
+# Les membres déjà extraits d’après le journal sont sautés. Un point de
+# reprise est écrit tous les intervalle_journal membres, avant de donner le
+# membre suivant : les membres comptés sont alors tous extraits, et les
+# fichiers extraits depuis le point de reprise précédent sont d’abord écrits
+# sur le disque (voir synchroniser_fichiers), comme ceux extraits depuis le
+# dernier point à la fin de l’archive.
+# 
+# @param tarfile.TarFile tar archive ouverte
+# @param str dossier dossier où les membres sont extraits
+# @param str dossier_base dossier de la base juridique
+# @param int archive indice de l’archive dans l’installation en cours
+# @param int deja nombre de membres déjà extraits
+# @param callable retenir fonction indiquant si un membre (TarInfo) est à
+#                         extraire
+# @return generator[tarfile.TarInfo]
+def membres_journalises(tar, dossier, dossier_base, archive, deja, retenir):
+    
+    n = 0
+    extraits = []
+    for membre in membres_archive(tar):
+        if n > deja and n % intervalle_journal == 0:
+            synchroniser_fichiers(extraits)
+            extraits = []
+            ecrire_journal(dossier_base, {'archive': archive, 'membres': n})
+        n += 1
+        if n > deja and retenir(membre):
+            if membre.isfile():
+                extraits.append(os.path.join(dossier, membre.name))
+            yield membre
+    synchroniser_fichiers(extraits)
+
+
+# Écrire sur le disque des fichiers et leurs dossiers (fsync)
+# 
+# Les dossiers sont aussi synchronisés pour que les créations et renommages
+# de fichiers soient durables ; les systèmes ne permettant pas d’ouvrir un
+# dossier (Windows) ne synchronisent que les fichiers.
+# 
+# @param list[str] chemins fichiers, les absents sont ignorés
+# @return None
+def synchroniser_fichiers(chemins):
+    
+    dossiers = set()
+    for chemin in chemins:
+        if not os.path.isfile(chemin):
+            continue
+        fd = os.open(chemin, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        dossiers.add(os.path.dirname(chemin))
+    
+    for dossier in dossiers:
+        try:
+            fd = os.open(dossier, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
             pass
-    dates = sorted(dates)
+        finally:
+            os.close(fd)
+
+
+# Lire le manifeste des livraisons d’une base
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str dossier dossier des fichiers téléchargés
+# @return dict manifeste, vide s’il n’existe pas encore
+def lire_manifeste(base, dossier='.'):
+    
+    chemin = os.path.join(dossier, re.sub(r'BASE', base.lower(), \
+                                          fichier_manifeste))
+    if not os.path.exists(chemin):
+        return {}
+    
+    with open(chemin, 'r') as fd:
+        return json.load(fd)
+
+
+# Enregistrer le manifeste des livraisons d’une base
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str dossier dossier des fichiers téléchargés
+# @param dict manifeste
+# @return None
+# @raise IOError
+def ecrire_manifeste(base, dossier, manifeste):
+    
+    chemin = os.path.join(dossier, re.sub(r'BASE', base.lower(), \
+                                          fichier_manifeste))
+    with open(chemin + '.part', 'w') as fd:
+        json.dump(manifeste, fd, indent=1, sort_keys=True)
+    os.rename(chemin + '.part', chemin)
+
+
+# Lister les livraisons présentes sur le serveur mais absentes ou incomplètes
+# en local, d’après le manifeste
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str dossier dossier des fichiers téléchargés
+# @return list[datetime] dates des livraisons manquantes
+def livraisons_manquantes(base, dossier='.'):
+    
+    manifeste = lire_manifeste(base, dossier)
+    
+    dates = []
+    for cle, entree in manifeste.items():
+        if not entree['distant']:
+            continue
+        if entree['local'] and entree['taille_locale'] is not None \
+         and entree['taille_distante'] in (None, entree['taille_locale']):
+            continue
+        dates.append(datetime.strptime(cle, '%Y%m%d-%H%M%S'))
+    
+    return sorted(dates)
+
+
+# Inscrire dans le manifeste les archives du dossier qu’il ne connaît pas
+# 
+# cache_disponible ne lit le contenu du dossier que s’il n’y a pas encore de
+# manifeste : les archives copiées à la main dans un dossier qui en a déjà
+# un, ou celles dont le manifeste ne connaît pas encore le nom local, n’y sont
+# retrouvées qu’après cette fonction. Les entrées dont le nom et la taille en
+# local sont déjà connus ne sont pas modifiées ; une archive seulement
+# présente en copie transcodée est inscrite sous le nom de l’archive TAR
+# gzippée, sans taille locale.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param str dossier dossier des fichiers téléchargés
+# @param str nom_base format des noms de fichiers de base
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @param str nom_majo format des noms de fichiers de mise à jour
+#                     (chaînes '%s' pour les variables de temps (cf datetime),
+#                     'BASE' pour le nom de la base XML)
+# @return dict manifeste, enregistré s’il a été complété
+# @raise IOError
+def reconcilier_manifeste(base, dossier='.',
+                          nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                          nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+    
+    manifeste = lire_manifeste(base, dossier)
+    nom_base = re.sub(r'BASE', base, nom_base)
+    nom_majo = re.sub(r'BASE', base, nom_majo)
+    formats = [(nom_base, 'fond', nom_base), (nom_majo, 'majo', nom_majo)]
+    if zstandard:
+        formats += [(nom_transcode(nom_base), 'fond', nom_base), \
+                    (nom_transcode(nom_majo), 'majo', nom_majo)]
+    
+    complete = False
+    for fichier in os.listdir(dossier):
+        for nom, nature, nom_local in formats:
+            try:
+                date = datetime.strptime(fichier, nom)
+            except ValueError:
+                continue
+            
+            entree = manifeste.setdefault(date.strftime('%Y%m%d-%H%M%S'), \
+                                          {'type': nature,
+                                           'distant': None,
+                                           'taille_distante': None,
+                                           'local': None,
+                                           'taille_locale': None,
+                                           'sha256': None})
+            local = date.strftime(nom_local)
+            if entree['local'] not in (None, local):
+                continue
+            if entree['local'] is None:
+                entree['local'] = local
+                complete = True
+            if fichier == local and entree['taille_locale'] is None:
+                entree['taille_locale'] = \
+                    os.path.getsize(os.path.join(dossier, fichier))
+                complete = True
+    
+    if complete:
+        ecrire_manifeste(base, dossier, manifeste)
+    
+    return manifeste
+
+
+def cache_disponible(base, cache='.', livraison=-1,
+                     nom_base='BASE-base-%Y%m%d-%H%M%S.tar.gz',
+                     nom_majo='BASE-majo-%Y%m%d-%H%M%S.tar.gz'):
+    
+    # Vérification des paramètres
+    if base not in bases:
+        raise NomBaseError()
+    if not isinstance(cache, (str, unicode)): raise ValueError()
+    if isinstance(livraison, (str, unicode)):
+        livraison = datetime.strptime(livraison, '%Y%m%d-%H%M%S')
+    if not isinstance(livraison, (datetime, int)): raise ValueError()
+    if not isinstance(nom_base, (str, unicode)): raise ValueError()
+    if not isinstance(nom_majo, (str, unicode)): raise ValueError()
+    
+    # Transformations de base
+    nom_base = re.sub(r'BASE', base, nom_base)
+    nom_majo = re.sub(r'BASE', base, nom_majo)
+    
+    # Obtenir la liste des fichiers en cache d’après le manifeste, créé
+    # d’après le contenu du dossier s’il n’existe pas encore (voir
+    # reconcilier_manifeste) ; les archives partielles ou d’une autre taille
+    # que celle du serveur sont écartées
+    manifeste = lire_manifeste(base, cache)
+    if not manifeste:
+        manifeste = reconcilier_manifeste(base, cache, nom_base, nom_majo)
+    dates = []
+    for cle, entree in manifeste.items():
+        date = datetime.strptime(cle, '%Y%m%d-%H%M%S')
+        nature = 0 if entree['type'] == 'fond' else 1
+        chemin = os.path.join(cache, \
+                              date.strftime((nom_base, nom_majo)[nature]))
+        if entree['local'] != os.path.basename(chemin):
+            continue
+        if os.path.exists(chemin):
+            if entree['taille_locale'] is None \
+             or entree['taille_distante'] not in (None, entree['taille_locale']):
+                continue
+        elif not copie_transcodee(chemin):
+            continue
+        dates.append((date, nature))
+    dates = sorted(set(dates))
     
     # Retirer les livraisons trop récentes
     if len(dates) == 0:
@@ -654,27 +2133,6 @@ def telecharger_legifrance(url, fichier, cache_html, force=False):
                              os.path.join(cache_html, fichier), force)
 
 
-# Télécharger un fichier avec cache possible
-def telecharger_cache(url, fichier, force=False):
-    
-    if os.path.exists(fichier):
-        touch = datetime.fromtimestamp(os.stat(fichier).st_mtime)
-        delta = datetime.today() - touch
-        
-        if not force or not isinstance(force, bool) and isinstance(force, (int, long, float)) and delta.total_seconds() < force:
-            print('* Téléchargement de ' + url + ' (cache)')
-            return True
-    
-    print('* Téléchargement de ' + url)
-    return telecharger(url, fichier)
-
-
-# Télécharger un fichier
-def telecharger(url, fichier):
-    
-    subprocess.call(['wget', '--output-document=' + fichier, url])
-
-
 # Télécharger un fichier sur un serveur FTP, avec cache possible
 # 
 # @param ftplib.FTP connexion objet FTP initialisé correctement
@@ -682,15 +2140,25 @@ def telecharger(url, fichier):
 # @param str fichier_orig nom du fichier sur le serveur
 # @param str fichier_dest nom du fichier à enregistrer localement
 # @param bool|int|long|float force utilisation du cache
-# @return None
-# @raise IOError
+# @param int tentatives nombre maximal de tentatives de téléchargement
+# @param int|float attente attente en secondes avant la deuxième tentative,
+#                          doublée à chaque nouvel échec
+# @param tuple|None identifiants (hôte, port, utilisateur, mot de passe) pour
+#                               rouvrir la connexion après un échec
+# @return (int, str)|None taille et condensat SHA-256 du fichier téléchargé,
+#                         None si le fichier en cache a été conservé
+# @raise IOError, ftplib.Error
 # 
 # Si force == False : ne jamais re-télécharger un fichier déjà présent
 # Si force == True : toujours télécharger le fichier, même si déjà présent
 # Si force est un nombre : re-télécharger le fichier s’il est plus ancien (en
 #                          secondes) que l’entier donné
+# 
+# Un téléchargement interrompu reprend là où il s’était arrêté (voir
+# telecharger_ftp) ; les erreurs permanentes (5xx) ne sont pas retentées.
 def telecharger_ftp_cache(connexion, repertoire, fichier_orig, fichier_dest,
-                          force=False):
+                          force=False, tentatives=5, attente=2,
+                          identifiants=None):
     
     if os.path.exists(fichier_dest):
         touch = datetime.fromtimestamp(os.stat(fichier_dest).st_mtime)
@@ -702,22 +2170,137 @@ def telecharger_ftp_cache(connexion, repertoire, fichier_orig, fichier_dest,
          and delta.total_seconds() < force:
             return
     
-    telecharger_ftp(connexion, repertoire, fichier_orig, fichier_dest)
+    for tentative in range(tentatives):
+        try:
+            # Rouvrir la connexion, probablement coupée lors de l’échec
+            if tentative and identifiants:
+                connexion.close()
+                connexion.connect(identifiants[0], identifiants[1])
+                connexion.login(identifiants[2], identifiants[3])
+            
+            return telecharger_ftp(connexion, repertoire, fichier_orig, \
+                                   fichier_dest)
+        
+        except ftplib.error_perm:
+            raise
+        except ftplib.all_errors:
+            if tentative + 1 == tentatives:
+                raise
+            time.sleep(attente * 2 ** tentative)
 
 
 # Télécharger un fichier sur un serveur FTP
 # 
+# Le fichier est écrit dans « fichier_dest.part » puis renommé à la fin du
+# transfert. Si un fichier partiel existe déjà, le transfert reprend à partir
+# de sa taille (commande REST) ; si le serveur refuse la reprise, le fichier
+# est re-téléchargé depuis le début. Le condensat SHA-256 est calculé au fil
+# du transfert.
+# 
 # @param ftplib.FTP connexion objet FTP initialisé correctement
 # @param str repertoire répertoire sur le serveur
 # @param str fichier_orig nom du fichier sur le serveur
 # @param str fichier_dest nom du fichier à enregistrer localement
-# @param bool|int|long|float force utilisation du cache
-# @return None
-# @raise IOError
+# @return (int, str) taille et condensat SHA-256 du fichier téléchargé
+# @raise IOError, ftplib.Error
 def telecharger_ftp(connexion, repertoire, fichier_orig, fichier_dest):
     
+    fichier_part = fichier_dest + '.part'
+    reprise = 0
+    if os.path.exists(fichier_part):
+        reprise = os.path.getsize(fichier_part)
+    
+    # Reprendre le condensat sur la partie déjà téléchargée
+    condensat = hashlib.sha256()
+    if reprise:
+        with open(fichier_part, 'rb') as fd:
+            for bloc in iter(lambda: fd.read(1048576), b''):
+                condensat.update(bloc)
+    
+    def ecrire(fd, condensat):
+        def ecrire_bloc(bloc):
+            fd.write(bloc)
+            condensat.update(bloc)
+        return ecrire_bloc
+    
     connexion.cwd(repertoire)
-    connexion.retrbinary('RETR ' + fichier_orig, \
-                         open(fichier_dest + '.part', 'wb').write)
-    os.rename(fichier_dest + '.part', fichier_dest)
+    try:
+        with open(fichier_part, 'ab' if reprise else 'wb') as fd:
+            connexion.retrbinary('RETR ' + fichier_orig, \
+                                 ecrire(fd, condensat), rest=reprise or None)
+    except ftplib.error_perm as e:
+        # 500-504 : REST non reconnu ; 554 : point de reprise invalide
+        if not reprise or not re.match(r'50[0-4]|554', str(e)):
+            raise
+        condensat = hashlib.sha256()
+        with open(fichier_part, 'wb') as fd:
+            connexion.retrbinary('RETR ' + fichier_orig, ecrire(fd, condensat))
+    
+    taille = os.path.getsize(fichier_part)
+    os.rename(fichier_part, fichier_dest)
+    
+    return taille, condensat.hexdigest()
+
 
+# Télécharger des fichiers d’une base juridique sur plusieurs connexions FTP
+# simultanées
+# 
+# Chaque fil d’exécution ouvre sa propre connexion au premier fichier qu’il
+# traite et la réutilise pour les fichiers suivants, puis la ferme dès qu’il
+# ne reste plus de fichier ; les fichiers sont distribués un par un dans
+# l’ordre de la liste, donc le dump complet (le plus gros) part en premier.
+# 
+# @param str base dans ('JORF', 'JORFSIMPLE', 'LEGI', 'KALI', 'CNIL',
+#                       'CONSTIT', 'CIRCULAIRES')
+# @param list[(str, str, str)] fichiers triplets (date de la livraison, nom sur
+#                                       le serveur, nom local)
+# @param int connexions nombre maximal de connexions simultanées
+# @param callable|None rappel fonction appelée avec le triplet et le résultat
+#                             de telecharger_ftp après chaque téléchargement
+# @param threading.Semaphore|None limite jetons de connexion au serveur
+# @return None
+# @raise ConnexionException, IOError
+def telecharger_ftp_parallele(base, fichiers, connexions, rappel=None,
+                              limite=None):
+    
+    restants = iter(fichiers)
+    verrou = threading.Lock()
+    erreurs = []
+    
+    def telecharger_fichiers():
+        
+        connexion = None
+        try:
+            while True:
+                
+                # Prendre le fichier suivant, sauf si un autre fil a échoué
+                with verrou:
+                    fichier = None if erreurs else next(restants, None)
+                if fichier is None:
+                    break
+                
+                if not connexion:
+                    connexion = connexion_ftp(base, limite)
+                resultat = telecharger_ftp_cache(connexion, \
+                                                 serveurs[base][4], \
+                                                 fichier[1], fichier[2], True, \
+                                                 identifiants=serveurs[base][0:4])
+                if rappel:
+                    rappel(fichier, resultat)
+        
+        except Exception as e:
+            with verrou:
+                erreurs.append(e)
+        finally:
+            if connexion:
+                connexion.close()
+    
+    fils = [threading.Thread(target=telecharger_fichiers) \
+            for i in range(min(connexions, len(fichiers)))]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    
+    if erreurs:
+        raise erreurs[0]
@@ -17,9 +17,16 @@ from __future__ import division
 from __future__ import print_function
 import os
 import re
-import subprocess
+import json
+import socket
 import datetime
-from path import path
+import threading
+try:
+    import httplib
+    from urlparse import urlsplit, urljoin
+except ImportError:
+    import http.client as httplib
+    from urllib.parse import urlsplit, urljoin
 
 MOIS = {
     'janvier': '01',
@@ -39,10 +46,108 @@ MOIS = {
 
 MOIS2 = ['', 'janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
 
+# Connexions HTTP gardées ouvertes entre deux téléchargements, par fil
+# d’exécution et par (schéma, hôte)
+connexions_http = threading.local()
 
+
+# Télécharger un fichier par HTTP(S)
+# 
+# Les en-têtes ETag et Last-Modified de la réponse sont enregistrés dans
+# « fichier.entetes » ; s’ils existent, la requête est conditionnelle et une
+# réponse 304 conserve le fichier existant (dont la date est mise à jour).
+# Le contenu est écrit au fil de l’eau dans « fichier.part » puis renommé.
+# 
+# @param str url
+# @param str fichier
+# @return bool True si le fichier a été téléchargé, False s’il était à jour
+# @raise IOError
 def telecharger(url, fichier):
     
-    subprocess.call(['wget', '--output-document=' + fichier, url])
+    # Validateurs de la version en cache
+    entetes = {'User-Agent': 'loifrancaise', 'Accept-Encoding': 'identity'}
+    validateurs = {}
+    if os.path.exists(fichier) and os.path.exists(fichier + '.entetes'):
+        with open(fichier + '.entetes', 'r') as fd:
+            validateurs = json.load(fd)
+        if validateurs.get('url') == url:
+            if validateurs.get('etag'):
+                entetes['If-None-Match'] = validateurs['etag']
+            if validateurs.get('last-modified'):
+                entetes['If-Modified-Since'] = validateurs['last-modified']
+    
+    # Suivre les redirections
+    adresse = url
+    for redirection in range(6):
+        reponse = requete_http(adresse, entetes)
+        if reponse.status not in (301, 302, 303, 307, 308):
+            break
+        adresse = urljoin(adresse, reponse.getheader('Location'))
+        reponse.read()
+    
+    # Fichier inchangé
+    if reponse.status == 304:
+        reponse.read()
+        os.utime(fichier, None)
+        return False
+    
+    if reponse.status != 200:
+        reponse.read()
+        raise IOError('HTTP {} pour {}'.format(reponse.status, url))
+    
+    # Écrire le fichier au fil de l’eau
+    with open(fichier + '.part', 'wb') as fd:
+        for bloc in iter(lambda: reponse.read(65536), b''):
+            fd.write(bloc)
+    os.rename(fichier + '.part', fichier)
+    
+    # Enregistrer les validateurs
+    with open(fichier + '.entetes', 'w') as fd:
+        json.dump({'url': url,
+                   'etag': reponse.getheader('ETag'),
+                   'last-modified': reponse.getheader('Last-Modified')}, fd)
+    
+    return True
+
+
+# Envoyer une requête GET sur une connexion HTTP gardée ouverte
+# 
+# Si le serveur a fermé la connexion entre deux requêtes, elle est rouverte
+# et la requête envoyée à nouveau.
+# 
+# @param str url
+# @param dict entetes en-têtes de la requête
+# @return httplib.HTTPResponse réponse, dont le corps doit être lu entièrement
+#                              avant la requête suivante
+# @raise IOError
+def requete_http(url, entetes):
+    
+    adresse = urlsplit(url)
+    chemin = adresse.path or '/'
+    if adresse.query:
+        chemin += '?' + adresse.query
+    
+    if not hasattr(connexions_http, 'connexions'):
+        connexions_http.connexions = {}
+    cle = (adresse.scheme, adresse.netloc)
+    
+    for tentative in range(2):
+        if cle not in connexions_http.connexions:
+            if adresse.scheme == 'https':
+                connexion = httplib.HTTPSConnection(adresse.netloc, timeout=60)
+            else:
+                connexion = httplib.HTTPConnection(adresse.netloc, timeout=60)
+            connexions_http.connexions[cle] = connexion
+        connexion = connexions_http.connexions[cle]
+        
+        try:
+            connexion.request('GET', chemin, headers=entetes)
+            return connexion.getresponse()
+        except (httplib.HTTPException, socket.error):
+            connexion.close()
+            del connexions_http.connexions[cle]
+            if tentative:
+                raise IOError('Connexion impossible à ' + url)
 
 
 def telecharger_cache(url, fichier, force=False):
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# 
+# Tests de l’analyse des fichiers XML (loifrancaise.analyses) : lxml et
+# BeautifulSoup doivent donner les mêmes résultats
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from loifrancaise import analyses
+
+# Contenus d’exemple, avec commentaires, sections CDATA, entités et éléments
+# vides
+VERSION = '''<?xml version="1.0" encoding="UTF-8"?>
+<TEXTE_VERSION>
+<META>
+<META_COMMUN>
+<ID>LEGITEXT000006070721</ID>
+<!-- nature du texte -->
+<NATURE>CODE</NATURE>
+</META_COMMUN>
+<META_SPEC>
+<META_TEXTE_CHRONICLE>
+<CID>LEGITEXT000006070721</CID>
+<NOR/>
+<DATE_TEXTE>1804-03-21</DATE_TEXTE>
+<DATE_PUBLI>2999-01-01</DATE_PUBLI>
+<DERNIERE_MODIFICATION>2016-10-01</DERNIERE_MODIFICATION>
+</META_TEXTE_CHRONICLE>
+<META_TEXTE_VERSION>
+<TITRE>Code civil &amp; annexes</TITRE>
+<TITREFULL><![CDATA[Code <civil>]]> &#233;dition <!-- sic --> 1804</TITREFULL>
+<DATE_DEBUT>2016-10-01</DATE_DEBUT>
+<DATE_FIN>2999-01-01</DATE_FIN>
+<ETAT></ETAT>
+</META_TEXTE_VERSION>
+</META_SPEC>
+</META>
+</TEXTE_VERSION>
+'''.encode('utf-8')
+
+STRUCT = '''<?xml version="1.0" encoding="UTF-8"?>
+<TEXTELR>
+<META>
+<META_COMMUN>
+<NATURE>CODE</NATURE>
+</META_COMMUN>
+<META_SPEC>
+<META_TEXTE_CHRONICLE>
+<CID>LEGITEXT000006070721</CID>
+<NOR></NOR>
+<DATE_TEXTE>1804-03-21</DATE_TEXTE>
+<DATE_PUBLI>2999-01-01</DATE_PUBLI>
+</META_TEXTE_CHRONICLE>
+</META_SPEC>
+</META>
+<VERSIONS>
+<!-- versions du texte -->
+<VERSION etat="VIGUEUR">
+<LIEN_TXT debut="2016-10-01" fin="2999-01-01" id="LEGITEXT000006070721"/>
+</VERSION>
+<VERSION etat="MODIFIE">
+<LIEN_TXT debut="1804-03-21" fin="2016-10-01" id="LEGITEXT000006070721"/>
+</VERSION>
+</VERSIONS>
+<STRUCT>
+<LIEN_ART debut="1804-03-21" etat="VIGUEUR" fin="2999-01-01" id="LEGIARTI000006419280" num="1er" origine="LEGI"/>
+<LIEN_SECTION_TA cid="LEGISCTA000006089696" debut="1804-03-21" etat="VIGUEUR" fin="2999-01-01" id="LEGISCTA000006089696" niv="1" url="/LEGI/SCTA/00/00/06/08/96/LEGISCTA000006089696.xml">Titre pr&#233;liminaire : <![CDATA[De la publication]]><!-- , des effets --> &amp; de l'application des lois</LIEN_SECTION_TA>
+<LIEN_SECTION_TA cid="LEGISCTA000006089697" debut="1804-03-21" etat="VIGUEUR" fin="2999-01-01" id="LEGISCTA000006089697" niv="1" url="/LEGI/SCTA/00/00/06/08/96/LEGISCTA000006089697.xml"></LIEN_SECTION_TA>
+</STRUCT>
+</TEXTELR>
+'''.encode('utf-8')
+
+SECTION_TA = '''<?xml version="1.0" encoding="UTF-8"?>
+<SECTION_TA>
+<ID>LEGISCTA000006089696</ID>
+<TITRE_TA>Titre préliminaire</TITRE_TA>
+<STRUCTURE_TA>
+<!-- articles de la section -->
+<LIEN_ART debut="1804-03-21" etat="VIGUEUR" fin="2999-01-01" id="LEGIARTI000006419281" num="2" origine="LEGI"/>
+<LIEN_ART debut="1804-03-21" etat="ABROGE" fin="2016-10-01" id="LEGIARTI000006419282" num="3" origine="LEGI"><!-- abrogé --></LIEN_ART>
+<LIEN_SECTION_TA cid="LEGISCTA000006089698" debut="1804-03-21" etat="VIGUEUR" fin="2999-01-01" id="LEGISCTA000006089698" niv="2" url="/LEGI/SCTA/00/00/06/08/96/LEGISCTA000006089698.xml">Chapitre &#xC9;&lt;1&gt;</LIEN_SECTION_TA>
+</STRUCTURE_TA>
+</SECTION_TA>
+'''.encode('utf-8')
+
+
+# Résultat d’une analyse rendu comparable : les liens (Lien) deviennent des
+# couples (attributs, texte), puisque l’égalité de dict ignore leur texte
+# 
+# Sous Python 2, lxml renvoie des str pour les textes et attributs ASCII et
+# BeautifulSoup des unicode ; ils sont égaux mais tous convertis ici en
+# unicode pour que les deux résultats soient aussi du même type.
+def normaliser(valeur):
+    
+    if isinstance(valeur, analyses.Lien):
+        return ('Lien', normaliser(dict(valeur)), normaliser(valeur.text))
+    if isinstance(valeur, dict):
+        return dict([(normaliser(cle), normaliser(val)) \
+                     for cle, val in valeur.items()])
+    if isinstance(valeur, list):
+        return [normaliser(val) for val in valeur]
+    if isinstance(valeur, bytes):
+        return valeur.decode('ascii')
+    
+    return valeur
+
+
+@unittest.skipIf(analyses.etree is None, 'lxml indisponible')
+class TestAnalyseXML(unittest.TestCase):
+    
+    def comparer(self, resultat_lxml, resultat_bs4):
+        
+        attendu = normaliser(resultat_bs4)
+        obtenu = normaliser(resultat_lxml)
+        self.assertEqual(obtenu, attendu)
+    
+    def test_version(self):
+        
+        self.comparer(analyses.analyser_version(VERSION), \
+                      analyses.analyser_version_bs4(VERSION))
+    
+    def test_struct(self):
+        
+        self.comparer(analyses.analyser_struct(STRUCT), \
+                      analyses.analyser_struct_bs4(STRUCT))
+    
+    def test_section_ta(self):
+        
+        self.comparer(analyses.analyser_section_ta(SECTION_TA), \
+                      analyses.analyser_section_ta_bs4(SECTION_TA))
+    
+    # Chaque lien est bien un Lien, avec son texte
+    def test_liens(self):
+        
+        struct = analyses.analyser_struct(STRUCT)
+        self.assertTrue(all([isinstance(lien, analyses.Lien) \
+                             for lien in struct['LIEN_SECTION_TA']]))
+        self.assertEqual(struct['LIEN_SECTION_TA'][0].text, \
+                         analyses.analyser_struct_bs4(STRUCT) \
+                         ['LIEN_SECTION_TA'][0].text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# 
+# Tests des sources de fichiers (loifrancaise.stockage)
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from loifrancaise import FichierNonExistantException
+from loifrancaise.stockage import Memoire
+from loifrancaise.stockage import Repertoire
+
+
+class TestMemoire(unittest.TestCase):
+    
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        for nom in ('a', 'b'):
+            with open(os.path.join(self.dossier, nom), 'wb') as fichier:
+                fichier.write(b'old')
+        self.fond = Repertoire(self.dossier)
+    
+    def tearDown(self):
+        shutil.rmtree(self.dossier)
+    
+    # Fichier supprimé par une livraison puis réécrit par la suivante
+    def test_suppression_puis_ajout(self):
+        
+        m1 = Memoire({}, self.fond, ['b'])
+        self.assertFalse(m1.existe('b'))
+        
+        m2 = Memoire({'b': b'new'}, m1)
+        self.assertEqual(m2.lire('b'), b'new')
+        self.assertEqual(m2.lire('a'), b'old')
+        
+        m3 = Memoire({}, m2)
+        self.assertEqual(m3.lire('b'), b'new')
+    
+    # Fichier livré et supprimé dans la même livraison : les suppressions
+    # s’appliquent après l’extraction
+    def test_ajout_et_suppression(self):
+        
+        m1 = Memoire({'b': b'new'}, self.fond, ['b'])
+        self.assertFalse(m1.existe('b'))
+        self.assertRaises(FichierNonExistantException, m1.lire, 'b')
+        
+        m2 = Memoire({'c': b'c'}, m1)
+        self.assertFalse(m2.existe('b'))
+        self.assertRaises(FichierNonExistantException, m2.lire, 'b')
+        self.assertEqual(m2.lire('a'), b'old')
+    
+    # Suppression d’un fichier d’une livraison en mémoire précédente
+    def test_suppression_fusionnee(self):
+        
+        m1 = Memoire({'c': b'c'}, self.fond)
+        m2 = Memoire({}, m1, ['c', 'a'])
+        self.assertFalse(m2.existe('c'))
+        self.assertFalse(m2.existe('a'))
+        self.assertEqual(m2.lire('b'), b'old')
+        self.assertTrue(m2.parent is self.fond)
+
+
+if __name__ == '__main__':
+    unittest.main()
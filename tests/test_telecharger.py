@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# 
+# Tests des téléchargements FTP (loifrancaise.telecharger)
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import unittest
+
+try:
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.filesystems import AbstractedFS
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import FTPServer
+except ImportError:
+    FTPServer = None
+
+from loifrancaise.telecharger import ConnexionFTP
+from loifrancaise.telecharger import telecharger_ftp_cache
+
+
+# Fichier servi qui coupe le transfert une fois, après coupure octets envoyés
+class FichierCoupe(object):
+    
+    coupure = None
+    
+    def __init__(self, fichier):
+        self.fichier = fichier
+        self.name = fichier.name
+        self.closed = False
+        self.envoyes = 0
+    
+    def read(self, taille):
+        if FichierCoupe.coupure is not None \
+         and self.envoyes >= FichierCoupe.coupure:
+            FichierCoupe.coupure = None
+            raise IOError('coupure')
+        bloc = self.fichier.read(min(taille, 8192))
+        self.envoyes += len(bloc)
+        return bloc
+    
+    def seek(self, *args):
+        return self.fichier.seek(*args)
+    
+    def tell(self):
+        return self.fichier.tell()
+    
+    def close(self):
+        self.closed = True
+        self.fichier.close()
+
+
+if FTPServer is not None:
+    
+    class SystemeCoupe(AbstractedFS):
+        
+        def open(self, filename, mode):
+            return FichierCoupe(AbstractedFS.open(self, filename, mode))
+    
+    class Serveur(FTPHandler):
+        
+        abstracted_fs = SystemeCoupe
+        use_sendfile = False
+        reprises = []
+        
+        def ftp_REST(self, line):
+            Serveur.reprises.append(int(line))
+            return FTPHandler.ftp_REST(self, line)
+
+
+@unittest.skipIf(FTPServer is None, 'pyftpdlib indisponible')
+class TestTelechargerFTP(unittest.TestCase):
+    
+    def setUp(self):
+        
+        logging.getLogger('pyftpdlib').setLevel(logging.CRITICAL)
+        self.dossier = tempfile.mkdtemp()
+        self.distant = os.path.join(self.dossier, 'distant')
+        os.mkdir(self.distant)
+        self.contenu = os.urandom(600000)
+        with open(os.path.join(self.distant, 'archive.tar.gz'), 'wb') as fd:
+            fd.write(self.contenu)
+        
+        autorisations = DummyAuthorizer()
+        autorisations.add_user('legi', 'open1234', self.distant, perm='elr')
+        Serveur.authorizer = autorisations
+        Serveur.reprises = []
+        self.serveur = FTPServer(('127.0.0.1', 0), Serveur)
+        self.identifiants = ('127.0.0.1', self.serveur.address[1], \
+                             'legi', 'open1234')
+        self.fil = threading.Thread(target=self.serveur.serve_forever, \
+                                    kwargs={'timeout': 0.1, \
+                                            'handle_exit': False})
+        self.fil.start()
+        
+        self.connexion = ConnexionFTP()
+        self.connexion.connect(self.identifiants[0], self.identifiants[1])
+        self.connexion.login(self.identifiants[2], self.identifiants[3])
+    
+    def tearDown(self):
+        FichierCoupe.coupure = None
+        self.connexion.close()
+        self.serveur.close_all()
+        self.fil.join()
+        shutil.rmtree(self.dossier)
+    
+    # Transfert coupé puis repris (REST) : fichier identique à l’original
+    def test_reprise(self):
+        
+        FichierCoupe.coupure = 200000
+        local = os.path.join(self.dossier, 'archive.tar.gz')
+        
+        taille, condensat = telecharger_ftp_cache(self.connexion, '/', \
+                                'archive.tar.gz', local, True, attente=0.1, \
+                                identifiants=self.identifiants)
+        
+        self.assertEqual(len(Serveur.reprises), 1)
+        self.assertTrue(0 < Serveur.reprises[0] < len(self.contenu))
+        with open(local, 'rb') as fd:
+            self.assertEqual(fd.read(), self.contenu)
+        self.assertFalse(os.path.exists(local + '.part'))
+        self.assertEqual(taille, len(self.contenu))
+        self.assertEqual(condensat, hashlib.sha256(self.contenu).hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
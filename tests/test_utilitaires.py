@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# 
+# Tests des téléchargements HTTP conditionnels (loifrancaise.utilitaires)
+
+# Imports
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+from loifrancaise.utilitaires import connexions_http
+from loifrancaise.utilitaires import telecharger
+
+
+# Serveur d’un seul fichier, de contenu et ETag modifiables, qui note les
+# requêtes reçues et les connexions ouvertes
+class Requetes(BaseHTTPRequestHandler):
+    
+    protocol_version = 'HTTP/1.1'
+    contenu = b''
+    etag = ''
+    requetes = []
+    connexions = 0
+    
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        Requetes.connexions += 1
+    
+    def do_GET(self):
+        condition = self.headers.get('If-None-Match')
+        Requetes.requetes.append(condition)
+        if condition == Requetes.etag:
+            self.send_response(304)
+            self.send_header('ETag', Requetes.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', Requetes.etag)
+        self.send_header('Content-Length', str(len(Requetes.contenu)))
+        self.end_headers()
+        self.wfile.write(Requetes.contenu)
+    
+    def log_message(self, *args):
+        pass
+
+
+class Serveur(ThreadingMixIn, HTTPServer):
+    
+    daemon_threads = True
+
+
+class TestTelecharger(unittest.TestCase):
+    
+    def setUp(self):
+        
+        self.dossier = tempfile.mkdtemp()
+        self.fichier = os.path.join(self.dossier, 'index.html')
+        Requetes.contenu = b'version 1'
+        Requetes.etag = '"v1"'
+        Requetes.requetes = []
+        Requetes.connexions = 0
+        
+        self.serveur = Serveur(('127.0.0.1', 0), Requetes)
+        self.url = 'http://127.0.0.1:%d/index.html' % self.serveur.server_port
+        self.fil = threading.Thread(target=self.serveur.serve_forever)
+        self.fil.start()
+    
+    def tearDown(self):
+        for connexion in getattr(connexions_http, 'connexions', {}).values():
+            connexion.close()
+        connexions_http.connexions = {}
+        self.serveur.shutdown()
+        self.serveur.server_close()
+        self.fil.join()
+        shutil.rmtree(self.dossier)
+    
+    def lire(self):
+        with open(self.fichier, 'rb') as fd:
+            return fd.read()
+    
+    # 200, puis 304 d’après les en-têtes enregistrés, sur la même connexion
+    def test_requete_conditionnelle(self):
+        
+        self.assertTrue(telecharger(self.url, self.fichier))
+        self.assertEqual(self.lire(), b'version 1')
+        with open(self.fichier + '.entetes', 'r') as fd:
+            entetes = json.load(fd)
+        self.assertEqual(entetes['url'], self.url)
+        self.assertEqual(entetes['etag'], '"v1"')
+        
+        Requetes.contenu = b'ne doit pas etre lu'
+        self.assertFalse(telecharger(self.url, self.fichier))
+        self.assertEqual(self.lire(), b'version 1')
+        self.assertFalse(os.path.exists(self.fichier + '.part'))
+        
+        self.assertEqual(Requetes.requetes, [None, '"v1"'])
+        self.assertEqual(Requetes.connexions, 1)
+    
+    # En-têtes enregistrés pour une autre adresse : requête non conditionnelle
+    def test_autre_url(self):
+        
+        self.assertTrue(telecharger(self.url, self.fichier))
+        with open(self.fichier + '.entetes', 'w') as fd:
+            json.dump({'url': self.url + '?autre', 'etag': '"v1"', \
+                       'last-modified': None}, fd)
+        
+        Requetes.contenu = b'version 2'
+        self.assertTrue(telecharger(self.url, self.fichier))
+        self.assertEqual(self.lire(), b'version 2')
+        self.assertEqual(Requetes.requetes, [None, None])
+    
+    # ETag enregistré différent de celui du serveur : fichier re-téléchargé
+    def test_etag_change(self):
+        
+        self.assertTrue(telecharger(self.url, self.fichier))
+        
+        Requetes.contenu = b'version 2'
+        Requetes.etag = '"v2"'
+        self.assertTrue(telecharger(self.url, self.fichier))
+        self.assertEqual(self.lire(), b'version 2')
+        with open(self.fichier + '.entetes', 'r') as fd:
+            self.assertEqual(json.load(fd)['etag'], '"v2"')
+        self.assertEqual(Requetes.requetes, [None, '"v1"'])
+
+
+if __name__ == '__main__':
+    unittest.main()